@@ -5,6 +5,7 @@
 
 import os
 import json
+import time
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -12,6 +13,10 @@ from crewai import Agent, Task, Crew
 
 # ETL OFICIAL
 from etl_ilumeo1 import executar_etl   # <<< ATENÇÃO: usa etl_ilumeo1
+from etl_ilumeo1 import EntradaPesquisa
+from etl_ilumeo1 import IndiceBitmap, gerar_tabelas_filtradas, identificar_colunas_simples
+from etl_ilumeo1 import BaseCodificada, SECOES_JSON, carregar_estado_incremental
+from etl_ilumeo1 import PASTA_ONDAS, carregar_insight_onda, salvar_insight_onda
 
 
 # -------------------------------------------------------------------------------------------------------------
@@ -104,7 +109,10 @@ defaults = {
     "t_simples": {},
     "t_multi": {},
     "t_matriz": {},
-    "t_nota": {}
+    "t_nota": {},
+    "base": None,
+    "indice_bitmap": None,
+    "chave_etl": None
 }
 
 for k, v in defaults.items():
@@ -140,6 +148,13 @@ def gerar_insights(json_text):
             "- Oportunidades estratégicas para marketing\n"
             "- Relações ocultas entre respostas\n"
             "- Segmentações implícitas ou grupos naturais\n\n"
+            "Ao comparar grupos (gênero, renda, estado, escolaridade), afirme diferenças SOMENTE quando elas "
+            "estiverem marcadas com ▲/▼ em 'tabelas_cruzadas' (já testadas estatisticamente); fora dessas "
+            "células, trate as variações como não significativas.\n\n"
+            "Para relações ocultas entre respostas, parta dos pares em 'associacoes' (V de Cramér e "
+            "informação mútua já calculados sobre os respondentes), em vez de deduzi-las das frequências.\n\n"
+            "Para segmentações implícitas, descreva os perfis em 'grupos_naturais' (agrupamento dos "
+            "respondentes, com as respostas super-representadas em cada grupo frente ao total).\n\n"
             "Use linguagem clara, humana, estratégica e orientada a marketing.\n\n"
             "JSON:\n"
             f"{json_text}"
@@ -154,6 +169,88 @@ def gerar_insights(json_text):
     return resultado.raw
 
 
+# -------------------------------------------------------------------------------------------------------------
+# IA — INSIGHTS POR BLOCO (PESQUISA EM CAMPO)
+# -------------------------------------------------------------------------------------------------------------
+TITULOS_SECOES = {
+    "perguntas_simples": "Perguntas Simples",
+    "multirresposta": "Multirresposta",
+    "matriz_texto": "Matriz (Texto)",
+    "matriz_nota": "Matriz (Nota)",
+}
+
+
+def gerar_insights_incrementais(json_text, caminho_cache, secoes_alteradas):
+
+    cache = {}
+    if os.path.exists(caminho_cache):
+        with open(caminho_cache, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+    dados = json.loads(json_text)
+
+    for secao in SECOES_JSON:
+        if not dados.get(secao):
+            continue
+        if secao in secoes_alteradas or secao not in cache:
+            bloco = json.dumps({secao: dados[secao]}, ensure_ascii=False, indent=2)
+            cache[secao] = gerar_insights(bloco)
+
+    with open(caminho_cache, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+    return "\n\n".join(
+        f"## {TITULOS_SECOES[secao]}\n\n{cache[secao]}"
+        for secao in SECOES_JSON if secao in cache
+    )
+
+
+# -------------------------------------------------------------------------------------------------------------
+# IA — INSIGHTS POR VARIAÇÃO ENTRE ONDAS (TRACKERS)
+# -------------------------------------------------------------------------------------------------------------
+def gerar_insights_por_variacao(tendencias, insight_anterior):
+
+    variacoes = tendencias["variacoes_significativas"]
+    if not variacoes:
+        # nada mudou além do ruído amostral: o insight da onda anterior continua valendo
+        return (
+            f"_Sem variações significativas frente à onda '{tendencias['onda_anterior']}'; "
+            f"insight mantido._\n\n{insight_anterior}"
+        )
+
+    agente = Agent(
+        role="Analista de Mercado e Inteligência Competitiva Sênior",
+        goal="Atualizar a análise de uma pesquisa recorrente a partir do que mudou entre as ondas.",
+        backstory=(
+            "Especialista em comportamento do consumidor, estudos de tracking "
+            "e estatística de pesquisa."
+        )
+    )
+
+    tarefa = Task(
+        description=(
+            f"Abaixo está o insight da onda '{tendencias['onda_anterior']}' e a lista das variações "
+            f"ESTATISTICAMENTE SIGNIFICATIVAS da onda '{tendencias['onda_atual']}' frente a ela "
+            "(teste z de duas proporções, Benjamini-Hochberg por tabela). Tudo o que não está na lista "
+            "ficou estável.\n\n"
+            "Reescreva o insight para a onda atual: mantenha o que continua válido, atualize os números "
+            "e conclusões afetados pelas variações, destaque as mudanças mais relevantes para marketing "
+            "e não invente variações fora da lista.\n\n"
+            "INSIGHT DA ONDA ANTERIOR:\n"
+            f"{insight_anterior}\n\n"
+            "VARIAÇÕES SIGNIFICATIVAS (pct_anterior → pct_atual, delta em pontos percentuais):\n"
+            f"{json.dumps(variacoes, ensure_ascii=False)}"
+        ),
+        expected_output="Insight completo da onda atual, com as mudanças frente à onda anterior em destaque.",
+        agent=agente,
+    )
+
+    equipe = Crew(agents=[agente], tasks=[tarefa])
+    resultado = equipe.kickoff()
+
+    return resultado.raw
+
+
 # -------------------------------------------------------------------------------------------------------------
 # IA — CONTEÚDOS MULTICANAIS
 # -------------------------------------------------------------------------------------------------------------
@@ -216,10 +313,89 @@ def gerar_conteudos_multicanais(insights):
 def sidebar():
 
     st.image("logo.png", width=170)
-    st.markdown("### 📂 Enviar arquivo Excel")
-    st.markdown("Envie uma planilha **.xlsx** para iniciar a análise completa.")
+    st.markdown("### 📂 Enviar arquivo da pesquisa")
+    st.markdown(
+        "Envie a base em **.xlsx**, **.xls**, **.csv**, **.parquet** ou **.sav** (SPSS) para iniciar a análise "
+        "completa. Excel antigo (.xls), Parquet e SPSS precisam dos pacotes opcionais xlrd, pyarrow e pyreadstat."
+    )
+
+    arquivo = st.file_uploader("Upload", type=["xlsx", "xls", "csv", "parquet", "sav"])
+
+    incremental = st.checkbox(
+        "📡 Estudo em campo (processar só respondentes novos)",
+        help="Reaproveita as contagens das exportações anteriores do mesmo estudo."
+    )
+    estudo = None
+    if incremental:
+        padrao = os.path.splitext(arquivo.name)[0] if arquivo else ""
+        estudo = st.text_input("Identificador do estudo", value=padrao) or None
+
+    ondas = st.checkbox(
+        "🌊 Uma aba por onda/país",
+        help="Lê todas as abas da planilha e gera tabelas por onda e do total.",
+        disabled=incremental
+    )
+
+    checkpoints = st.checkbox(
+        "♻️ Reaproveitar etapas já processadas",
+        help="Guarda cada etapa do ETL em disco e pula as que não mudaram ao reenviar o mesmo arquivo.",
+        disabled=incremental
+    )
+
+    armazem = st.checkbox(
+        "🗄️ Gravar no armazém de pesquisas",
+        help="Guarda as tabulações (total e segmentos) no SQLite para consultas entre estudos e ondas."
+    )
+    armazem_respondentes = armazem and st.checkbox(
+        "Incluir respostas por respondente",
+        help="Grava também cada resposta de cada respondente; ocupa bem mais espaço."
+    )
+
+    tendencias = st.checkbox(
+        "📉 Comparar com a onda anterior",
+        help="Guarda as tabulações desta onda e testa as variações frente à onda de rótulo anterior."
+    )
+    if tendencias and not incremental:
+        estudo = st.text_input(
+            "Identificador do estudo", key="estudo_ondas",
+            help="Separa o histórico de ondas de cada estudo. Em branco, compara pelo questionário."
+        ) or None
+
+    onda = None
+    if tendencias or armazem:
+        onda = st.text_input(
+            "Rótulo da onda", value=time.strftime("%Y-%m"),
+            help="Ex.: 2025-05, 2025-Q2, onda 3. A onda anterior é a de rótulo imediatamente menor."
+        ) or None
+
+    opcoes = {
+        "incremental": incremental, "estudo": estudo, "ondas": ondas, "checkpoints": checkpoints and not incremental,
+        "armazem": armazem,
+        "armazem_respondentes": armazem_respondentes, "tendencias": tendencias, "onda": onda,
+    }
+    return arquivo, opcoes
+
+
+# -------------------------------------------------------------------------------------------------------------
+# PAINEL DE FILTROS (ÍNDICE BITMAP)
+# -------------------------------------------------------------------------------------------------------------
+def painel_filtros(base):
 
-    return st.file_uploader("Upload", type=["xlsx"])
+    selecoes = {}
+    if base is None:
+        return selecoes
+
+    st.subheader("🔎 Filtros")
+    with st.expander("Filtrar respondentes (ex.: apenas mulheres em São Paulo)"):
+        with st.form("filtros"):
+            for col in sorted(identificar_colunas_simples(base)):
+                if col not in base.codigos:
+                    continue
+                opcoes = [r for r in base.rotulos_coluna(col) if isinstance(r, str)]
+                selecoes[col] = st.multiselect(col, opcoes, key=f"filtro_{col}")
+            st.form_submit_button("Aplicar filtros")
+
+    return selecoes
 
 
 # -------------------------------------------------------------------------------------------------------------
@@ -228,7 +404,10 @@ def sidebar():
 def main():
 
     with st.sidebar:
-        arquivo = sidebar()
+        arquivo, opcoes = sidebar()
+
+    estudo = opcoes["estudo"]
+    estado_incremental = os.path.join("estado", f"{estudo}.pkl") if opcoes["incremental"] and estudo else None
 
     st.title("📊 ILUMEO — AI Marketing")
 
@@ -239,30 +418,51 @@ def main():
     # ---------------------------------------------------------------------
     if arquivo:
 
-        with st.spinner("🔄 Rodando ETL ILUMEO..."):
-            os.makedirs("temp", exist_ok=True)
-            caminho = os.path.join("temp", arquivo.name)
-
-            with open(caminho, "wb") as f:
-                f.write(arquivo.getbuffer())
-
-            try:
-                df, t_simples, t_multi, t_matriz, t_nota, logs = executar_etl(caminho)
-
-                st.session_state["etl_logs"] = logs
-                st.session_state["t_simples"] = t_simples
-                st.session_state["t_multi"] = t_multi
-                st.session_state["t_matriz"] = t_matriz
-                st.session_state["t_nota"] = t_nota
-
-                with open("resultado_pesquisa.json", "r", encoding="utf-8") as f:
-                    st.session_state["json_etl"] = f.read()
-
-                st.success("ETL concluído! JSON carregado com sucesso.")
-
-            except Exception as e:
-                st.error(f"Erro durante o ETL: {e}")
-                return
+        # o ETL (e o insight) só roda de novo quando muda o arquivo ou as opções;
+        # mexer nos filtros reaproveita o que está no session_state. O hash vem
+        # da própria entrada (sem copiar o upload), que também segue para o ETL
+        entrada = EntradaPesquisa(arquivo)
+        chave_etl = (entrada.hash, tuple(sorted(opcoes.items())))
+
+        if st.session_state["chave_etl"] != chave_etl:
+            with st.spinner("🔄 Rodando ETL ILUMEO..."):
+                try:
+                    base, t_simples, t_multi, t_matriz, t_nota, logs = executar_etl(
+                        entrada, base_codificada=True, estado_incremental=estado_incremental,
+                        segmentos=True, kpis=True, funil=True, associacoes=True,
+                        grupos_naturais=True, termos_texto=True,
+                        mapa_textos=os.path.join("estado", f"{estudo}_mapa_textos.csv") if estudo else True,
+                        checkpoints="checkpoints" if opcoes["checkpoints"] else None, ondas=opcoes["ondas"],
+                        tendencias=opcoes["tendencias"], onda=opcoes["onda"],
+                        armazem=opcoes["armazem"], estudo=estudo,
+                        armazem_respondentes=opcoes["armazem_respondentes"]
+                    )
+
+                    st.session_state["etl_logs"] = logs
+                    st.session_state["t_simples"] = t_simples
+                    st.session_state["t_multi"] = t_multi
+                    st.session_state["t_matriz"] = t_matriz
+                    st.session_state["t_nota"] = t_nota
+                    if isinstance(base, BaseCodificada):
+                        st.session_state["base"] = base
+                        st.session_state["indice_bitmap"] = IndiceBitmap(base)
+                    else:
+                        st.session_state["base"] = None
+                        st.session_state["indice_bitmap"] = None
+
+                    with open("resultado_pesquisa.json", "r", encoding="utf-8") as f:
+                        st.session_state["json_etl"] = f.read()
+
+                    st.session_state["insights"] = ""
+                    st.session_state["conteudos_multicanais"] = ""
+                    st.session_state["chave_etl"] = chave_etl
+
+                    st.success("ETL concluído! JSON carregado com sucesso.")
+
+                except Exception as e:
+                    st.session_state["chave_etl"] = None
+                    st.error(f"Erro durante o ETL: {e}")
+                    return
 
         # ------------------- LOGS -------------------
         st.subheader("📄 Log da Execução do ETL")
@@ -270,38 +470,110 @@ def main():
             for linha in st.session_state["etl_logs"]:
                 st.markdown(f"- {linha}")
 
+        # ------------------- FILTROS -------------------
+        t_simples = st.session_state["t_simples"]
+        t_multi = st.session_state["t_multi"]
+        t_matriz = st.session_state["t_matriz"]
+        t_nota = st.session_state["t_nota"]
+
+        selecoes = painel_filtros(st.session_state["base"])
+        if any(selecoes.values()):
+            indice = st.session_state["indice_bitmap"]
+            filtro = indice.filtrar(selecoes)
+            st.info(f"🔎 Tabelas filtradas: {indice.contar(filtro)} de {indice.n} respondentes.")
+            t_simples, t_multi, t_matriz, t_nota = gerar_tabelas_filtradas(indice, filtro)
+
         # ------------------- TABELAS -------------------
         st.subheader("📊 Tabelas de Frequência")
 
         with st.expander("🟦 Perguntas Simples"):
-            for pergunta, tabela in st.session_state["t_simples"].items():
+            for pergunta, tabela in t_simples.items():
                 st.markdown(f"### {pergunta}")
                 st.dataframe(tabela)
 
         with st.expander("🟧 Multirresposta"):
-            for pergunta, tabela in st.session_state["t_multi"].items():
+            for pergunta, tabela in t_multi.items():
                 st.markdown(f"### {pergunta}")
                 st.dataframe(tabela)
 
         with st.expander("🟩 Matriz (Texto)"):
-            for pergunta, meios in st.session_state["t_matriz"].items():
+            for pergunta, meios in t_matriz.items():
                 st.markdown(f"## {pergunta}")
                 for meio, tabela in meios.items():
                     st.markdown(f"**{meio}**")
                     st.dataframe(tabela)
 
         with st.expander("🟪 Matriz (Nota)"):
-            for pergunta, marcas in st.session_state["t_nota"].items():
+            for pergunta, marcas in t_nota.items():
                 st.markdown(f"## {pergunta}")
                 for marca, tabela in marcas.items():
                     st.markdown(f"**{marca}**")
                     st.dataframe(tabela)
 
+        dados_json = json.loads(st.session_state["json_etl"])
+
+        with st.expander("📈 KPIs das Notas (média, Top 2 Box, NPS)"):
+            for bloco in dados_json.get("kpis_notas", []):
+                st.markdown(f"## {bloco['pergunta']}")
+                st.dataframe(bloco["marcas"])
+
+        cruzadas = dados_json.get("tabelas_cruzadas", {})
+        with st.expander("🧮 Tabelas cruzadas por segmento (▲/▼ = diferença significativa)"):
+            st.markdown(
+                "% de cada grupo; só as tabelas com alguma diferença significativa. Teste z de proporções "
+                "(grupo vs. restante), Benjamini-Hochberg por tabela, α = 5%."
+            )
+            for segmento, perguntas in cruzadas.items():
+                st.markdown(f"## {segmento}")
+                for pergunta, tabela in perguntas.items():
+                    st.markdown(f"**{pergunta}**")
+                    st.dataframe(tabela)
+
+        marcas_json = dados_json.get("marcas", {})
+        with st.expander("🔻 Funil e sobreposição de marcas"):
+            if marcas_json.get("funil"):
+                st.dataframe(marcas_json["funil"])
+            else:
+                st.markdown("Nenhuma etapa de conhecimento, consideração ou compra identificada: sem funil.")
+            for bloco in marcas_json.get("sobreposicao", []):
+                st.markdown(f"## {bloco['pergunta']}")
+                st.dataframe(bloco["marcas"])
+
+        tendencias = dados_json.get("tendencias", {})
+        variacoes = tendencias.get("variacoes_significativas", [])
+        if tendencias.get("onda_anterior"):
+            with st.expander(
+                f"📉 Variações frente à onda '{tendencias['onda_anterior']}' ({len(variacoes)})"
+            ):
+                st.markdown("Teste z de duas proporções, Benjamini-Hochberg por tabela, α = 5%.")
+                st.dataframe(variacoes)
+
         # ---------------------------------------------------------------------
         # GERAR INSIGHT PROFUNDO
         # ---------------------------------------------------------------------
-        with st.spinner("🧠 Analisando dados profundamente e cruzando informações..."):
-            st.session_state["insights"] = gerar_insights(st.session_state["json_etl"])
+        insight_anterior = carregar_insight_onda(
+            PASTA_ONDAS, tendencias.get("questionario"), tendencias.get("onda_anterior"), tendencias.get("estudo")
+        )
+
+        if not st.session_state["insights"]:
+            with st.spinner("🧠 Analisando dados profundamente e cruzando informações..."):
+                if insight_anterior is not None and not estado_incremental:
+                    st.session_state["insights"] = gerar_insights_por_variacao(tendencias, insight_anterior)
+                elif estado_incremental:
+                    estado = carregar_estado_incremental(estado_incremental)
+                    st.session_state["insights"] = gerar_insights_incrementais(
+                        st.session_state["json_etl"],
+                        os.path.join("estado", f"{estudo}_insights.json"),
+                        estado["secoes_alteradas"],
+                    )
+                else:
+                    st.session_state["insights"] = gerar_insights(st.session_state["json_etl"])
+
+            if tendencias.get("questionario"):
+                salvar_insight_onda(
+                    PASTA_ONDAS, tendencias["questionario"], tendencias["onda_atual"], st.session_state["insights"],
+                    tendencias.get("estudo")
+                )
 
         st.subheader("🧠 Insight Profundo da Pesquisa")
         st.markdown(st.session_state["insights"])
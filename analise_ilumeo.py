@@ -0,0 +1,784 @@
+# ============================================================
+#  ILUMEO - ANÁLISES ESTATÍSTICAS SOBRE A BASE CODIFICADA
+#  Cruzamentos, testes e indicadores vetorizados em NumPy
+# ============================================================
+
+import math
+import re
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# 1. SIGNIFICÂNCIA ENTRE SEGMENTOS (TESTE Z DE PROPORÇÕES)
+# ------------------------------------------------------------
+
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def p_valor_normal(z):
+    return _erfc(np.abs(z) / math.sqrt(2))
+
+
+def ajustar_benjamini_hochberg(p):
+    p = np.asarray(p, dtype=float)
+    m = len(p)
+    if not m:
+        return p
+    ordem = np.argsort(p)
+    ajustado = p[ordem] * m / np.arange(1, m + 1)
+    ajustado = np.minimum.accumulate(ajustado[::-1])[::-1]
+    resultado = np.empty(m)
+    resultado[ordem] = np.clip(ajustado, 0, 1)
+    return resultado
+
+
+def _empilhar_respostas(base, colunas, grupos_multi):
+    # Cada resposta de cada pergunta ganha um índice global; a matriz
+    # (respondentes x perguntas) guarda esse índice (-1 = sem resposta).
+    blocos, itens, reportar, inicio_pergunta = [], [], [], []
+    deslocamento = 0
+
+    for col in colunas:
+        codigos = base.codigos[col].astype(np.int64)
+        rotulos = base.rotulos_coluna(col)
+        blocos.append(np.where(codigos >= 0, codigos + deslocamento, -1))
+        inicio_pergunta.append(deslocamento)
+        itens += [(col, r) for r in rotulos]
+        reportar += [True] * len(rotulos)
+        deslocamento += len(rotulos)
+
+    for pergunta, cols in (grupos_multi or {}).items():
+        for col in cols:
+            marca = col.split(" - ")[1].strip()
+            marcou = np.zeros(len(base), dtype=bool)
+            if col in base.codigos:
+                idx = [i for i, v in enumerate(base.rotulos_coluna(col)) if v == marca]
+                if idx:
+                    marcou = base.codigos[col] == idx[0]
+            # multirresposta: base = todos os respondentes (0 = não marcou)
+            blocos.append(np.where(marcou, deslocamento + 1, deslocamento))
+            inicio_pergunta.append(deslocamento)
+            itens += [(pergunta, f"{marca} (não marcou)"), (pergunta, marca)]
+            reportar += [False, True]
+            deslocamento += 2
+
+    matriz = np.stack(blocos, axis=1) if blocos else np.empty((len(base), 0), dtype=np.int64)
+    return matriz, itens, np.array(reportar, dtype=bool), np.array(inicio_pergunta, dtype=np.int64)
+
+
+def testar_significancia(base, colunas_segmento, colunas, grupos_multi=None, pesos=None,
+                         alpha=0.05, min_base=30):
+    n = len(base)
+    w = np.ones(n) if pesos is None else np.asarray(pesos, dtype=float)
+
+    matriz, itens, reportar, inicios = _empilhar_respostas(base, colunas, grupos_multi)
+    n_respostas = len(itens)
+    pergunta_de = np.repeat(np.arange(len(inicios)), np.diff(np.append(inicios, n_respostas)))
+
+    linhas = []
+    for seg in colunas_segmento:
+        s = base.codigos[seg].astype(np.int64)
+        grupos = base.rotulos_coluna(seg)
+        k = len(grupos)
+
+        # uma única passada: índice combinado (resposta, grupo) -> bincount
+        validos = (matriz >= 0) & (s >= 0)[:, None]
+        combinado = (matriz * k + s[:, None])[validos]
+        pesos_validos = np.broadcast_to(w[:, None], matriz.shape)[validos]
+        c = np.bincount(combinado, weights=pesos_validos, minlength=n_respostas * k).reshape(n_respostas, k)
+        c2 = np.bincount(combinado, weights=pesos_validos ** 2, minlength=n_respostas * k).reshape(n_respostas, k)
+
+        # bases por (pergunta, grupo), expandidas para cada resposta
+        b = np.add.reduceat(c, inicios, axis=0)[pergunta_de] if n_respostas else c
+        b2 = np.add.reduceat(c2, inicios, axis=0)[pergunta_de] if n_respostas else c2
+        total, total2 = b.sum(axis=1, keepdims=True), b2.sum(axis=1, keepdims=True)
+        c_total = c.sum(axis=1, keepdims=True)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            n1 = b ** 2 / b2                       # base efetiva (Kish)
+            n2 = (total - b) ** 2 / (total2 - b2)
+            p1 = c / b
+            p2 = (c_total - c) / (total - b)
+            p = c_total / total
+            erro = np.sqrt(p * (1 - p) * (1 / n1 + 1 / n2))
+            z = (p1 - p2) / erro
+
+        valido = (n1 >= min_base) & (n2 >= min_base) & (erro > 0) & reportar[:, None]
+        i, j = np.nonzero(valido)
+        for a, g in zip(i.tolist(), j.tolist()):
+            linhas.append((seg, grupos[g], itens[a][0], itens[a][1], n1[a, g], p1[a, g], p2[a, g], z[a, g]))
+
+    colunas_resultado = ["segmento", "grupo", "pergunta", "resposta", "base_grupo", "pct_grupo", "pct_resto", "z"]
+    resultado = pd.DataFrame(linhas, columns=colunas_resultado)
+    if resultado.empty:
+        for extra in ["diferenca_pp", "p_valor", "p_ajustado", "significativo", "direcao"]:
+            resultado[extra] = []
+        return resultado
+
+    resultado["pct_grupo"] = (resultado["pct_grupo"] * 100).round(1)
+    resultado["pct_resto"] = (resultado["pct_resto"] * 100).round(1)
+    resultado["base_grupo"] = resultado["base_grupo"].round().astype(int)
+    resultado["diferenca_pp"] = (resultado["pct_grupo"] - resultado["pct_resto"]).round(1)
+    resultado["p_valor"] = p_valor_normal(resultado["z"].to_numpy())
+    # correção por família = cada tabela cruzada (segmento x pergunta),
+    # como nos testes de proporção por coluna das tabulações de pesquisa
+    resultado["p_ajustado"] = resultado.groupby(["segmento", "pergunta"], sort=False)["p_valor"].transform(
+        lambda p: ajustar_benjamini_hochberg(p.to_numpy())
+    )
+    resultado["significativo"] = resultado["p_ajustado"] < alpha
+    resultado["direcao"] = np.where(resultado["z"] > 0, "acima", "abaixo")
+    return resultado
+
+
+def tabelas_cruzadas(resultado, apenas_significativas=False):
+    # {segmento: {pergunta: % por grupo com ▲/▼ nas diferenças significativas}}
+    t = {}
+    if resultado.empty:
+        return t
+
+    marca = np.where(
+        resultado["significativo"],
+        np.where(resultado["direcao"] == "acima", " ▲", " ▼"),
+        "",
+    )
+    celulas = resultado.assign(celula=resultado["pct_grupo"].map("{:.1f}".format) + marca)
+
+    for (segmento, pergunta), bloco in celulas.groupby(["segmento", "pergunta"], sort=False):
+        if apenas_significativas and not bloco["significativo"].any():
+            continue
+        tabela = bloco.pivot(index="resposta", columns="grupo", values="celula")
+        tabela = tabela.reindex(index=bloco["resposta"].unique(), columns=bloco["grupo"].unique())
+        t.setdefault(segmento, {})[pergunta] = tabela.fillna("")
+    return t
+
+
+def cruzadas_para_json(t_cruzadas):
+    # {segmento: {pergunta: {grupo: {resposta: "42.0 ▲"}}}}
+    return {
+        segmento: {pergunta: tabela.to_dict() for pergunta, tabela in perguntas.items()}
+        for segmento, perguntas in t_cruzadas.items()
+    }
+
+
+# ------------------------------------------------------------
+# 2. KPIs DAS MATRIZES DE NOTA (MÉDIA, BOXES, NPS)
+# ------------------------------------------------------------
+
+# limites de cada escala de nota; NPS só existe na de 0 a 10
+ESCALAS_NOTA = {
+    "0-10": {"minimo": 0, "maximo": 10, "topo": 9, "fundo": 1, "fundo_nps": 6},
+    "1-5": {"minimo": 1, "maximo": 5, "topo": 4, "fundo": 2, "fundo_nps": None},
+}
+
+
+def escala_nota(matriz):
+    # pela maior nota dada: até 5 é Likert de 1 a 5, acima disso 0 a 10
+    x = np.asarray(matriz, dtype=float)
+    if np.isnan(x).all():
+        return "0-10"
+    return "1-5" if np.nanmax(x) <= 5 else "0-10"
+
+
+def kpis_notas(matriz, pesos=None, topo=9, fundo_nps=6, fundo=1, confianca=0.95, minimo=0, maximo=10):
+    # matriz: respondentes x itens (NaN = sem nota); fundo_nps=None = sem NPS
+    x = np.asarray(matriz, dtype=float)
+    valido = ~np.isnan(x)
+    w = np.ones(x.shape[0]) if pesos is None else np.asarray(pesos, dtype=float)
+    w = np.where(valido, w[:, None], 0.0)
+    xz = np.where(valido, x, 0.0)
+
+    soma_w = w.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n_eff = soma_w ** 2 / (w ** 2).sum(axis=0)
+        media = (w * xz).sum(axis=0) / soma_w
+        variancia = (w * (xz - media) ** 2).sum(axis=0) / soma_w * n_eff / (n_eff - 1)
+        desvio = np.sqrt(variancia)
+
+        p_topo = (w * (xz >= topo)).sum(axis=0) / soma_w
+        p_fundo = (w * (valido & (xz <= fundo))).sum(axis=0) / soma_w
+        if fundo_nps is None:
+            p_detratores = np.full(x.shape[1], np.nan)
+        else:
+            p_detratores = (w * (valido & (xz <= fundo_nps))).sum(axis=0) / soma_w
+        nps = p_topo - p_detratores
+
+        z = NormalDist().inv_cdf(0.5 + confianca / 2)
+        ic_media = z * desvio / np.sqrt(n_eff)
+        ic_topo = z * np.sqrt(p_topo * (1 - p_topo) / n_eff)
+        ic_nps = z * np.sqrt((p_topo + p_detratores - nps ** 2) / n_eff)
+
+    if valido.any():
+        with np.errstate(all="ignore"):
+            mediana = np.nanmedian(np.where(valido, x, np.nan), axis=0)
+    else:
+        mediana = np.full(x.shape[1], np.nan)
+
+    return pd.DataFrame({
+        "Base": soma_w.round().astype(int),
+        "Média": media.round(2),
+        "IC Média (±)": ic_media.round(2),
+        "Mediana": mediana,
+        "Desvio Padrão": desvio.round(2),
+        f"Top 2 Box ({topo}-{maximo}) %": (p_topo * 100).round(1),
+        "IC Top 2 Box (±)": (ic_topo * 100).round(1),
+        f"Bottom 2 Box ({minimo}-{fundo}) %": (p_fundo * 100).round(1),
+        "NPS": (nps * 100).round(1),
+        "IC NPS (±)": (ic_nps * 100).round(1),
+    })
+
+
+def kpis_por_pergunta(df, grupos_nota, pesos=None, **opcoes):
+    # as perguntas de nota da mesma escala empilhadas em uma única matriz
+    matrizes = {
+        pergunta: np.column_stack([np.asarray(df[c], dtype=float) for c in cols])
+        for pergunta, cols in grupos_nota.items() if cols
+    }
+    por_escala = {}
+    for pergunta, matriz in matrizes.items():
+        por_escala.setdefault(escala_nota(matriz), []).append(pergunta)
+
+    t = {}
+    for escala, perguntas in por_escala.items():
+        tabela = kpis_notas(
+            np.column_stack([matrizes[p] for p in perguntas]), pesos, **{**ESCALAS_NOTA[escala], **opcoes}
+        )
+        inicio = 0
+        for pergunta in perguntas:
+            cols = grupos_nota[pergunta]
+            t[pergunta] = tabela.iloc[inicio:inicio + len(cols)].set_axis(
+                [c.split(" - ")[1].strip() for c in cols]
+            )
+            inicio += len(cols)
+    return {pergunta: t[pergunta] for pergunta in matrizes}
+
+
+def kpis_para_json(t_kpis):
+    def limpo(v):
+        return None if pd.isna(v) else float(v)
+
+    return [
+        {
+            "pergunta": pergunta,
+            "marcas": [
+                {"marca": marca, **{k: limpo(v) for k, v in linha.items()}, "Base": int(linha["Base"])}
+                for marca, linha in tabela.iterrows()
+            ],
+        }
+        for pergunta, tabela in t_kpis.items()
+    ]
+
+
+# ------------------------------------------------------------
+# 3. FUNIL E SOBREPOSIÇÃO DE MARCAS (MULTIRRESPOSTA)
+# ------------------------------------------------------------
+
+_OPCAO_NENHUMA = re.compile(r"^\s*(não|nenhum|nenhuma)\b", re.IGNORECASE)
+
+
+def etiqueta_pergunta(pergunta):
+    tags = re.findall(r"#\w+", pergunta)
+    return tags[-1] if tags else pergunta[:40]
+
+
+def matriz_multirresposta(df, cols):
+    # respondentes x marcas (True = marcou), sem as opções do tipo "nenhuma"
+    marcas, colunas = [], []
+    for col in cols:
+        marca = col.split(" - ")[1].strip()
+        if _OPCAO_NENHUMA.match(marca):
+            continue
+        if hasattr(df, "codigos") and col in df.codigos:
+            idx = [i for i, v in enumerate(df.rotulos_coluna(col)) if v == marca]
+            marcou = df.codigos[col] == idx[0] if idx else np.zeros(len(df), dtype=bool)
+        else:
+            marcou = np.asarray(df[col] == marca)
+        marcas.append(marca)
+        colunas.append(marcou)
+
+    matriz = np.column_stack(colunas) if colunas else np.zeros((len(df), 0), dtype=bool)
+    return marcas, matriz
+
+
+# etapas reconhecidas pelo enunciado ou pela #tag, na ordem do funil
+ETAPAS_FUNIL = [
+    ("conhecimento", re.compile(r"conhece|conhecimento|j[aá] ouviu|awareness|notoriedade", re.IGNORECASE)),
+    ("consideração", re.compile(r"considera|consideration|compraria|gostaria de comprar", re.IGNORECASE)),
+    ("compra", re.compile(r"comprou|\bcompras?\b|comprad|adquiriu|purchase", re.IGNORECASE)),
+]
+
+
+def etapas_padrao(df, grupos_multi, minimo_marcas=2):
+    # uma pergunta por etapa (a primeira que casar); sem ao menos duas etapas
+    # reconhecidas com marcas em comum, não há funil
+    etapas = []
+    for _, padrao in ETAPAS_FUNIL:
+        for p in grupos_multi:
+            if p not in etapas and padrao.search(p):
+                etapas.append(p)
+                break
+    if len(etapas) < 2:
+        return []
+    referencia = set(matriz_multirresposta(df, grupos_multi[etapas[0]])[0])
+    return [
+        p for p in etapas
+        if len(referencia & set(matriz_multirresposta(df, grupos_multi[p])[0])) >= minimo_marcas
+    ]
+
+
+def funil_marcas(df, grupos_multi, etapas=None, pesos=None):
+    etapas = etapas or etapas_padrao(df, grupos_multi)
+    if len(etapas) < 2:
+        return pd.DataFrame()
+
+    matrizes = [matriz_multirresposta(df, grupos_multi[e]) for e in etapas]
+    marcas = [m for m in matrizes[0][0] if all(m in mm for mm, _ in matrizes[1:])]
+    if not marcas:
+        return pd.DataFrame()
+
+    # cubo respondentes x etapas x marcas
+    cubo = np.stack(
+        [mat[:, [mm.index(m) for m in marcas]] for mm, mat in matrizes], axis=1
+    ).astype(float)
+    w = np.ones(len(df)) if pesos is None else np.asarray(pesos, dtype=float)
+    total = w.sum()
+
+    na_etapa = np.einsum("n,nem->em", w, cubo)
+    ambas = np.einsum("n,nem->em", w, cubo[:, :-1] * cubo[:, 1:])
+
+    nomes = [etiqueta_pergunta(e) for e in etapas]
+    tabela = pd.DataFrame(index=marcas)
+    for i, nome in enumerate(nomes):
+        tabela[f"% {nome}"] = (na_etapa[i] / total * 100).round(1) if total else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(len(etapas) - 1):
+            conversao = np.where(na_etapa[i] > 0, ambas[i] / na_etapa[i] * 100, np.nan)
+            tabela[f"Conversão {nomes[i]} → {nomes[i + 1]} %"] = conversao.round(1)
+    return tabela
+
+
+def sobreposicao_marcas(df, cols, pesos=None):
+    # % de quem marcou a marca da linha que também marcou a da coluna
+    marcas, matriz = matriz_multirresposta(df, cols)
+    if not marcas:
+        return pd.DataFrame()
+    m = matriz.astype(float)
+    w = np.ones(len(df)) if pesos is None else np.asarray(pesos, dtype=float)
+    coocorrencia = (m * w[:, None]).T @ m
+    base = np.diag(coocorrencia)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(base[:, None] > 0, coocorrencia / base[:, None] * 100, np.nan)
+    return pd.DataFrame(pct.round(1), index=marcas, columns=marcas)
+
+
+def funil_para_json(t_funil, t_sobreposicao, top=3):
+    def limpo(v):
+        return None if pd.isna(v) else float(v)
+
+    bloco = {"sobreposicao": []}
+    if not t_funil.empty:
+        bloco["funil"] = [
+            {"marca": marca, **{k: limpo(v) for k, v in linha.items()}}
+            for marca, linha in t_funil.iterrows()
+        ]
+    for pergunta, tabela in t_sobreposicao.items():
+        itens = []
+        for marca, linha in tabela.iterrows():
+            outras = linha.drop(marca).dropna().sort_values(ascending=False).head(top)
+            itens.append({"marca": marca, "tambem_marcaram": {k: float(v) for k, v in outras.items()}})
+        bloco["sobreposicao"].append({"pergunta": pergunta, "marcas": itens})
+    return bloco
+
+
+# ------------------------------------------------------------
+# 4. ASSOCIAÇÕES ENTRE TODAS AS PERGUNTAS (V DE CRAMÉR)
+# ------------------------------------------------------------
+
+def _codigos_e_rotulos(df, col):
+    if hasattr(df, "codigos") and col in df.codigos:
+        return df.codigos[col], df.rotulos_coluna(col)
+    codigos, uniques = pd.factorize(pd.Series(np.asarray(df[col])))
+    return codigos, list(uniques)
+
+
+def codificar_perguntas(df, colunas, grupos_multi=None, grupos_matriz=None, max_categorias=30):
+    # matriz respondentes x variáveis com códigos locais (-1 = vazio);
+    # cada marca da multirresposta vira uma variável 0/1 e cada item de
+    # matriz uma variável categórica
+    nomes, pergunta_de, rotulos, blocos = [], [], [], []
+
+    def adicionar(nome, pergunta, codigos, rotulos_variavel):
+        codigos = np.asarray(codigos, dtype=np.int32)
+        if 2 <= codigos.max(initial=-1) + 1 <= max_categorias:
+            nomes.append(nome)
+            pergunta_de.append(pergunta)
+            rotulos.append(rotulos_variavel)
+            blocos.append(codigos)
+
+    for col in colunas:
+        adicionar(etiqueta_pergunta(col), col, *_codigos_e_rotulos(df, col))
+
+    for pergunta, cols in (grupos_multi or {}).items():
+        marcas, marcou = matriz_multirresposta(df, cols)
+        for pos, marca in enumerate(marcas):
+            adicionar(f"{etiqueta_pergunta(pergunta)} - {marca}", pergunta, marcou[:, pos], ["Não marcou", "Marcou"])
+
+    for pergunta, cols in (grupos_matriz or {}).items():
+        for col in cols:
+            item = f"{etiqueta_pergunta(pergunta)} - {col.split(' - ')[1].strip()}"
+            adicionar(item, pergunta, *_codigos_e_rotulos(df, col))
+
+    matriz = np.column_stack(blocos) if blocos else np.empty((len(df), 0), dtype=np.int32)
+    return matriz, nomes, pergunta_de, rotulos
+
+
+def _medidas_associacao(tabela):
+    n = tabela.sum()
+    linhas = tabela.sum(axis=1)
+    colunas = tabela.sum(axis=0)
+    tabela = tabela[linhas > 0][:, colunas > 0]
+    linhas, colunas = linhas[linhas > 0], colunas[colunas > 0]
+    k = min(len(linhas), len(colunas))
+    if k < 2 or n <= 0:
+        return 0.0, 0.0
+
+    # V de Cramér com correção de viés (Bergsma), que evita valores
+    # inflados em tabelas grandes com base pequena
+    esperado = np.outer(linhas, colunas)
+    phi2 = max((tabela ** 2 / esperado).sum() - 1, 0.0)
+    r, c = len(linhas), len(colunas)
+    phi2 = max(phi2 - (r - 1) * (c - 1) / (n - 1), 0.0) if n > 1 else 0.0
+    r_corr = r - (r - 1) ** 2 / (n - 1) if n > 1 else r
+    c_corr = c - (c - 1) ** 2 / (n - 1) if n > 1 else c
+    denominador = min(r_corr - 1, c_corr - 1)
+    v = math.sqrt(phi2 / denominador) if denominador > 0 else 0.0
+
+    p = tabela / n
+    pos = p > 0
+    im = float((p[pos] * np.log2(p[pos] * n * n / esperado[pos])).sum())
+    return v, im
+
+
+_CODIGOS_WORKER = None
+
+
+def _iniciar_worker_associacao(codigos, pesos):
+    global _CODIGOS_WORKER
+    _CODIGOS_WORKER = (codigos, pesos)
+
+
+def _associacoes_de(args):
+    # todos os pares (i, j > i) de um lote de variáveis, com um único
+    # bincount por bloco: cada par ocupa seu trecho de ki*kj células
+    indices, pergunta_de, min_base, celulas_por_lote = args
+    codigos, pesos = _CODIGOS_WORKER
+    k = codigos.max(axis=0).astype(np.int64) + 1
+    m = codigos.shape[1]
+    resultado = []
+
+    for i in indices:
+        a = codigos[:, i].astype(np.int64)
+        parceiros = [j for j in range(i + 1, m) if pergunta_de[j] != pergunta_de[i]]
+        tam_bloco = max(1, celulas_por_lote // max(len(a), 1))
+
+        for inicio in range(0, len(parceiros), tam_bloco):
+            js = parceiros[inicio:inicio + tam_bloco]
+            b = codigos[:, js].astype(np.int64)
+            tamanhos = k[i] * k[js]
+            deslocamento = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+            validos = (a[:, None] >= 0) & (b >= 0)
+            celula = deslocamento[None, :] + a[:, None] * k[js][None, :] + b
+            w = None if pesos is None else np.broadcast_to(pesos[:, None], b.shape)[validos]
+            contagens = np.bincount(celula[validos], weights=w, minlength=int(tamanhos.sum()))
+
+            for pos, j in enumerate(js):
+                tabela = contagens[deslocamento[pos]:deslocamento[pos] + tamanhos[pos]]
+                tabela = tabela.reshape(k[i], k[j]).astype(float)
+                base = validos[:, pos].sum()
+                if base < min_base:
+                    continue
+                v, im = _medidas_associacao(tabela)
+                resultado.append((i, j, v, im, int(base)))
+    return resultado
+
+
+def associacoes_todas(df, colunas, grupos_multi=None, grupos_matriz=None, pesos=None, min_base=30,
+                      max_categorias=30, n_processos=1, celulas_por_lote=4_000_000):
+    codigos, nomes, pergunta_de, _ = codificar_perguntas(df, colunas, grupos_multi, grupos_matriz, max_categorias)
+    w = None if pesos is None else np.asarray(pesos, dtype=float)
+    m = codigos.shape[1]
+
+    # lotes intercalados equilibram o triângulo de pares entre os processos
+    n_lotes = max(1, min(m, n_processos * 4))
+    tarefas = [(list(range(r, m, n_lotes)), pergunta_de, min_base, celulas_por_lote) for r in range(n_lotes)]
+
+    if n_processos > 1:
+        with ProcessPoolExecutor(max_workers=n_processos, initializer=_iniciar_worker_associacao,
+                                 initargs=(codigos, w)) as pool:
+            pares = [p for parcial in pool.map(_associacoes_de, tarefas) for p in parcial]
+    else:
+        _iniciar_worker_associacao(codigos, w)
+        pares = [p for t in tarefas for p in _associacoes_de(t)]
+
+    resultado = pd.DataFrame(
+        [(nomes[i], nomes[j], round(v, 4), round(im, 4), base) for i, j, v, im, base in sorted(pares)],
+        columns=["variavel_a", "variavel_b", "cramer_v", "informacao_mutua_bits", "base"],
+    )
+    return resultado.sort_values(
+        ["cramer_v", "informacao_mutua_bits"], ascending=False, ignore_index=True, kind="stable"
+    )
+
+
+def associacoes_para_json(resultado, top=30):
+    return resultado.head(top).to_dict(orient="records")
+
+
+# ------------------------------------------------------------
+# 5. AGRUPAMENTO DE RESPONDENTES (K-MEANS EM MINILOTES, ONE-HOT ESPARSO)
+# ------------------------------------------------------------
+
+def one_hot_esparso(codigos):
+    # cada respondente guarda só os índices das colunas one-hot ativas
+    # (uma por variável); vazio aponta para uma coluna fantasma sempre zero
+    tamanhos = codigos.max(axis=0).astype(np.int64) + 1
+    deslocamento = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+    n_colunas = int(tamanhos.sum())
+    ativos = np.where(codigos >= 0, codigos + deslocamento, n_colunas)
+    return ativos, n_colunas, deslocamento
+
+
+def _distancias(ativos, centroides):
+    # ||x - c||² = |x| - 2 x·c + ||c||², com x·c somado só nos índices ativos
+    produto = centroides[:, ativos].sum(axis=2)
+    n_ativos = (ativos < centroides.shape[1] - 1).sum(axis=1)
+    return n_ativos[None, :] - 2 * produto + (centroides ** 2).sum(axis=1)[:, None]
+
+
+def _inicializar_centroides(ativos, n_colunas, k, rng, amostra=2000):
+    # k-means++ sobre uma amostra, sem densificá-la: só os k centroides são densos
+    idx = rng.choice(len(ativos), size=min(amostra, len(ativos)), replace=False)
+    amostra_ativos = ativos[idx]
+
+    def centroide(i):
+        c = np.zeros(n_colunas + 1)
+        c[amostra_ativos[i]] = 1.0
+        c[-1] = 0
+        return c
+
+    centroides = [centroide(rng.integers(len(idx)))]
+    d = _distancias(amostra_ativos, centroides[0][None, :])[0]
+    for _ in range(1, k):
+        prob = d / d.sum() if d.sum() > 0 else None
+        centroides.append(centroide(rng.choice(len(idx), p=prob)))
+        d = np.minimum(d, _distancias(amostra_ativos, centroides[-1][None, :])[0])
+    return np.array(centroides)
+
+
+def agrupar_respondentes(codigos, k=5, tamanho_lote=1024, n_epocas=5, seed=42):
+    ativos, n_colunas, _ = one_hot_esparso(codigos)
+    n = len(ativos)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+
+    centroides = _inicializar_centroides(ativos, n_colunas, k, rng)
+    vistos = np.zeros(k)
+
+    for _ in range(n_epocas):
+        for inicio in range(0, n, tamanho_lote):
+            lote = ativos[rng.integers(0, n, size=min(tamanho_lote, n))]
+            grupo = _distancias(lote, centroides).argmin(axis=0)
+
+            contagem = np.bincount(grupo, minlength=k)
+            somas = np.bincount(
+                (grupo[:, None] * (n_colunas + 1) + lote).ravel(), minlength=k * (n_colunas + 1)
+            ).reshape(k, n_colunas + 1)
+            somas[:, -1] = 0
+
+            # taxa de aprendizado 1/(vezes que o centroide já foi visto)
+            vistos += contagem
+            taxa = np.divide(contagem, vistos, out=np.zeros(k), where=vistos > 0)
+            media = somas / np.maximum(contagem, 1)[:, None]
+            centroides += taxa[:, None] * (media - centroides) * (contagem > 0)[:, None]
+
+    rotulos = np.concatenate([
+        _distancias(ativos[i:i + tamanho_lote], centroides).argmin(axis=0)
+        for i in range(0, n, tamanho_lote)
+    ])
+    return rotulos
+
+
+def perfilar_grupos(codigos, nomes, rotulos_variaveis, grupos, pesos=None, top=8, min_diferenca_pp=5.0):
+    ativos, n_colunas, deslocamento = one_hot_esparso(codigos)
+    w = np.ones(len(codigos)) if pesos is None else np.asarray(pesos, dtype=float)
+    k = int(grupos.max()) + 1 if len(grupos) else 0
+
+    itens = [
+        (nome, str(int(r)) if isinstance(r, float) and r.is_integer() else str(r))
+        for nome, rs in zip(nomes, rotulos_variaveis) for r in rs
+    ]
+    base_variavel = np.repeat(np.arange(len(nomes)), [len(rs) for rs in rotulos_variaveis])
+
+    # contagens (grupo x coluna one-hot) e bases por variável respondida
+    pesos_ativos = np.broadcast_to(w[:, None], ativos.shape)
+    celula = (grupos[:, None] * (n_colunas + 1) + ativos).ravel()
+    contagem = np.bincount(celula, weights=pesos_ativos.ravel(), minlength=k * (n_colunas + 1))
+    contagem = contagem.reshape(k, n_colunas + 1)[:, :-1]
+    respondeu = (codigos >= 0) * w[:, None]
+    base = np.stack([respondeu[grupos == g].sum(axis=0) for g in range(k)])[:, base_variavel]
+    base_total = respondeu.sum(axis=0)[base_variavel]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct_grupo = np.where(base > 0, contagem / base * 100, np.nan)
+        pct_total = np.where(base_total > 0, contagem.sum(axis=0) / base_total * 100, np.nan)
+
+    perfis = []
+    for g in range(k):
+        diferenca = pct_grupo[g] - pct_total
+        ordem = [i for i in np.argsort(-np.nan_to_num(diferenca, nan=-np.inf)) if diferenca[i] >= min_diferenca_pp]
+        tamanho = float(w[grupos == g].sum())
+        perfis.append({
+            "grupo": g + 1,
+            "tamanho": round(tamanho, 1),
+            "pct_total": round(tamanho / w.sum() * 100, 1),
+            "destaques": [
+                {
+                    "variavel": itens[i][0],
+                    "resposta": itens[i][1],
+                    "pct_grupo": round(float(pct_grupo[g, i]), 1),
+                    "pct_total": round(float(pct_total[i]), 1),
+                    "diferenca_pp": round(float(diferenca[i]), 1),
+                }
+                for i in ordem[:top]
+            ],
+        })
+    return perfis
+
+
+# ------------------------------------------------------------
+# 6. TENDÊNCIA ENTRE ONDAS (TABULAÇÕES ALINHADAS POR #TAG)
+# ------------------------------------------------------------
+
+_TAG = re.compile(r"#(\w+)")
+
+COLUNAS_EMPILHADAS = ["secao", "tag", "pergunta", "item", "resposta", "n", "base"]
+
+
+def tag_pergunta(pergunta):
+    # o código "#tag" se mantém entre ondas mesmo quando a redação muda
+    achado = _TAG.search(str(pergunta))
+    return achado.group(1) if achado else str(pergunta).split(" - ")[0].strip()
+
+
+def _rotulo_resposta(valor):
+    if isinstance(valor, (float, np.floating)) and float(valor).is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def empilhar_tabelas(t_simples, t_multi, t_matriz, t_nota, n_respondentes):
+    # formato longo: uma linha por (seção, tag, item, resposta) com a
+    # contagem e a base da tabela (na multirresposta, todos os respondentes)
+    colunas = {c: [] for c in COLUNAS_EMPILHADAS}
+
+    def empilhar(secao, pergunta, item, tabela, base=None):
+        n = tabela["Frequência Absoluta"].to_numpy(dtype=float)
+        k = len(n)
+        colunas["secao"] += [secao] * k
+        colunas["tag"] += [tag_pergunta(pergunta)] * k
+        colunas["pergunta"] += [pergunta] * k
+        colunas["item"] += [item] * k
+        colunas["resposta"] += [_rotulo_resposta(v) for v in tabela.index]
+        colunas["n"].append(n)
+        colunas["base"].append(np.full(k, n.sum() if base is None else base, dtype=float))
+
+    for pergunta, tabela in t_simples.items():
+        empilhar("perguntas_simples", pergunta, "", tabela)
+    for pergunta, tabela in t_multi.items():
+        empilhar("multirresposta", pergunta, "", tabela, n_respondentes)
+    for pergunta, itens in t_matriz.items():
+        for item, tabela in itens.items():
+            empilhar("matriz_texto", pergunta, item, tabela)
+    for pergunta, marcas in t_nota.items():
+        for marca, tabela in marcas.items():
+            empilhar("matriz_nota", pergunta, marca, tabela)
+
+    for c in ("n", "base"):
+        colunas[c] = np.concatenate(colunas[c]) if colunas[c] else np.empty(0)
+    return pd.DataFrame(colunas, columns=COLUNAS_EMPILHADAS)
+
+
+def comparar_ondas(anterior, atual, alpha=0.05, min_base=30):
+    # anterior/atual: saídas de empilhar_tabelas. Alinha por (seção, tag,
+    # item, resposta) e testa todas as diferenças de uma vez (teste z de
+    # duas proporções); resposta que some em uma onda conta como 0 sobre a
+    # base daquela pergunta
+    chave = ["secao", "tag", "item", "resposta"]
+    tabela = ["secao", "tag", "item"]
+    anterior = anterior.drop_duplicates(chave)
+    atual = atual.drop_duplicates(chave)
+
+    m = atual.merge(anterior, on=chave, how="outer", suffixes=("_atual", "_anterior"), sort=False)
+    linhas_tabela = pd.MultiIndex.from_frame(m[tabela])
+    for sufixo, onda in (("_anterior", anterior), ("_atual", atual)):
+        bases = onda.drop_duplicates(tabela).set_index(tabela)["base"]
+        m["base" + sufixo] = bases.reindex(linhas_tabela).to_numpy()
+        m["n" + sufixo] = m["n" + sufixo].fillna(0.0)
+    m["pergunta"] = m["pergunta_atual"].fillna(m["pergunta_anterior"])
+
+    # pergunta que só existe em uma das ondas não tem com o que comparar
+    m = m[m["base_anterior"].notna() & m["base_atual"].notna()].reset_index(drop=True)
+
+    n0, b0 = m["n_anterior"].to_numpy(), m["base_anterior"].to_numpy()
+    n1, b1 = m["n_atual"].to_numpy(), m["base_atual"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p0 = n0 / b0
+        p1 = n1 / b1
+        p = (n0 + n1) / (b0 + b1)
+        erro = np.sqrt(p * (1 - p) * (1 / b0 + 1 / b1))
+        z = np.where(erro > 0, (p1 - p0) / erro, 0.0)
+    testavel = (b0 >= min_base) & (b1 >= min_base) & (erro > 0)
+
+    resultado = pd.DataFrame({
+        "secao": m["secao"],
+        "tag": m["tag"],
+        "pergunta": m["pergunta"],
+        "item": m["item"],
+        "resposta": m["resposta"],
+        "pct_anterior": np.round(p0 * 100, 1),
+        "pct_atual": np.round(p1 * 100, 1),
+        "delta_pp": np.round((p1 - p0) * 100, 1),
+        "base_anterior": np.round(b0).astype(int),
+        "base_atual": np.round(b1).astype(int),
+        "z": z,
+        "p_valor": np.where(testavel, p_valor_normal(z), 1.0),
+    })
+    # família = cada tabela (mesma correção das diferenças entre segmentos)
+    resultado["p_ajustado"] = resultado.groupby(tabela, sort=False)["p_valor"].transform(
+        lambda p: ajustar_benjamini_hochberg(p.to_numpy())
+    )
+    resultado["significativo"] = testavel & (resultado["p_ajustado"] < alpha).to_numpy()
+    resultado["direcao"] = np.where(
+        resultado["delta_pp"] > 0, "subiu", np.where(resultado["delta_pp"] < 0, "caiu", "estável")
+    )
+    return resultado
+
+
+def tendencias_para_json(resultado, max_itens=200, apenas_significativas=True):
+    linhas = resultado[resultado["significativo"]] if apenas_significativas else resultado
+    linhas = linhas.reindex(linhas["delta_pp"].abs().sort_values(ascending=False, kind="stable").index).head(max_itens)
+    return [
+        {
+            "secao": r.secao,
+            "pergunta": r.pergunta,
+            "item": r.item,
+            "resposta": r.resposta,
+            "pct_anterior": float(r.pct_anterior),
+            "pct_atual": float(r.pct_atual),
+            "delta_pp": float(r.delta_pp),
+            "base_atual": int(r.base_atual),
+            "p_ajustado": round(float(r.p_ajustado), 4),
+        }
+        for r in linhas.itertuples()
+    ]
@@ -6,33 +6,352 @@
 
 import pandas as pd
 import numpy as np
+import ast
+import csv
+import hashlib
+import inspect
+import io
 import json
+import os
+import pickle
 import re
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import weakref
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 from collections import defaultdict
+from functools import lru_cache
+from itertools import islice, repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+
+from analise_ilumeo import testar_significancia, kpis_por_pergunta, kpis_para_json
+from analise_ilumeo import tabelas_cruzadas, cruzadas_para_json
+from analise_ilumeo import funil_marcas, sobreposicao_marcas, funil_para_json
+from analise_ilumeo import associacoes_todas, associacoes_para_json
+from analise_ilumeo import codificar_perguntas, agrupar_respondentes, perfilar_grupos
+from analise_ilumeo import tag_pergunta, empilhar_tabelas, comparar_ondas, tendencias_para_json
+import texto_ilumeo
+from texto_ilumeo import unificar_variantes, contar_termos, chave_texto, mapear_quase_duplicados, opcoes_fechadas
 
 # ------------------------------------------------------------
 # 1. CARREGAMENTO E PADRONIZAÇÃO DE CABEÇALHOS
 # ------------------------------------------------------------
 
+def clean_header(col):
+    question, option = col
+
+    if "Unnamed" in str(option) or not str(option):
+        return str(question).strip()
+
+    if "Unnamed" in str(question):
+        return str(option).strip()
+
+    return f"{str(question).strip()} - {str(option).strip()}"
+
+
+# uploads acima deste tamanho vão para um arquivo temporário em vez de
+# ficar em memória durante o ETL
+LIMITE_UPLOAD_MEMORIA = 256 * 1024 * 1024
+
+
+class EntradaPesquisa:
+    """Arquivo da pesquisa recebido como caminho, bytes ou objeto de arquivo
+    (ex.: o UploadedFile do Streamlit). O conteúdo é lido uma vez só, com o
+    sha256 calculado na mesma passada, e fica em memória; só vai para disco
+    quando passa de limite_memoria."""
+
+    def __init__(self, fonte, nome=None, limite_memoria=LIMITE_UPLOAD_MEMORIA, tamanho_pedaco=1 << 20):
+        self.caminho = None
+        self._dados = None
+        self._hash = None
+        self._finalizar = None
+
+        if isinstance(fonte, (str, os.PathLike)):
+            self.caminho = os.fspath(fonte)
+            self.nome = nome or os.path.basename(self.caminho)
+            return
+
+        self.nome = nome or os.path.basename(str(getattr(fonte, "name", "") or ""))
+        if isinstance(fonte, (bytes, bytearray, memoryview)):
+            fonte = io.BytesIO(fonte)
+
+        if hasattr(fonte, "getbuffer") and fonte.getbuffer().nbytes <= limite_memoria:
+            # já está em memória: basta o hash, sem copiar o conteúdo
+            with fonte.getbuffer() as conteudo:
+                self._hash = hashlib.sha256(conteudo).hexdigest()
+            self._dados = fonte
+            return
+
+        h = hashlib.sha256()
+        buffer = io.BytesIO()
+        destino = buffer
+        if hasattr(fonte, "seek"):
+            fonte.seek(0)
+        for pedaco in iter(lambda: fonte.read(tamanho_pedaco), b""):
+            h.update(pedaco)
+            destino.write(pedaco)
+            if destino is buffer and buffer.tell() > limite_memoria:
+                destino = tempfile.NamedTemporaryFile(suffix=os.path.splitext(self.nome)[1], delete=False)
+                destino.write(buffer.getbuffer())
+                buffer = None
+        self._hash = h.hexdigest()
+
+        if destino is buffer:
+            self._dados = buffer
+        else:
+            destino.close()
+            self.caminho = destino.name
+            self._finalizar = weakref.finalize(self, os.remove, destino.name)
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = hash_arquivo(self.caminho)
+        return self._hash
+
+    @property
+    def formato(self):
+        extensao = os.path.splitext(self.nome)[1].lower()
+        if extensao in LEITORES:
+            return extensao
+        # sem nome (bytes soltos): reconhece pela assinatura do arquivo
+        fonte = self.abrir()
+        if isinstance(fonte, str):
+            with open(fonte, "rb") as f:
+                inicio = f.read(4)
+        else:
+            inicio = fonte.read(4)
+            fonte.seek(0)
+        return ASSINATURAS_FORMATO.get(inicio, ".csv")
+
+    @property
+    def e_csv(self):
+        return self.formato == ".csv"
+
+    def abrir(self):
+        # caminho ou buffer no início, aceitos direto por read_excel/read_csv
+        if self._dados is None:
+            return self.caminho
+        self._dados.seek(0)
+        return self._dados
+
+    def conteudo(self):
+        fonte = self.abrir()
+        if isinstance(fonte, str):
+            with open(fonte, "rb") as f:
+                return f.read()
+        return fonte.read()
+
+    def fechar(self):
+        self._dados = None
+        if self._finalizar is not None:
+            self._finalizar()
+
+
+def abrir_entrada(fonte):
+    return fonte if isinstance(fonte, EntradaPesquisa) else EntradaPesquisa(fonte)
+
+
+def _ler_excel(fonte):
+    return pd.read_excel(fonte, header=[0, 1])
+
+
+def _ler_xls(fonte):
+    try:
+        import xlrd
+    except ImportError:
+        raise ImportError("arquivos .xls precisam do pacote opcional xlrd (pip install xlrd)") from None
+    return _ler_excel(fonte)
+
+
+def formato_csv(fonte, tamanho_amostra=64 * 1024):
+    # separador e codificação pelo início do arquivo: o Excel em português
+    # exporta com ";" e, fora do "CSV UTF-8", em latin-1
+    if isinstance(fonte, str):
+        with open(fonte, "rb") as f:
+            amostra = f.read(tamanho_amostra)
+    else:
+        amostra = fonte.read(tamanho_amostra)
+        fonte.seek(0)
+    if len(amostra) == tamanho_amostra and b"\n" in amostra:
+        # sem cortar um caractere de vários bytes no fim da amostra
+        amostra = amostra[:amostra.rfind(b"\n") + 1]
+
+    try:
+        texto, encoding = amostra.decode("utf-8-sig"), "utf-8-sig"
+    except UnicodeDecodeError:
+        texto, encoding = amostra.decode("latin-1"), "latin-1"
+    # o separador que quebra a 1ª linha (respeitando aspas) em mais campos
+    sep = max(",;\t", key=lambda s: len(next(csv.reader(io.StringIO(texto), delimiter=s), [])))
+    return {"sep": sep, "encoding": encoding}
+
+
+def _ler_csv(fonte):
+    # mesmo layout do Excel exportado: pergunta na 1ª linha, opção na 2ª
+    return pd.read_csv(fonte, header=[0, 1], **formato_csv(fonte))
+
+
+def _ler_parquet(fonte):
+    return pd.read_parquet(fonte)
+
+
+def _ler_spss(fonte):
+    import pyreadstat
+
+    if not isinstance(fonte, str):
+        # o pyreadstat só lê de caminho
+        with tempfile.NamedTemporaryFile(suffix=".sav", delete=False) as f:
+            f.write(fonte.read())
+        try:
+            return _ler_spss(f.name)
+        finally:
+            os.remove(f.name)
+
+    df, meta = pyreadstat.read_sav(fonte, apply_value_formats=True, formats_as_category=False)
+    # o rótulo da variável faz o papel do cabeçalho de duas linhas
+    rotulos = meta.column_names_to_labels
+    df.columns = pd.MultiIndex.from_tuples([(rotulos.get(c) or c, "") for c in df.columns])
+    return df
+
+
+LEITORES = {
+    ".xlsx": _ler_excel,
+    ".xlsm": _ler_excel,
+    ".xls": _ler_xls,
+    ".csv": _ler_csv,
+    ".txt": _ler_csv,
+    ".parquet": _ler_parquet,
+    ".pq": _ler_parquet,
+    ".sav": _ler_spss,
+    ".zsav": _ler_spss,
+}
+
+ASSINATURAS_FORMATO = {
+    b"PK\x03\x04": ".xlsx", b"\xd0\xcf\x11\xe0": ".xls", b"PAR1": ".parquet", b"$FL2": ".sav", b"$FL3": ".zsav",
+}
+
+# "('Pergunta', 'Opção')": cabeçalho de duas linhas que o Parquet gravou como texto
+_TUPLA_TEXTO = re.compile(r"""^\(\s*(['"]).*\1\s*,\s*(['"]).*\2\s*\)$""", re.DOTALL)
+
+
+def padronizar_cabecalhos(colunas):
+    # cabeçalho de duas linhas (Excel, CSV, SPSS) ou tuplas que o Parquet
+    # gravou como texto viram o mesmo "Pergunta - Opção"
+    nomes = []
+    for col in colunas:
+        if isinstance(col, str) and _TUPLA_TEXTO.match(col):
+            # só o par de textos: "(1)" ou "(a, b)" continuam como estão
+            try:
+                par = ast.literal_eval(col)
+            except (ValueError, SyntaxError):
+                par = None
+            if isinstance(par, tuple) and len(par) == 2 and all(isinstance(p, str) for p in par):
+                col = par
+        nomes.append(clean_header(col) if isinstance(col, tuple) and len(col) == 2 else str(col).strip())
+    return nomes
+
+
 def carregar_e_padronizar_dados(path, log):
 
     try:
-        df = pd.read_excel(path, header=[0, 1])
+        entrada = abrir_entrada(path)
+        df = LEITORES[entrada.formato](entrada.abrir())
+
+        df.columns = padronizar_cabecalhos(df.columns)
+
+        log(f"✅ Arquivo carregado ({entrada.formato.lstrip('.')}) e cabeçalhos unificados com sucesso.")
+        return df
 
-        def clean_header(col):
-            question, option = col
+    except Exception as e:
+        log(f"❌ Erro ao processar arquivo: {e}")
+        return None
 
-            if "Unnamed" in str(option) or not str(option):
-                return str(question).strip()
 
-            if "Unnamed" in str(question):
-                return str(option).strip()
+# coluna criada na leitura de várias abas: de qual onda/aba veio cada respondente
+COLUNA_ONDA = "Onda"
 
-            return f"{str(question).strip()} - {str(option).strip()}"
 
-        df.columns = [clean_header(col) for col in df.columns]
+def abas_da_planilha(path):
+    entrada = abrir_entrada(path)
+    livro = load_workbook(entrada.abrir(), read_only=True)
+    try:
+        return list(livro.sheetnames)
+    finally:
+        livro.close()
 
-        log("✅ Arquivo carregado e cabeçalhos unificados com sucesso.")
+
+def _ler_aba(fonte, aba):
+    if isinstance(fonte, bytes):
+        fonte = io.BytesIO(fonte)
+    df = pd.read_excel(fonte, sheet_name=aba, header=[0, 1])
+    df.columns = padronizar_cabecalhos(df.columns)
+    return df
+
+
+def alinhar_questionarios(listas_colunas):
+    # união das colunas; a que falta em uma aba entra logo depois da
+    # coluna que a antecede na aba em que aparece
+    esquema = []
+    for colunas in listas_colunas:
+        posicao = -1
+        for col in colunas:
+            if col in esquema:
+                posicao = esquema.index(col)
+            else:
+                posicao += 1
+                esquema.insert(posicao, col)
+    return esquema
+
+
+def carregar_ondas(path, log, n_processos=1, abas=None):
+    # uma aba por onda (ou país): cada aba é lida em um processo, as colunas
+    # são alinhadas pelo questionário unificado (união, na ordem em que
+    # aparecem) e cada respondente recebe a coluna COLUNA_ONDA
+    try:
+        entrada = abrir_entrada(path)
+        abas = abas or abas_da_planilha(entrada)
+        fonte = entrada.caminho or entrada.conteudo()
+
+        if n_processos > 1 and len(abas) > 1:
+            # upload em memória vai para disco uma vez: cada tarefa recebe só o caminho,
+            # não uma cópia dos bytes da planilha inteira
+            temporario = None
+            if not isinstance(fonte, str):
+                with tempfile.NamedTemporaryFile(suffix=os.path.splitext(entrada.nome)[1] or ".xlsx",
+                                                 delete=False) as f:
+                    f.write(fonte)
+                fonte = temporario = f.name
+            try:
+                with ProcessPoolExecutor(max_workers=min(n_processos, len(abas))) as pool:
+                    partes = list(pool.map(_ler_aba, [fonte] * len(abas), abas))
+            finally:
+                if temporario:
+                    os.remove(temporario)
+        else:
+            partes = [_ler_aba(fonte, aba) for aba in abas]
+
+        esquema = alinhar_questionarios([parte.columns for parte in partes])
+        for aba, parte in zip(abas, partes):
+            faltando = len(esquema) - parte.shape[1]
+            if faltando:
+                log(f"⚠️ Aba '{aba}': {faltando} colunas do questionário unificado ausentes (ficam vazias).")
+
+        onda = pd.Series(np.repeat(np.array(abas, dtype=object), [len(p) for p in partes]), name=COLUNA_ONDA)
+        df = pd.concat(
+            [onda, pd.concat([parte.reindex(columns=esquema) for parte in partes], ignore_index=True)], axis=1
+        )
+
+        log(f"✅ {len(abas)} abas carregadas e alinhadas: {len(df)} respondentes, {len(esquema)} colunas.")
         return df
 
     except Exception as e:
@@ -40,17 +359,75 @@ def carregar_e_padronizar_dados(path, log):
         return None
 
 
+def comparar_formatos(path, log, repeticoes=3):
+    # a mesma pesquisa gravada em cada formato disponível (em memória) e
+    # o tempo de leitura + padronização de cabeçalhos de cada um
+    entrada = abrir_entrada(path)
+    bruto = LEITORES[entrada.formato](entrada.abrir())
+    referencia = padronizar_cabecalhos(bruto.columns)
+
+    conteudos = {entrada.formato: entrada.conteudo()}
+    conteudos.setdefault(".csv", bruto.to_csv(index=False).encode("utf-8"))
+    try:
+        buffer = io.BytesIO()
+        bruto.to_parquet(buffer, index=False)
+        conteudos.setdefault(".parquet", buffer.getvalue())
+    except ImportError as e:
+        log(f"⚠️ Parquet fora do comparativo: {e}")
+    try:
+        import pyreadstat
+
+        planos = bruto.copy()
+        planos.columns = [f"v{i}" for i in range(bruto.shape[1])]
+        with tempfile.NamedTemporaryFile(suffix=".sav", delete=False) as f:
+            caminho_sav = f.name
+        try:
+            pyreadstat.write_sav(planos, caminho_sav, column_labels=referencia)
+            with open(caminho_sav, "rb") as f:
+                conteudos.setdefault(".sav", f.read())
+        finally:
+            os.remove(caminho_sav)
+    except ImportError as e:
+        log(f"⚠️ SPSS fora do comparativo: {e}")
+
+    linhas = []
+    for formato, conteudo in conteudos.items():
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            df = LEITORES[formato](io.BytesIO(conteudo))
+            df.columns = padronizar_cabecalhos(df.columns)
+            tempos.append(time.perf_counter() - inicio)
+        linhas.append({
+            "formato": formato.lstrip("."),
+            "mb": round(len(conteudo) / 1024 ** 2, 2),
+            "segundos": round(min(tempos), 4),
+            "linhas": len(df),
+            "mesmas_colunas": list(df.columns) == referencia,
+        })
+        log(f"⏱️ {formato.lstrip('.')}: {min(tempos):.3f}s para {len(df)} linhas.")
+
+    tabela = pd.DataFrame(linhas)
+    tabela["x_mais_rapido_que_original"] = (tabela["segundos"].iloc[0] / tabela["segundos"]).round(1)
+    return tabela
+
+
 # ------------------------------------------------------------
 # 2. FILTRO DE RESPONDENTES
 # ------------------------------------------------------------
 
-def filtrar_respondentes_validos(df, log):
+def filtrar_respondentes_validos(df, log, coluna_filtro=None, remover=None):
 
-    coluna_filtro = "RESPOSTA ESTÁ DENTRO DA PROPORCIONALIZAÇÃO? - imported_in_delfos"
+    coluna_filtro = coluna_filtro or CONFIG_PADRAO["filtro"]["coluna"]
+    remover = CONFIG_PADRAO["filtro"]["remover_valores"] if remover is None else remover
 
     if coluna_filtro in df.columns:
         linhas_iniciais = df.shape[0]
-        df = df[df[coluna_filtro] != "NÃO"]
+        fora = df[coluna_filtro].isin(remover).to_numpy()
+        if df.index.is_unique:
+            df.drop(index=df.index[fora], inplace=True)
+        else:
+            df = df[~fora]
         removidos = linhas_iniciais - df.shape[0]
         log(f"✅ Filtragem aplicada: {removidos} removidos. Total final: {df.shape[0]}")
     else:
@@ -60,37 +437,102 @@ def filtrar_respondentes_validos(df, log):
 
 
 # ------------------------------------------------------------
-# 3. REMOVER COLUNAS INDESEJADAS
+# 3. PONDERAÇÃO POR RAKING (ALTERNATIVA AO FILTRO)
 # ------------------------------------------------------------
 
-def limpar_colunas_indesejadas(df, log):
+def encontrar_coluna_por_tag(df, tag):
+    padrao = re.escape(tag) + r"(?!\w)"
+    for col in df.columns:
+        if re.search(padrao, col) and "outro (especifique)" not in col.lower():
+            return col
+    return None
+
+
+def alvos_da_proporcionalizacao(df, plano):
+    # metas = distribuição das respostas marcadas como dentro da cota; a
+    # coluna da cota e os valores "fora" são os mesmos do filtro
+    dentro = df[~df[plano.coluna_filtro].isin(plano.valores_removidos)]
+    alvos = {}
+    for tag in plano.tags_ponderacao:
+        col = encontrar_coluna_por_tag(df, tag)
+        if col is not None:
+            alvos[col] = dentro[col].value_counts(normalize=True).to_dict()
+    return alvos
+
+
+def calcular_pesos_raking(df, alvos, max_iter=100, tol=1e-6):
+    n = len(df)
+    pesos = np.ones(n)
+
+    margens = []
+    for col, proporcoes in alvos.items():
+        categorias = list(proporcoes)
+        k = len(categorias)
+        codigos = pd.Categorical(df[col], categories=categorias).codes.astype(np.int64)
+        # quem está fora das metas (vazio ou categoria sem meta) vai para o
+        # balde k, que sempre recebe fator 1
+        codigos[codigos < 0] = k
+
+        # categorias sem nenhum respondente não podem ser atingidas:
+        # a meta é redistribuída entre as demais
+        alvo = np.array([proporcoes[c] for c in categorias], dtype=float)
+        alvo[np.bincount(codigos, minlength=k + 1)[:k] == 0] = 0
+        if alvo.sum() > 0:
+            margens.append((codigos, alvo / alvo.sum()))
+
+    convergiu = False
+    iteracao = 0
+    for iteracao in range(1, max_iter + 1):
+        maior_ajuste = 0.0
+        for codigos, alvo in margens:
+            k = len(alvo)
+            atuais = np.bincount(codigos, weights=pesos, minlength=k + 1)[:k]
+            presentes = atuais > 0
+            fator = np.ones(k + 1)
+            fator[:k][presentes] = alvo[presentes] * atuais.sum() / atuais[presentes]
+            pesos *= fator[codigos]
+            maior_ajuste = max(maior_ajuste, float(np.abs(fator - 1).max()))
+        if maior_ajuste < tol:
+            convergiu = True
+            break
+
+    pesos *= n / pesos.sum()
+    return pesos, iteracao, convergiu
+
+
+def ponderar_respondentes(df, log, alvos=None, config=None):
+    if alvos is None:
+        plano = compilar_plano(config)
+        if plano.coluna_filtro not in df.columns:
+            log("⚠️ Sem metas de ponderação nem coluna de proporcionalização. Pesos iguais a 1.")
+            return pd.Series(1.0, index=df.index)
+        alvos = alvos_da_proporcionalizacao(df, plano)
+
+    inicio = time.perf_counter()
+    pesos, iteracoes, convergiu = calcular_pesos_raking(df, alvos)
+    ms = (time.perf_counter() - inicio) * 1000
+
+    efeito = len(pesos) * np.sum(pesos ** 2) / np.sum(pesos) ** 2 if len(pesos) else 1.0
+    log(
+        f"⚖️ Raking em {len(alvos)} margens: {iteracoes} iterações em {ms:.1f} ms"
+        f"{'' if convergiu else ' (sem convergência)'}, efeito de desenho {efeito:.2f}, "
+        f"base efetiva {len(pesos) / efeito:.0f} de {len(pesos)}."
+    )
+    return pd.Series(pesos, index=df.index)
 
-    termos_proibidos = [
-        "RESPOSTA ESTÁ DENTRO DA PROPORCIONALIZAÇÃO? - imported_in_delfos",
-        "respondent_id - respondent_id",
-        "user_invitation_code - user_invitation_code",
-        "collector_id - collector_id",
-        "date_created - date_created",
-        "date_modified - date_modified",
-        "ip_address - ip_address",
-        "status - status",
-        "total_time - total_time",
-        "complement_status - complement_status",
-        "Você estuda ou trabalha em uma dessas atividades? #prof - Response",
-        "Você estuda ou trabalha em uma dessas atividades? #prof - Outro (especifique)", "aberta_en",
-        "#awesp", "#aberta_op", "#faw", "#fkn", "#flk", "#fco", "#fpr", "#clt", "#rej", "#mar",
-        "PRIMEIRA PALAVRA", "{{", "PRÓXIMA COMPRA",
-        "Você gostou de responder essa pesquisa? - Response"
-    ]
 
-    colunas_para_remover = []
+# ------------------------------------------------------------
+# 4. REMOVER COLUNAS INDESEJADAS
+# ------------------------------------------------------------
+
+def limpar_colunas_indesejadas(df, log, padrao=None):
 
-    for col in df.columns:
-        if any(termo in col for termo in termos_proibidos):
-            colunas_para_remover.append(col)
+    # termos proibidos vêm da configuração (configuracoes/*.json)
+    padrao = padrao or compilar_plano().regex_remocao
+    colunas_para_remover = [col for col in df.columns if padrao and padrao.search(col)]
 
     n_antes = df.shape[1]
-    df = df.drop(columns=colunas_para_remover, errors="ignore")
+    df.drop(columns=colunas_para_remover, errors="ignore", inplace=True)
     n_depois = df.shape[1]
 
     log(f"✅ Remoção de colunas: {n_antes - n_depois} colunas removidas.")
@@ -100,33 +542,46 @@ def limpar_colunas_indesejadas(df, log):
 
 
 # ------------------------------------------------------------
-# 4. AJUSTE DE CIDADE E GÊNERO
+# 5. JUNÇÃO DE "RESPONSE" COM "OUTRO (ESPECIFIQUE)"
 # ------------------------------------------------------------
 
-def ajustar_cidade_genero(df, log):
+_SUFIXO_OUTRO = re.compile(r" - (outro|other)\b.*$", re.IGNORECASE)
+
+
+def pares_response_outro(df):
+    # toda coluna "... - Outro (especifique)" com a sua "... - Response"
+    pares = []
+    colunas = set(df.columns)
+    for col in df.columns:
+        if _SUFIXO_OUTRO.search(col):
+            resposta = _SUFIXO_OUTRO.sub(" - Response", col)
+            if resposta in colunas and resposta != col:
+                pares.append((resposta, col))
+    return pares
 
-    # CIDADE
-    col1 = "Em qual cidade você mora? #cid - Response"
-    col2 = "Em qual cidade você mora? #cid - Outro (especifique)"
 
-    if col1 in df.columns and col2 in df.columns:
-        df[col1] = df[col1].replace("", np.nan).fillna(df[col2])
-        df = df.drop(columns=[col2], errors="ignore")
+def mesclar_respostas_outro(df, log):
+    pares = pares_response_outro(df)
+    if not pares:
+        log("👤 Nenhum par Response / Outro (especifique) encontrado.")
+        return df
 
-    # GÊNERO
-    col3 = "Qual é o seu gênero ? #gen - Response"
-    col4 = "Qual é o seu gênero ? #gen - Outro (especifique)"
+    respostas = [r for r, _ in pares]
+    outros = [o for _, o in pares]
 
-    if col3 in df.columns and col4 in df.columns:
-        df[col3] = df[col3].replace("", np.nan).fillna(df[col4])
-        df = df.drop(columns=[col4], errors="ignore")
+    # todas as junções num único bloco: vazio ou "" no Response recebe o texto do Outro
+    r = df[respostas].to_numpy(dtype=object)
+    o = df[outros].to_numpy(dtype=object)
+    vazio = pd.isna(r) | (r == "")
+    df[respostas] = np.where(vazio, o, r)
+    df.drop(columns=outros, inplace=True)
 
-    log("👤 Ajuste de cidade e gênero concluído.")
+    log(f"👤 Response / Outro (especifique): {len(pares)} perguntas unificadas.")
     return df
 
 
 # ------------------------------------------------------------
-# 5. REMOVER HTML
+# 6. REMOVER HTML
 # ------------------------------------------------------------
 
 def remove_html(text):
@@ -135,14 +590,20 @@ def remove_html(text):
     return re.sub(r"<.*?>", "", str(text)).strip()
 
 
-def limpar_html_df(df, log):
-    df = df.apply(lambda col: col.map(remove_html) if col.dtype == "object" else col)
-    log("🧽 Remoção de HTML aplicada às colunas de texto.")
-    return df
+def mapear_valores_distintos(serie, funcao):
+    # aplica a função uma vez por valor distinto; devolve None se nada mudou
+    codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+    novos = [funcao(v) for v in valores]
+    if all(type(a) is type(b) and a == b for a, b in zip(valores, novos)) and (codigos >= 0).all():
+        return None
+    tabela = np.empty(len(novos) + 1, dtype=object)
+    tabela[:-1] = novos
+    tabela[-1] = funcao(np.nan)
+    return tabela[codigos]
 
 
 # ------------------------------------------------------------
-# 6. LIMPEZA ESCALA LIKERT
+# 7. LIMPEZA ESCALA LIKERT
 # ------------------------------------------------------------
 
 def limpar_likert(valor):
@@ -155,33 +616,568 @@ def limpar_likert(valor):
     return np.nan
 
 
-def limpar_escalas(df, log):
+# ------------------------------------------------------------
+# 8. NORMALIZAÇÃO DE TEXTO ABERTO (VARIANTES, TERMOS E QUASE-DUPLICATAS)
+# ------------------------------------------------------------
+
+def normalizar_textos_abertos(df, log):
+    grupos_texto = planejar_tabelas(df)[2]
+    unificadas = 0
+    if isinstance(df, ContagemParcial):
+        unificadas = df.unificar_variantes([c for cols in grupos_texto.values() for c in cols])
+        log(f"🔤 Texto aberto: {unificadas} variantes de escrita unificadas.")
+        return df
 
-    colunas_escala = [
-        col for col in df.columns
-        if "gostaria de" in col.lower()
-        or "receber como presente" in col.lower()
-        or "nota" in col.lower()
-    ]
+    for cols in grupos_texto.values():
+        for col in cols:
+            serie, n = unificar_variantes(df[col])
+            if n:
+                df[col] = serie
+                unificadas += n
+    log(f"🔤 Texto aberto: {unificadas} variantes de escrita unificadas.")
+    return df
 
-    log(f"🔄 Limpeza Likert em {len(colunas_escala)} colunas...")
 
-    for col in colunas_escala:
-        df[col] = df[col].apply(limpar_likert)
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+def frequencias_valores(df, col):
+    if isinstance(df, ContagemParcial):
+        return pd.Series({k: n for k, (n, _) in df.contagens[col].items() if k is not None}, dtype="int64")
+    return df[col].value_counts(sort=False)
 
-    log("✅ Limpeza de escalas concluída.")
-    return df
+
+def colunas_texto_livre(df, min_distintos=20):
+    # colunas de resposta livre (ou com o "Outro (especifique)" já copiado):
+    # muitos valores distintos com letras, fora das perguntas de nota
+    col_simples, _, grupos_texto, _ = planejar_tabelas(df)
+    candidatas = set(col_simples + [c for cols in grupos_texto.values() for c in cols])
+    livres = []
+    for col in df.columns:
+        if col not in candidatas:
+            continue
+        valores = frequencias_valores(df, col).index
+        if sum(isinstance(v, str) and any(c.isalpha() for c in v) for v in valores) >= min_distintos:
+            livres.append(col)
+    return livres
+
+
+def agrupar_textos_livres(df, log, caminho_mapa=None, similaridade_minima=0.85):
+    # variantes parecidas ("sao paulo", "São Paulo - SP") viram um único
+    # rótulo; o mapa fica em CSV por estudo para revisão manual
+    revisado = None
+    if caminho_mapa and os.path.exists(caminho_mapa):
+        revisado = pd.read_csv(caminho_mapa, dtype={"original": str, "canonico": str})
+
+    mapas = []
+    for col in colunas_texto_livre(df):
+        anteriores = None if revisado is None else revisado[revisado["coluna"] == col]
+        mapa = mapear_quase_duplicados(frequencias_valores(df, col), col, anteriores, similaridade_minima)
+        mapas.append(mapa)
+
+        destino = dict(zip(mapa["original"], mapa["canonico"]))
+        if isinstance(df, ContagemParcial):
+            df.reagrupar(col, destino)
+        else:
+            codigos, valores = pd.factorize(df[col], use_na_sentinel=True)
+            tabela = np.empty(len(valores) + 1, dtype=object)
+            tabela[:-1] = [destino.get(v, v) for v in valores]
+            tabela[-1] = np.nan
+            df[col] = pd.Series(tabela[codigos], index=df.index)
+
+    mapa = pd.concat(mapas, ignore_index=True) if mapas else pd.DataFrame(
+        columns=["coluna", "original", "canonico", "frequencia"]
+    )
+    if caminho_mapa:
+        os.makedirs(os.path.dirname(caminho_mapa) or ".", exist_ok=True)
+        mapa.to_csv(caminho_mapa, index=False)
+
+    n_juntados = int((mapa["original"] != mapa["canonico"]).sum())
+    log(f"🧷 Quase-duplicatas: {n_juntados} escritas agrupadas em {len(mapas)} colunas de texto livre.")
+    return df, mapa
+
+
+def termos_por_item(df, grupos_texto, pesos=None, top=10):
+    t = {}
+    for pergunta, cols in grupos_texto.items():
+        itens = {}
+        for col in cols:
+            item = col.split(" - ")[1].strip()
+            if pesos is not None:
+                vc = value_counts_ponderado(df[col], pesos)
+                valores, frequencias = vc.index, vc.to_numpy()
+            elif e_base_contada(df):
+                rotulos = df.rotulos_coluna(col)
+                presentes, contagens = df.contar(col)
+                manter = presentes >= 0
+                valores = [rotulos[c] for c in presentes[manter]]
+                frequencias = contagens[manter]
+            else:
+                vc = df[col].value_counts(sort=False)
+                valores, frequencias = vc.index, vc.to_numpy()
+            itens[item] = contar_termos(valores, frequencias, top=top)
+        t[pergunta] = itens
+    return t
+
+
+def termos_para_json(t_termos):
+    return {
+        pergunta: {item: tabela.to_dict(orient="records") for item, tabela in itens.items()}
+        for pergunta, itens in t_termos.items()
+    }
 
 
 # ------------------------------------------------------------
-# 7. FUNÇÕES DE GERAÇÃO DE TABELAS (SIMPLES, MULTI, MATRIZ TEXTO, MATRIZ NOTA)
+# 9. REGRAS DE LIMPEZA DECLARATIVAS (CONFIGURAÇÃO -> PLANO COMPILADO)
+# ------------------------------------------------------------
+
+PASTA_CONFIGURACOES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configuracoes")
+
+
+def carregar_configuracao(caminho=None):
+    caminho = caminho or os.path.join(PASTA_CONFIGURACOES, "padrao.json")
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+CONFIG_PADRAO = carregar_configuracao()
+
+
+def hash_configuracao(config):
+    texto = json.dumps(config, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _regex_termos(termos, minusculas=False):
+    if not termos:
+        return None
+    return re.compile("|".join(re.escape(t.lower() if minusculas else t) for t in termos))
+
+
+@lru_cache(maxsize=32)
+def _colunas_escala(regex_escala, colunas):
+    # classificação por esquema: poucos esquemas distintos por execução
+    return [c for c in colunas if regex_escala and regex_escala.search(c.lower())]
+
+
+class PlanoLimpeza:
+    """Configuração de limpeza compilada: cada lista de termos vira uma
+    única regex e a classificação das colunas é feita uma vez por esquema.
+    HTML e escala Likert rodam fundidos, numa só passada por coluna."""
+
+    def __init__(self, config):
+        self.config = config
+        self.hash = hash_configuracao(config)
+
+        filtro = config.get("filtro") or {}
+        self.coluna_filtro = filtro.get("coluna")
+        self.valores_removidos = list(filtro.get("remover_valores", []))
+        self.regex_remocao = _regex_termos(config.get("colunas_removidas", []))
+        self.regex_escala = _regex_termos((config.get("escalas") or {}).get("palavras_chave", []), minusculas=True)
+        self.mesclar_outro = config.get("mesclar_outro", True)
+        self.remover_html = config.get("remover_html", True)
+        self.normalizar_texto = config.get("normalizar_texto", True)
+        self.tags_ponderacao = list((config.get("ponderacao") or {}).get("tags", []))
+
+    def colunas_escala(self, colunas):
+        return _colunas_escala(self.regex_escala, tuple(colunas))
+
+    # ---------------- etapas ----------------
+
+    def filtrar(self, df, log):
+        return filtrar_respondentes_validos(df, log, self.coluna_filtro, self.valores_removidos)
+
+    def remover_colunas(self, df, log):
+        return limpar_colunas_indesejadas(df, log, self.regex_remocao)
+
+    def transformacoes(self, escala):
+        lista = []
+        if self.remover_html:
+            lista.append(TransformacaoColuna("remover_html", lambda col, tipo: tipo == "object", remove_html))
+        lista.append(TransformacaoColuna("limpar_likert", lambda col, tipo: col in escala, limpar_likert, numerica=True))
+        return lista
+
+    def limpar_colunas(self, df, log):
+        escala = set(self.colunas_escala(df.columns))
+        log(f"🔄 Limpeza Likert em {len(escala)} colunas...")
+        df, _ = passada_por_coluna(df, self.transformacoes(escala))
+        if self.remover_html:
+            log("🧽 Remoção de HTML aplicada às colunas de texto.")
+        log("✅ Limpeza de escalas concluída.")
+        return df
+
+    def etapas(self, filtrar=True, normalizar_texto=True):
+        etapas = []
+        if filtrar and self.coluna_filtro:
+            etapas.append(self.filtrar)
+        if self.regex_remocao:
+            etapas.append(self.remover_colunas)
+        if self.mesclar_outro:
+            etapas.append(mesclar_respostas_outro)
+        etapas.append(self.limpar_colunas)
+        if normalizar_texto and self.normalizar_texto:
+            etapas.append(normalizar_textos_abertos)
+        return etapas
+
+    def consulta(self, df, filtrar=True, normalizar_texto=True):
+        consulta = ConsultaLimpeza(df, self)
+        if filtrar and self.coluna_filtro:
+            consulta.filtrar_linhas(self.filtrar)
+        if self.regex_remocao:
+            consulta.remover_colunas(self.remover_colunas)
+        if self.mesclar_outro:
+            consulta.mesclar(mesclar_respostas_outro)
+
+        # a escala é decidida pelo nome, no esquema que sobra após remoções e junções
+        escala = _EscalaPreguicosa(self)
+        for transformacao in self.transformacoes(escala):
+            consulta.transformar(transformacao)
+
+        if normalizar_texto and self.normalizar_texto:
+            consulta.depois("normalizar_texto", normalizar_textos_abertos)
+        return consulta
+
+
+class _EscalaPreguicosa:
+    # "col in escala" resolvido pelo nome da coluna, sem precisar do esquema final
+    def __init__(self, plano):
+        self.plano = plano
+
+    def __contains__(self, col):
+        return bool(self.plano.regex_escala and self.plano.regex_escala.search(col.lower()))
+
+
+_PLANOS_COMPILADOS = {}
+
+
+def compilar_plano(config=None):
+    # config: None (padrão), caminho de um .json ou dicionário já carregado
+    if config is None:
+        config = CONFIG_PADRAO
+    elif isinstance(config, str):
+        config = carregar_configuracao(config)
+
+    chave = hash_configuracao(config)
+    if chave not in _PLANOS_COMPILADOS:
+        _PLANOS_COMPILADOS[chave] = PlanoLimpeza(config)
+    return _PLANOS_COMPILADOS[chave]
+
+
+# ------------------------------------------------------------
+# 10. EXECUÇÃO PREGUIÇOSA (PLANO DE CONSULTA COM FUSÃO DE ETAPAS)
+# ------------------------------------------------------------
+
+class TransformacaoColuna:
+    """Transformação valor a valor registrada por uma etapa; o seletor
+    decide, no esquema já resolvido, em quais colunas ela roda."""
+
+    def __init__(self, nome, seletor, funcao, numerica=False):
+        self.nome = nome
+        self.seletor = seletor
+        self.funcao = funcao
+        self.numerica = numerica
+
+
+def _compor(funcoes):
+    if len(funcoes) == 1:
+        return funcoes[0]
+
+    def composta(valor):
+        for funcao in funcoes:
+            valor = funcao(valor)
+        return valor
+    return composta
+
+
+def passada_por_coluna(df, transformacoes):
+    # cada coluna é lida uma única vez, com todas as transformações que a
+    # selecionam compostas numa só função (aplicada por valor distinto)
+    cadeias = defaultdict(list)
+    for col, tipo in zip(df.columns, df.dtypes):
+        escolhidas = tuple(t for t in transformacoes if t.seletor(col, tipo))
+        if escolhidas:
+            cadeias[escolhidas].append(col)
+
+    tempos = []
+    for cadeia, colunas in cadeias.items():
+        inicio = time.perf_counter()
+        funcao = _compor([t.funcao for t in cadeia])
+        numerica = any(t.numerica for t in cadeia)
+        for col in colunas:
+            novos = mapear_valores_distintos(df[col], funcao)
+            if numerica:
+                if novos is None:
+                    novos = df[col].to_numpy(dtype=object)
+                df[col] = pd.to_numeric(pd.Series(novos, index=df.index, dtype=object), errors="coerce")
+            elif novos is not None:
+                df[col] = novos
+        tempos.append((" -> ".join(t.nome for t in cadeia), len(colunas), time.perf_counter() - inicio))
+    return df, tempos
+
+
+class ConsultaLimpeza:
+    """Limpeza preguiçosa: as etapas só registram nós; coletar() roda os
+    nós de quadro (filtro, remoção, junção) na ordem registrada, depois as
+    transformações de coluna fundidas numa passada, medindo cada nó.
+    explicar() mostra o plano com os tempos da última execução."""
+
+    def __init__(self, df, plano):
+        self.df = df
+        self.plano = plano
+        self.nos_quadro = []
+        self.transformacoes = []
+        self.nos_finais = []
+        self.execucao = None
+
+    # ---------------- registro ----------------
+
+    def filtrar_linhas(self, etapa):
+        self.nos_quadro.append(("filtrar_linhas", etapa))
+        return self
+
+    def remover_colunas(self, etapa):
+        self.nos_quadro.append(("remover_colunas", etapa))
+        return self
+
+    def mesclar(self, etapa):
+        self.nos_quadro.append(("mesclar_outro", etapa))
+        return self
+
+    def transformar(self, transformacao):
+        self.transformacoes.append(transformacao)
+        return self
+
+    def depois(self, nome, etapa):
+        self.nos_finais.append((nome, etapa))
+        return self
+
+    # ---------------- execução ----------------
+
+    def coletar(self, log):
+        df = self.df
+        execucao = []
+        colunas_iniciais = df.shape[1]
+
+        for nome, etapa in self.nos_quadro:
+            inicio = time.perf_counter()
+            df = etapa(df, log)
+            execucao.append((nome, None, time.perf_counter() - inicio))
+        execucao.append(("colunas descartadas antes das transformações", colunas_iniciais - df.shape[1], None))
+
+        inicio = time.perf_counter()
+        df, tempos = passada_por_coluna(df, self.transformacoes)
+        execucao.append(("passada_por_coluna", sum(n for _, n, _ in tempos), time.perf_counter() - inicio))
+        execucao += [(f"  {cadeia}", n, t) for cadeia, n, t in tempos]
+
+        for nome, etapa in self.nos_finais:
+            inicio = time.perf_counter()
+            df = etapa(df, log)
+            execucao.append((nome, None, time.perf_counter() - inicio))
+
+        self.execucao = execucao
+        return df
+
+    def explicar(self):
+        linhas = [f"== plano de limpeza (config {self.plano.hash}) =="]
+        if self.execucao is None:
+            nos = [nome for nome, _ in self.nos_quadro]
+            nos += ["passada_por_coluna: " + " | ".join(t.nome for t in self.transformacoes)]
+            nos += [nome for nome, _ in self.nos_finais]
+            return "\n".join(linhas + [f"{i}. {nome}" for i, nome in enumerate(nos, 1)] + ["(ainda não executado)"])
+
+        for nome, n, segundos in self.execucao:
+            detalhe = "" if n is None else f" [{n} colunas]"
+            tempo = "" if segundos is None else f" {segundos * 1000:.1f} ms"
+            linhas.append(f"{nome}{detalhe}{tempo}")
+        return "\n".join(linhas)
+
+
+# ------------------------------------------------------------
+# 11. BASE CODIFICADA (CÓDIGOS INTEIROS + DICIONÁRIO DE RÓTULOS)
+# ------------------------------------------------------------
+
+def extrair_tag(rotulo):
+    if not isinstance(rotulo, str):
+        return None
+    tags = re.findall(r"#\w+", rotulo)
+    return tags[-1] if tags else None
+
+
+def _dtype_codigos(n_categorias):
+    if n_categorias < np.iinfo(np.int8).max:
+        return np.int8
+    if n_categorias < np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+class BaseCodificada:
+    """Pesquisa com colunas categóricas guardadas como códigos inteiros
+    pequenos (-1 = vazio) e um dicionário único de rótulos chaveado
+    pela tag '#codigo' de cada resposta."""
+
+    def __init__(self, indice, ordem, codigos, categorias, rotulos, numericas):
+        self.indice = indice
+        self.ordem = ordem
+        self.codigos = codigos
+        self.categorias = categorias
+        self.rotulos = rotulos
+        self.numericas = numericas
+
+    # ---------------- conversão ----------------
+
+    @classmethod
+    def de_dataframe(cls, df):
+        codigos = {}
+        categorias = {}
+        rotulos = {}
+        numericas = {}
+
+        for col in df.columns:
+            serie = df[col]
+
+            if serie.dtype != "object":
+                numericas[col] = serie.to_numpy(copy=True)
+                continue
+
+            cod, uniques = pd.factorize(serie, use_na_sentinel=True)
+            chaves = []
+            for valor in uniques:
+                chave = extrair_tag(valor)
+                if chave is None or rotulos.get(chave, valor) != valor:
+                    chave = sys.intern(valor) if isinstance(valor, str) else (type(valor).__name__, valor)
+                rotulos.setdefault(chave, valor)
+                chaves.append(chave)
+
+            codigos[col] = cod.astype(_dtype_codigos(len(chaves)))
+            categorias[col] = chaves
+
+        return cls(df.index.copy(), list(df.columns), codigos, categorias, rotulos, numericas)
+
+    def valores(self, col):
+        if col in self.numericas:
+            return self.numericas[col]
+        tabela = np.empty(len(self.categorias[col]) + 1, dtype=object)
+        tabela[:-1] = [self.rotulos[chave] for chave in self.categorias[col]]
+        tabela[-1] = np.nan
+        return tabela[self.codigos[col]]
+
+    def serie(self, col):
+        return pd.Series(self.valores(col), index=self.indice, name=col)
+
+    def para_dataframe(self):
+        return pd.DataFrame({col: self.serie(col) for col in self.ordem}, index=self.indice)
+
+    # ---------------- interface usada pelas tabelas ----------------
+
+    @property
+    def columns(self):
+        return self.ordem
+
+    def __len__(self):
+        return len(self.indice)
+
+    def __getitem__(self, col):
+        return self.serie(col)
+
+    def colunas_numericas(self):
+        return [
+            c for c in self.ordem
+            if c in self.numericas and (
+                np.issubdtype(self.numericas[c].dtype, np.integer)
+                or np.issubdtype(self.numericas[c].dtype, np.floating)
+            )
+        ]
+
+    def e_categorica(self, col):
+        return col in self.codigos
+
+    def e_numerica(self, col):
+        return col in self.numericas and pd.api.types.is_numeric_dtype(self.numericas[col])
+
+    def rotulos_coluna(self, col):
+        return [self.rotulos[chave] for chave in self.categorias[col]]
+
+    def contar(self, col):
+        return contar_codigos(self.codigos[col])
+
+    def contar_notas(self, col):
+        return self.serie(col).dropna().value_counts().sort_index()
+
+    # ---------------- memória ----------------
+
+    def memoria(self):
+        total = sum(a.nbytes for a in self.codigos.values())
+        total += sum(a.nbytes for a in self.numericas.values())
+        total += sum(sys.getsizeof(v) for v in self.rotulos.values())
+        total += sum(8 * len(c) for c in self.categorias.values())
+        total += self.indice.memory_usage(deep=True)
+        return total
+
+
+def e_base_contada(df):
+    return isinstance(df, (BaseCodificada, ContagemParcial))
+
+
+def relatorio_memoria(df, base):
+    bytes_df = int(df.memory_usage(deep=True).sum())
+    bytes_base = int(base.memoria())
+    return {
+        "dataframe_mb": round(bytes_df / 1024 ** 2, 2),
+        "base_codificada_mb": round(bytes_base / 1024 ** 2, 2),
+        "reducao_x": round(bytes_df / bytes_base, 1) if bytes_base else None,
+        "rotulos_unicos": len(base.rotulos),
+    }
+
+
+def contar_codigos(codigos):
+    # Contagem por código na ordem de primeira ocorrência (mesma ordem
+    # que o value_counts do pandas usa antes de ordenar).
+    presentes, primeira, contagens = np.unique(codigos, return_index=True, return_counts=True)
+    ordem = np.argsort(primeira, kind="stable")
+    return presentes[ordem], contagens[ordem]
+
+
+def value_counts_codificado(base, col, dropna=True, normalize=False, como_texto=False):
+    presentes, contagens = base.contar(col)
+    if dropna:
+        manter = presentes >= 0
+        presentes, contagens = presentes[manter], contagens[manter]
+
+    rotulos = base.rotulos_coluna(col)
+    valores = [rotulos[c] if c >= 0 else np.nan for c in presentes]
+
+    if como_texto:
+        # equivalente a .astype(str).str.strip(): rótulos que viram o mesmo
+        # texto são somados, mantendo a primeira ocorrência
+        somas = {}
+        for valor, n in zip(valores, contagens):
+            chave = str(valor).strip()
+            somas[chave] = somas.get(chave, 0) + int(n)
+        valores = list(somas.keys())
+        contagens = np.array(list(somas.values()), dtype=np.int64)
+
+    resultado = pd.Series(
+        np.asarray(contagens, dtype=np.int64),
+        index=pd.Index(valores, dtype=object, name=col),
+        name="count",
+    ).sort_values(ascending=False)
+
+    if normalize:
+        resultado = resultado / contagens.sum()
+        resultado.name = "proportion"
+
+    return resultado
+
+
+# ------------------------------------------------------------
+# 12. FUNÇÕES DE GERAÇÃO DE TABELAS (SIMPLES, MULTI, MATRIZ TEXTO, MATRIZ NOTA)
 # ------------------------------------------------------------
 
 def identificar_colunas_simples(df):
     col_response = [c for c in df.columns if "response" in c.lower()]
     col_not_multi = [c for c in df.columns if " - " not in c]
-    numericas = df.select_dtypes(include=["int", "float"]).columns.tolist()
+    if e_base_contada(df):
+        numericas = df.colunas_numericas()
+    else:
+        numericas = df.select_dtypes(include=["int", "float"]).columns.tolist()
     colunas = list(set(col_response + col_not_multi))
     return [c for c in colunas if c not in numericas]
 
@@ -205,6 +1201,19 @@ def classificar_perguntas(df, grupos):
 
     for pergunta, cols in grupos.items():
         exemplo = cols[0]
+
+        if e_base_contada(df):
+            if df.e_numerica(exemplo):
+                grupos_nota[pergunta] = cols
+                continue
+            valores = [str(v).strip() for v in df.rotulos_coluna(exemplo)]
+            marca_ex = exemplo.split(" - ")[1].strip()
+            if marca_ex in valores:
+                grupos_multi[pergunta] = cols
+            else:
+                grupos_texto[pergunta] = cols
+            continue
+
         serie = df[exemplo].dropna()
 
         if pd.api.types.is_numeric_dtype(serie):
@@ -222,11 +1231,41 @@ def classificar_perguntas(df, grupos):
     return grupos_multi, grupos_texto, grupos_nota
 
 
-def tabelas_simples(df, colunas):
+def value_counts_ponderado(serie, pesos, dropna=True, normalize=False):
+    pesos = np.asarray(pesos, dtype=float)
+    if dropna:
+        manter = serie.notna().to_numpy()
+        serie, pesos = serie[manter], pesos[manter]
+
+    codigos, uniques = pd.factorize(serie, use_na_sentinel=False)
+    somas = np.bincount(codigos, weights=pesos, minlength=len(uniques))
+    resultado = pd.Series(
+        somas, index=pd.Index(uniques, name=serie.name), name="count"
+    ).sort_values(ascending=False)
+
+    if normalize:
+        resultado = resultado / somas.sum()
+        resultado.name = "proportion"
+    return resultado
+
+
+def _absoluta_ponderada(somas):
+    return somas.round().astype(np.int64)
+
+
+def tabelas_simples(df, colunas, pesos=None):
     t = {}
     for col in colunas:
-        abs_ = df[col].value_counts(dropna=False)
-        rel_ = df[col].value_counts(normalize=True, dropna=False) * 100
+        if pesos is not None:
+            somas = value_counts_ponderado(df[col], pesos, dropna=False)
+            abs_ = _absoluta_ponderada(somas)
+            rel_ = (somas / somas.sum() * 100).rename("proportion")
+        elif e_base_contada(df) and df.e_categorica(col):
+            abs_ = value_counts_codificado(df, col, dropna=False)
+            rel_ = value_counts_codificado(df, col, dropna=False, normalize=True) * 100
+        else:
+            abs_ = df[col].value_counts(dropna=False)
+            rel_ = df[col].value_counts(normalize=True, dropna=False) * 100
         t[col] = pd.DataFrame({
             "Frequência Absoluta": abs_,
             "Frequência Relativa (%)": rel_.round(1)
@@ -234,9 +1273,9 @@ def tabelas_simples(df, colunas):
     return t
 
 
-def tabelas_multiresposta(df, grupos):
+def tabelas_multiresposta(df, grupos, pesos=None):
     t = {}
-    total = len(df)
+    total = len(df) if pesos is None else float(np.sum(pesos))
 
     for pergunta, cols in grupos.items():
         marcas = []
@@ -245,8 +1284,16 @@ def tabelas_multiresposta(df, grupos):
 
         for col in cols:
             marca = col.split(" - ")[1].strip()
-            freq_abs = (df[col] == marca).sum()
-            freq_rel = (freq_abs / total * 100) if total else 0
+            if pesos is not None:
+                soma = float(np.asarray(pesos, dtype=float)[(df[col] == marca).to_numpy()].sum())
+                freq_abs = np.int64(round(soma))
+            elif e_base_contada(df) and df.e_categorica(col):
+                codigo = [i for i, v in enumerate(df.rotulos_coluna(col)) if v == marca]
+                presentes, contagens = df.contar(col)
+                freq_abs = np.int64(contagens[presentes == codigo[0]].sum()) if codigo else np.int64(0)
+            else:
+                freq_abs = (df[col] == marca).sum()
+            freq_rel = ((freq_abs if pesos is None else soma) / total * 100) if total else 0
 
             marcas.append(marca)
             abs_list.append(freq_abs)
@@ -260,15 +1307,27 @@ def tabelas_multiresposta(df, grupos):
     return t
 
 
-def tabelas_matriz_texto(df, grupos):
+def tabelas_matriz_texto(df, grupos, pesos=None):
     t = {}
     for pergunta, cols in grupos.items():
         meios = {}
         for col in cols:
             meio = col.split(" - ")[1].strip()
-            serie = df[col].dropna().astype(str).str.strip()
-            abs_ = serie.value_counts()
-            rel_ = (serie.value_counts(normalize=True) * 100).round(1)
+            if pesos is not None:
+                serie = df[col]
+                manter = serie.notna().to_numpy()
+                somas = value_counts_ponderado(
+                    serie[manter].astype(str).str.strip(), np.asarray(pesos)[manter]
+                )
+                abs_ = _absoluta_ponderada(somas)
+                rel_ = (somas / somas.sum() * 100).rename("proportion").round(1)
+            elif e_base_contada(df) and df.e_categorica(col):
+                abs_ = value_counts_codificado(df, col, como_texto=True)
+                rel_ = (value_counts_codificado(df, col, como_texto=True, normalize=True) * 100).round(1)
+            else:
+                serie = df[col].dropna().astype(str).str.strip()
+                abs_ = serie.value_counts()
+                rel_ = (serie.value_counts(normalize=True) * 100).round(1)
             meios[meio] = pd.DataFrame({
                 "Frequência Absoluta": abs_,
                 "Frequência Relativa (%)": rel_
@@ -277,15 +1336,23 @@ def tabelas_matriz_texto(df, grupos):
     return t
 
 
-def tabelas_matriz_nota(df, grupos):
+def tabelas_matriz_nota(df, grupos, pesos=None):
     t = {}
     for pergunta, cols in grupos.items():
         marcas = {}
         for col in cols:
             marca = col.split(" - ")[1].strip()
-            serie = df[col].dropna()
-            abs_ = serie.value_counts().sort_index()
-            rel_ = (serie.value_counts(normalize=True).sort_index() * 100).round(1)
+            if pesos is not None:
+                somas = value_counts_ponderado(df[col], pesos).sort_index()
+                abs_ = _absoluta_ponderada(somas)
+                rel_ = (somas / somas.sum() * 100).rename("proportion").round(1)
+            elif e_base_contada(df) and df.e_numerica(col):
+                abs_ = df.contar_notas(col)
+                rel_ = (abs_ / abs_.sum() * 100).rename("proportion").round(1)
+            else:
+                serie = df[col].dropna()
+                abs_ = serie.value_counts().sort_index()
+                rel_ = (serie.value_counts(normalize=True).sort_index() * 100).round(1)
             marcas[marca] = pd.DataFrame({
                 "Frequência Absoluta": abs_,
                 "Frequência Relativa (%)": rel_
@@ -294,22 +1361,38 @@ def tabelas_matriz_nota(df, grupos):
     return t
 
 
-def gerar_todas_as_tabelas(df):
+def planejar_tabelas(df):
     col_simples = identificar_colunas_simples(df)
-    t_simples = tabelas_simples(df, col_simples)
 
     col_hifen = encontrar_colunas_hifen(df)
     grupos = agrupar_por_pergunta(col_hifen)
     grupos_multi, grupos_texto, grupos_nota = classificar_perguntas(df, grupos)
 
-    t_multi = tabelas_multiresposta(df, grupos_multi)
-    t_matriz = tabelas_matriz_texto(df, grupos_texto)
-    t_nota = tabelas_matriz_nota(df, grupos_nota)
+    return col_simples, grupos_multi, grupos_texto, grupos_nota
+
+
+def gerar_todas_as_tabelas(df, n_processos=1, pesos=None):
+    if pesos is not None and isinstance(df, ContagemParcial):
+        raise ValueError("Tabelas ponderadas precisam dos respondentes linha a linha, não de contagens parciais.")
+
+    if n_processos > 1 and pesos is None:
+        return gerar_todas_as_tabelas_paralelo(df, n_processos)
+
+    col_simples, grupos_multi, grupos_texto, grupos_nota = planejar_tabelas(df)
+
+    t_simples = tabelas_simples(df, col_simples, pesos)
+    t_multi = tabelas_multiresposta(df, grupos_multi, pesos)
+    t_matriz = tabelas_matriz_texto(df, grupos_texto, pesos)
+    t_nota = tabelas_matriz_nota(df, grupos_nota, pesos)
 
     return t_simples, t_multi, t_matriz, t_nota
 
 
-def gerar_json_todas_as_tabelas(t_simples, t_multi, t_matriz, t_nota):
+def gerar_json_todas_as_tabelas(t_simples, t_multi, t_matriz, t_nota, extras=None):
+    return json.dumps(tabelas_para_dict(t_simples, t_multi, t_matriz, t_nota, extras), ensure_ascii=False, indent=2)
+
+
+def tabelas_para_dict(t_simples, t_multi, t_matriz, t_nota, extras=None):
 
     resultado = {
         "perguntas_simples": [],
@@ -352,14 +1435,1338 @@ def gerar_json_todas_as_tabelas(t_simples, t_multi, t_matriz, t_nota):
             })
         resultado["matriz_nota"].append(bloco)
 
-    return json.dumps(resultado, ensure_ascii=False, indent=2)
+    for chave, valor in (extras or {}).items():
+        resultado[chave] = valor
+
+    return resultado
 
 
 # ------------------------------------------------------------
-# 8. PIPELINE PRINCIPAL
+# 13. ÍNDICE BITMAP E TABULAÇÃO FILTRADA
 # ------------------------------------------------------------
 
-def executar_etl(file_path):
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def contar_bits(bitmap):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(bitmap).sum(dtype=np.int64))
+    return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+
+def primeiro_bit(bitmap):
+    bytes_ativos = np.flatnonzero(bitmap)
+    if not len(bytes_ativos):
+        return -1
+    b = bytes_ativos[0]
+    return int(b * 8 + np.unpackbits(bitmap[b:b + 1]).argmax())
+
+
+class IndiceBitmap:
+    """Um bitmap (np.packbits) por (pergunta, resposta) sobre os respondentes
+    de uma BaseCodificada. Filtros E/OU/NÃO viram &, | e nao() nos bitmaps."""
+
+    def __init__(self, base, max_valores_numericos=50, max_categorias=200):
+        self.base = base
+        self.n = len(base)
+        self.universo = np.packbits(np.ones(self.n, dtype=bool))
+        self.max_categorias = max_categorias
+        self.bitmaps = {}
+        self.valores_numericos = {}
+
+        for col, valores in base.numericas.items():
+            if not pd.api.types.is_numeric_dtype(valores):
+                continue
+            distintos = pd.unique(valores[~pd.isna(valores)])
+            if len(distintos) > max_valores_numericos:
+                continue
+            self.valores_numericos[col] = {v: np.packbits(valores == v) for v in distintos}
+
+    def tem_bitmaps(self, col):
+        # colunas com muitas categorias (texto livre, ids) ficam sem bitmap
+        return col in self.base.codigos and len(self.base.categorias[col]) <= self.max_categorias
+
+    def bitmaps_coluna(self, col):
+        # montados sob demanda, na primeira vez que a coluna é filtrada/contada
+        if col not in self.bitmaps:
+            codigos = self.base.codigos[col]
+            self.bitmaps[col] = {
+                int(c): np.packbits(codigos == c)
+                for c in range(-1, len(self.base.categorias[col]))
+            }
+        return self.bitmaps[col]
+
+    def bitmap_codigos(self, col, codigos):
+        if self.tem_bitmaps(col):
+            resultado = self.nenhum()
+            bitmaps = self.bitmaps_coluna(col)
+            for c in codigos:
+                resultado |= bitmaps[c]
+            return resultado
+        return np.packbits(np.isin(self.base.codigos[col], codigos))
+
+    def todos(self):
+        return self.universo.copy()
+
+    def nenhum(self):
+        return np.zeros_like(self.universo)
+
+    def nao(self, bitmap):
+        return ~bitmap & self.universo
+
+    def resposta(self, col, *valores):
+        resultado = self.nenhum()
+        if col in self.valores_numericos:
+            for v in valores:
+                if v in self.valores_numericos[col]:
+                    resultado |= self.valores_numericos[col][v]
+            return resultado
+
+        rotulos = self.base.rotulos_coluna(col)
+        return self.bitmap_codigos(col, [rotulos.index(v) for v in valores if v in rotulos])
+
+    def vazio(self, col):
+        return self.bitmap_codigos(col, [-1])
+
+    def filtrar(self, selecoes):
+        # {coluna: [respostas]} -> OU dentro da coluna, E entre colunas
+        filtro = self.todos()
+        for col, valores in selecoes.items():
+            if valores:
+                filtro &= self.resposta(col, *valores)
+        return filtro
+
+    def contar(self, bitmap):
+        return contar_bits(bitmap)
+
+
+class BaseFiltrada(BaseCodificada):
+    """Visão de uma BaseCodificada restrita aos respondentes de um filtro
+    bitmap. As contagens saem de popcount(bitmap_resposta & filtro), sem
+    copiar os códigos."""
+
+    def __init__(self, indice_bitmap, filtro):
+        base = indice_bitmap.base
+        super().__init__(base.indice, base.ordem, base.codigos, base.categorias, base.rotulos, base.numericas)
+        self.indice_bitmap = indice_bitmap
+        self.filtro = filtro
+        self.posicoes = np.flatnonzero(np.unpackbits(filtro, count=indice_bitmap.n))
+        self._contagens = {}
+
+    def __len__(self):
+        return len(self.posicoes)
+
+    def serie(self, col):
+        return pd.Series(self.valores(col)[self.posicoes], index=self.indice[self.posicoes], name=col)
+
+    def contar(self, col):
+        if col in self._contagens:
+            return self._contagens[col]
+
+        if not self.indice_bitmap.tem_bitmaps(col):
+            self._contagens[col] = contar_codigos(self.codigos[col][self.posicoes])
+            return self._contagens[col]
+
+        presentes, primeiras, contagens = [], [], []
+        for codigo, bitmap in self.indice_bitmap.bitmaps_coluna(col).items():
+            cruzado = bitmap & self.filtro
+            primeira = primeiro_bit(cruzado)
+            if primeira < 0:
+                continue
+            presentes.append(codigo)
+            primeiras.append(primeira)
+            contagens.append(contar_bits(cruzado))
+
+        ordem = np.argsort(primeiras, kind="stable")
+        resultado = np.array(presentes, dtype=np.int64)[ordem], np.array(contagens, dtype=np.int64)[ordem]
+        self._contagens[col] = resultado
+        return resultado
+
+    def contar_notas(self, col):
+        if col not in self.indice_bitmap.valores_numericos:
+            return super().contar_notas(col)
+        valores, contagens = [], []
+        for valor, bitmap in self.indice_bitmap.valores_numericos[col].items():
+            n = contar_bits(bitmap & self.filtro)
+            if n:
+                valores.append(valor)
+                contagens.append(n)
+        return pd.Series(contagens, index=pd.Index(valores, name=col), name="count", dtype=np.int64).sort_index()
+
+
+def gerar_tabelas_filtradas(indice_bitmap, filtro, pesos=None):
+    filtrada = BaseFiltrada(indice_bitmap, filtro)
+    # pesos: um por respondente da base inteira, recortados pelo filtro
+    return gerar_todas_as_tabelas(filtrada, pesos=None if pesos is None else np.asarray(pesos)[filtrada.posicoes])
+
+
+def tabelas_por_onda(df, pesos=None, coluna=COLUNA_ONDA):
+    # as mesmas tabelas do total, só com os respondentes de cada onda
+    if isinstance(df, BaseCodificada):
+        indice = IndiceBitmap(df)
+        resultado = {
+            onda: gerar_tabelas_filtradas(indice, indice.resposta(coluna, onda), pesos)
+            for onda in df.rotulos_coluna(coluna)
+        }
+    else:
+        ondas = df[coluna]
+        resultado = {
+            onda: gerar_todas_as_tabelas(
+                df[(ondas == onda).to_numpy()],
+                pesos=None if pesos is None else pesos[(ondas == onda).to_numpy()],
+            )
+            for onda in ondas.dropna().unique()
+        }
+
+    for t_simples, _, _, _ in resultado.values():
+        t_simples.pop(coluna, None)
+    return resultado
+
+
+# ------------------------------------------------------------
+# 14. TABULAÇÃO PARALELA (POOL DE PROCESSOS + SNAPSHOT MEMMAP)
+# ------------------------------------------------------------
+
+def salvar_snapshot(base, pasta):
+    # Cada coluna vira um .npy; os workers abrem com mmap e compartilham
+    # as páginas do sistema operacional em vez de receber a base por pickle.
+    arquivos = {}
+    for i, col in enumerate(base.ordem):
+        origem = base.codigos if col in base.codigos else base.numericas
+        nome = f"c{i}.npy"
+        np.save(os.path.join(pasta, nome), np.ascontiguousarray(origem[col]))
+        arquivos[col] = nome
+
+    meta = {
+        "indice": base.indice,
+        "ordem": base.ordem,
+        "categorias": base.categorias,
+        "rotulos": base.rotulos,
+        "arquivos": arquivos,
+    }
+    with open(os.path.join(pasta, "meta.pkl"), "wb") as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def abrir_snapshot(pasta):
+    with open(os.path.join(pasta, "meta.pkl"), "rb") as f:
+        meta = pickle.load(f)
+
+    codigos = {}
+    numericas = {}
+    for col, nome in meta["arquivos"].items():
+        arr = np.load(os.path.join(pasta, nome), mmap_mode="r")
+        if col in meta["categorias"]:
+            codigos[col] = arr
+        else:
+            numericas[col] = arr
+
+    return BaseCodificada(meta["indice"], meta["ordem"], codigos, meta["categorias"], meta["rotulos"], numericas)
+
+
+_BASE_WORKER = None
+
+
+def _iniciar_worker(pasta):
+    global _BASE_WORKER
+    _BASE_WORKER = abrir_snapshot(pasta)
+
+
+def _tabular_lote(lote):
+    base = _BASE_WORKER
+    resultado = []
+    for tipo, chave, cols in lote:
+        if tipo == "simples":
+            tabela = tabelas_simples(base, [chave])[chave]
+        elif tipo == "multi":
+            tabela = tabelas_multiresposta(base, {chave: cols})[chave]
+        elif tipo == "texto":
+            tabela = tabelas_matriz_texto(base, {chave: cols})[chave]
+        else:
+            tabela = tabelas_matriz_nota(base, {chave: cols})[chave]
+        resultado.append((tipo, chave, tabela))
+    return resultado
+
+
+def gerar_todas_as_tabelas_paralelo(df, n_processos=None, lotes_por_processo=4):
+    base = df if isinstance(df, BaseCodificada) else BaseCodificada.de_dataframe(df)
+    n_processos = n_processos or os.cpu_count() or 1
+
+    col_simples, grupos_multi, grupos_texto, grupos_nota = planejar_tabelas(base)
+
+    tarefas = [("simples", col, None) for col in col_simples]
+    tarefas += [("multi", p, cols) for p, cols in grupos_multi.items()]
+    tarefas += [("texto", p, cols) for p, cols in grupos_texto.items()]
+    tarefas += [("nota", p, cols) for p, cols in grupos_nota.items()]
+
+    n_lotes = max(1, min(len(tarefas), n_processos * lotes_por_processo))
+    lotes = [tarefas[i::n_lotes] for i in range(n_lotes)]
+
+    saidas = {"simples": {}, "multi": {}, "texto": {}, "nota": {}}
+    with tempfile.TemporaryDirectory(prefix="ilumeo_snapshot_") as pasta:
+        salvar_snapshot(base, pasta)
+        with ProcessPoolExecutor(max_workers=n_processos, initializer=_iniciar_worker, initargs=(pasta,)) as pool:
+            for parcial in pool.map(_tabular_lote, lotes):
+                for tipo, chave, tabela in parcial:
+                    saidas[tipo][chave] = tabela
+
+    # mesma ordem de chaves da execução serial
+    t_simples = {col: saidas["simples"][col] for col in col_simples}
+    t_multi = {p: saidas["multi"][p] for p in grupos_multi}
+    t_matriz = {p: saidas["texto"][p] for p in grupos_texto}
+    t_nota = {p: saidas["nota"][p] for p in grupos_nota}
+
+    return t_simples, t_multi, t_matriz, t_nota
+
+
+def gerar_pesquisa_sintetica(n_respondentes=2000, n_colunas=5000, seed=42):
+    rng = np.random.default_rng(seed)
+    colunas = {}
+    marcas = [f"Marca {i}" for i in range(10)]
+    i = 0
+    while len(colunas) < n_colunas:
+        tipo = i % 4
+        if tipo == 0:
+            opcoes = np.array([f"Opção {k} #op{i}_{k}" for k in range(6)] + [np.nan], dtype=object)
+            colunas[f"Pergunta {i} #p{i} - Response"] = opcoes[rng.integers(0, len(opcoes), n_respondentes)]
+        elif tipo == 1:
+            for m in marcas:
+                marcou = np.full(n_respondentes, np.nan, dtype=object)
+                marcou[rng.random(n_respondentes) < 0.3] = m
+                colunas[f"Quais marcas você conhece? #p{i} - {m}"] = marcou
+        elif tipo == 2:
+            freq = np.array(["Nunca", "Raramente", "Às vezes", "Sempre", np.nan], dtype=object)
+            for m in marcas:
+                colunas[f"Com que frequência você usa? #p{i} - {m}"] = freq[rng.integers(0, len(freq), n_respondentes)]
+        else:
+            for m in marcas:
+                notas = rng.integers(0, 11, n_respondentes).astype(float)
+                notas[rng.random(n_respondentes) < 0.1] = np.nan
+                colunas[f"Que nota você dá? #p{i} - {m}"] = notas
+        i += 1
+
+    nomes = list(colunas)[:n_colunas]
+    return pd.DataFrame({c: colunas[c] for c in nomes})
+
+
+def benchmark_tabulacao_paralela(log, n_respondentes=2000, n_colunas=5000, max_processos=None):
+    # mais processos que núcleos só mede a disputa pela CPU, não o paralelismo
+    nucleos = os.cpu_count() or 1
+    log(f"🖥️ os.cpu_count() = {nucleos}")
+    if max_processos and max_processos > nucleos:
+        log(f"⚠️ {max_processos} processos pedidos; medindo só até {nucleos}.")
+    max_processos = min(max_processos or nucleos, nucleos)
+    base = BaseCodificada.de_dataframe(gerar_pesquisa_sintetica(n_respondentes, n_colunas))
+
+    inicio = time.perf_counter()
+    gerar_todas_as_tabelas(base)
+    serial = time.perf_counter() - inicio
+    log(f"⏱️ Serial: {serial:.2f}s ({n_colunas} colunas, {n_respondentes} respondentes)")
+
+    linhas = [{"processos": 1, "segundos": round(serial, 3), "speedup": 1.0}]
+    for n in range(2, max_processos + 1):
+        inicio = time.perf_counter()
+        gerar_todas_as_tabelas(base, n_processos=n)
+        tempo = time.perf_counter() - inicio
+        linhas.append({"processos": n, "segundos": round(tempo, 3), "speedup": round(serial / tempo, 2)})
+        log(f"⏱️ {n} processos: {tempo:.2f}s ({serial / tempo:.2f}x)")
+    if max_processos == 1:
+        log("⚠️ Um núcleo só: sem tamanhos de pool para comparar com o serial.")
+
+    return pd.DataFrame(linhas)
+
+
+# ------------------------------------------------------------
+# 15. CONTAGENS PARCIAIS (TABULAÇÃO EM BLOCOS E JUNÇÃO EXATA)
+# ------------------------------------------------------------
+
+class ContagemParcial:
+    """Frequências de um bloco de linhas: para cada coluna, valor ->
+    [contagem, primeira linha]. Blocos consecutivos se juntam somando as
+    contagens, e as tabelas geradas a partir da junção são idênticas às do
+    DataFrame inteiro (a primeira ocorrência preserva a ordem do
+    value_counts). O vazio é guardado com a chave None."""
+
+    def __init__(self, n_linhas, ordem, contagens, dtypes):
+        self.n_linhas = n_linhas
+        self.ordem = ordem
+        self.contagens = contagens
+        self.dtypes = dtypes
+
+    @classmethod
+    def de_dataframe(cls, df):
+        contagens = {}
+        dtypes = {}
+        for col in df.columns:
+            serie = df[col]
+            cod, uniques = pd.factorize(serie, use_na_sentinel=True)
+            presentes, primeira, n = np.unique(cod, return_index=True, return_counts=True)
+
+            valores = {}
+            for c, p, k in zip(presentes.tolist(), primeira.tolist(), n.tolist()):
+                valores[None if c < 0 else uniques[c]] = [k, p]
+            contagens[col] = valores
+
+            # blocos sem nenhuma resposta não decidem o tipo da coluna
+            dtypes[col] = serie.dtype if len(valores) > (None in valores) else None
+
+        return cls(len(df), list(df.columns), contagens, dtypes)
+
+    def juntar(self, outra):
+        # 'outra' vem depois deste bloco: as posições dela são deslocadas
+        ordem = self.ordem + [c for c in outra.ordem if c not in self.contagens]
+        contagens = {}
+        dtypes = {}
+        for col in ordem:
+            valores = {k: list(v) for k, v in self.contagens.get(col, {}).items()}
+            for k, (n, p) in outra.contagens.get(col, {}).items():
+                if k in valores:
+                    valores[k][0] += n
+                else:
+                    valores[k] = [n, p + self.n_linhas]
+            contagens[col] = valores
+
+            tipos = [t for t in (self.dtypes.get(col), outra.dtypes.get(col)) if t is not None]
+            dtypes[col] = _juntar_dtypes(tipos)
+
+        return ContagemParcial(self.n_linhas + outra.n_linhas, ordem, contagens, dtypes)
+
+    def copiar(self):
+        contagens = {col: {k: list(v) for k, v in valores.items()} for col, valores in self.contagens.items()}
+        return ContagemParcial(self.n_linhas, list(self.ordem), contagens, dict(self.dtypes))
+
+    def reagrupar(self, col, destino):
+        # destino: rótulo -> novo rótulo; as contagens se somam e a posição
+        # do grupo é a da primeira variante que apareceu
+        valores = {}
+        for k, (n, p) in self.contagens[col].items():
+            novo = k if k is None else destino.get(k, k)
+            if novo in valores:
+                valores[novo] = [valores[novo][0] + n, min(valores[novo][1], p)]
+            else:
+                valores[novo] = [n, p]
+        self.contagens[col] = valores
+
+    def unificar_variantes(self, cols):
+        # mesma regra do DataFrame: a opção fechada ou, sem ela, a escrita
+        # mais frequente representa o grupo (empate: a que apareceu primeiro)
+        unificadas = 0
+        for col in cols:
+            grupos = defaultdict(list)
+            for k, (n, p) in self.contagens[col].items():
+                if k is not None:
+                    grupos[chave_texto(k)].append((k, n, p))
+            fechadas = opcoes_fechadas(frequencias_valores(self, col))
+
+            destino = {}
+            for variantes in grupos.values():
+                canonico = min(variantes, key=lambda v: (v[0] not in fechadas, -v[1], v[2]))[0]
+                for k, _, _ in variantes:
+                    destino[k] = k if k in fechadas else canonico
+                    unificadas += destino[k] != k
+            self.reagrupar(col, destino)
+        return unificadas
+
+    # ---------------- interface usada pelas tabelas ----------------
+
+    @property
+    def columns(self):
+        return self.ordem
+
+    def __len__(self):
+        return self.n_linhas
+
+    def dtype(self, col):
+        dtype = self.dtypes[col]
+        if dtype is None:
+            return np.dtype("float64")
+        if np.issubdtype(dtype, np.integer) and None in self.contagens[col]:
+            # como no DataFrame inteiro: inteiro com vazio vira float
+            return np.dtype("float64")
+        return dtype
+
+    def e_numerica(self, col):
+        return pd.api.types.is_numeric_dtype(self.dtype(col))
+
+    def e_categorica(self, col):
+        return not self.e_numerica(col)
+
+    def colunas_numericas(self):
+        return [
+            c for c in self.ordem
+            if np.issubdtype(self.dtype(c), np.integer) or np.issubdtype(self.dtype(c), np.floating)
+        ]
+
+    def _ordenados(self, col):
+        return sorted(self.contagens[col].items(), key=lambda kv: kv[1][1])
+
+    def rotulos_coluna(self, col):
+        return [k for k, _ in self._ordenados(col) if k is not None]
+
+    def contar(self, col):
+        presentes, contagens = [], []
+        codigo = 0
+        for k, (n, _) in self._ordenados(col):
+            if k is None:
+                presentes.append(-1)
+            else:
+                presentes.append(codigo)
+                codigo += 1
+            contagens.append(n)
+        return np.array(presentes, dtype=np.int64), np.array(contagens, dtype=np.int64)
+
+    def contar_notas(self, col):
+        itens = [(k, n) for k, (n, _) in self.contagens[col].items() if k is not None]
+        return pd.Series(
+            [n for _, n in itens],
+            index=pd.Index([k for k, _ in itens], dtype=self.dtype(col), name=col),
+            name="count",
+            dtype=np.int64,
+        ).sort_index()
+
+
+def _juntar_dtypes(tipos):
+    if not tipos:
+        return None
+    if any(t == object for t in tipos):
+        return np.dtype(object)
+    return np.result_type(*tipos)
+
+
+def textualizar_mistas(parcial, config=None):
+    # um bloco em que a coluna só trazia números é lido como numérico e
+    # escapa do remover_html; no arquivo inteiro a coluna é texto e esses
+    # números também viram texto
+    if not compilar_plano(config).remover_html:
+        return parcial
+    for col in parcial.ordem:
+        if parcial.dtypes[col] != object:
+            continue
+        destino = {
+            k: remove_html(int(k) if isinstance(k, float) and k.is_integer() else k)
+            for k in parcial.contagens[col] if k is not None and not isinstance(k, str)
+        }
+        if destino:
+            parcial.reagrupar(col, destino)
+    return parcial
+
+
+def limpar_dados(df, log, filtrar=True, normalizar_texto=True, medir_memoria=False, config=None,
+                 explicar=False):
+    # copy-on-write só na limpeza: as etapas alteram o mesmo DataFrame e só copiam a coluna que mudam
+    with pd.option_context("mode.copy_on_write", True):
+        plano = compilar_plano(config)
+        if explicar:
+            consulta = plano.consulta(df, filtrar, normalizar_texto)
+            df = consulta.coletar(log)
+            log(consulta.explicar())
+            return df
+        return executar_etapas(df, plano.etapas(filtrar, normalizar_texto), log, medir_memoria)
+
+
+def tamanho_dataframe(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def executar_etapas(df, etapas, log, medir_memoria=False):
+    # as etapas alteram o mesmo DataFrame; com medir_memoria, o pico de cada
+    # uma (DataFrame de entrada + temporários alocados) é comparado com a base bruta
+    with pd.option_context("mode.copy_on_write", True):
+        if not medir_memoria:
+            for etapa in etapas:
+                df = etapa(df, log)
+            return df
+
+        bruto = tamanho_dataframe(df)
+        ja_medindo = tracemalloc.is_tracing()
+        if not ja_medindo:
+            tracemalloc.start()
+        try:
+            for etapa in etapas:
+                entrada = tamanho_dataframe(df)
+                tracemalloc.reset_peak()
+                inicio = tracemalloc.get_traced_memory()[0]
+                df = etapa(df, log)
+                pico = entrada + max(tracemalloc.get_traced_memory()[1] - inicio, 0)
+                log(f"📏 {etapa.__name__}: pico de {pico / 1e6:.1f} MB ({pico / bruto:.2f}x a base bruta).")
+        finally:
+            if not ja_medindo:
+                tracemalloc.stop()
+        return df
+
+
+def _limpar_e_contar_bloco(bloco, config=None):
+    # as variantes de texto são unificadas depois da junção, sobre as contagens
+    return ContagemParcial.de_dataframe(limpar_dados(bloco, lambda msg: None, normalizar_texto=False, config=config))
+
+
+def iterar_blocos(path, tamanho_bloco, log):
+    entrada = abrir_entrada(path)
+    if entrada.e_csv:
+        # tudo como texto: a inferência de tipo por bloco mudaria conforme o
+        # tamanho do bloco (e o limpar_likert espera texto)
+        fonte = entrada.abrir()
+        leitor = pd.read_csv(fonte, header=[0, 1], chunksize=tamanho_bloco, dtype=str, **formato_csv(fonte))
+        for bloco in leitor:
+            bloco.columns = padronizar_cabecalhos(bloco.columns)
+            yield bloco
+        return
+
+    if entrada.formato in (".xlsx", ".xlsm"):
+        try:
+            yield from iterar_blocos_planilha(entrada.abrir(), tamanho_bloco)
+        except Exception as e:
+            log(f"❌ Erro ao processar arquivo: {e}")
+        return
+
+    df = carregar_e_padronizar_dados(entrada, log)
+    if df is None:
+        return
+    for inicio in range(0, len(df), tamanho_bloco):
+        yield df.iloc[inicio:inicio + tamanho_bloco].copy()
+
+
+def _valor_celula(valor):
+    # mesma conversão do read_excel: número inteiro guardado como float vira int
+    return int(valor) if isinstance(valor, float) and valor.is_integer() else valor
+
+
+def iterar_blocos_planilha(fonte, tamanho_bloco, aba=0):
+    # openpyxl em modo read_only lê a planilha em streaming: só o bloco atual
+    # de linhas fica em memória, qualquer que seja o tamanho do arquivo
+    livro = load_workbook(fonte, read_only=True, data_only=True)
+    try:
+        planilha = livro.worksheets[aba] if isinstance(aba, int) else livro[aba]
+        linhas = planilha.iter_rows(values_only=True)
+        pergunta, opcao = list(next(linhas, ())), list(next(linhas, ()))
+
+        largura = max(
+            (i + 1 for linha in (pergunta, opcao) for i, v in enumerate(linha) if v not in (None, "")),
+            default=0,
+        )
+        # célula vazia no cabeçalho é "" para o read_excel (vira "Unnamed: ...")
+        pergunta = ["" if v is None else v for v in (pergunta + [None] * largura)[:largura]]
+        opcao = ["" if v is None else v for v in (opcao + [None] * largura)[:largura]]
+        # células mescladas da pergunta: o read_excel repete o texto à direita
+        for i in range(1, largura):
+            if pergunta[i] == "":
+                pergunta[i] = pergunta[i - 1]
+
+        colunas = padronizar_cabecalhos(TextParser([pergunta, opcao], header=[0, 1]).read().columns)
+        while True:
+            lote = []
+            for linha in islice(linhas, tamanho_bloco):
+                linha = [_valor_celula(v) for v in linha[:largura]]
+                if any(v is not None and v != "" for v in linha):
+                    lote.append(linha + [None] * (largura - len(linha)))
+            if not lote:
+                break
+            # sem a inferência de tipo por bloco do TextParser: um bloco só com
+            # "5" em texto viraria número e não bateria com os demais
+            bloco = pd.DataFrame(lote, columns=colunas, dtype=object).infer_objects()
+            yield bloco
+    finally:
+        livro.close()
+
+
+def pico_memoria_mb():
+    # pico de RSS do processo (ru_maxrss vem em KB no Linux e em bytes no macOS)
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def tabular_em_blocos(blocos, log, n_processos=1, config=None):
+    total = None
+    n_blocos = 0
+    n_lidas = 0
+    inicio = time.perf_counter()
+
+    if n_processos > 1:
+        # no máximo 2 blocos por processo em memória ao mesmo tempo
+        with ProcessPoolExecutor(max_workers=n_processos) as pool:
+            while True:
+                janela = list(islice(blocos, 2 * n_processos))
+                if not janela:
+                    break
+                n_lidas += sum(len(b) for b in janela)
+                for parcial in pool.map(_limpar_e_contar_bloco, janela, [config] * len(janela)):
+                    total = parcial if total is None else total.juntar(parcial)
+                    n_blocos += 1
+    else:
+        for bloco in blocos:
+            n_lidas += len(bloco)
+            parcial = _limpar_e_contar_bloco(bloco, config)
+            total = parcial if total is None else total.juntar(parcial)
+            n_blocos += 1
+
+    duracao = time.perf_counter() - inicio
+    log(
+        f"🧩 {n_blocos} blocos tabulados e combinados: {n_lidas} linhas em {duracao:.2f}s "
+        f"({n_lidas / max(duracao, 1e-9):,.0f} linhas/s), pico de RSS {pico_memoria_mb()} MB."
+    )
+    if total is None:
+        return None
+    textualizar_mistas(total, config)
+    if compilar_plano(config).normalizar_texto:
+        normalizar_textos_abertos(total, log)
+    return total
+
+
+# ------------------------------------------------------------
+# 16. ATUALIZAÇÃO INCREMENTAL (PESQUISA EM CAMPO)
+# ------------------------------------------------------------
+
+COLUNA_ID = "respondent_id - respondent_id"
+
+SECOES_JSON = ["perguntas_simples", "multirresposta", "matriz_texto", "matriz_nota"]
+
+
+def chaves_respondentes(df):
+    if COLUNA_ID in df.columns:
+        return df[COLUNA_ID].to_numpy()
+    # sem respondent_id: hash da linha bruta inteira
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def carregar_estado_incremental(path):
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return {"chaves": set(), "parcial": None, "tabelas": None, "alteradas": [], "secoes_alteradas": []}
+
+
+def salvar_estado_incremental(path, estado):
+    pasta = os.path.dirname(path)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    temporario = path + ".tmp"
+    with open(temporario, "wb") as f:
+        pickle.dump(estado, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, path)
+
+
+def atualizar_contagens(df, estado, log, config=None):
+    chaves = chaves_respondentes(df)
+    novas = ~pd.Series(chaves).isin(estado["chaves"]).to_numpy()
+    n_novas = int(novas.sum())
+
+    log(f"🔁 Incremental: {len(df) - n_novas} respondentes já processados, {n_novas} novos.")
+
+    if n_novas:
+        df_novos = limpar_dados(df[novas], log, normalizar_texto=False, config=config)
+        parcial = ContagemParcial.de_dataframe(df_novos)
+        estado["parcial"] = parcial if estado["parcial"] is None else estado["parcial"].juntar(parcial)
+        estado["chaves"].update(chaves[novas].tolist())
+
+    # o estado guarda as contagens cruas; variantes e quase-duplicatas são
+    # unificadas só na cópia que vira tabela (como numa execução completa)
+    if estado["parcial"] is None:
+        return None
+    saida = textualizar_mistas(estado["parcial"].copiar(), config)
+    if compilar_plano(config).normalizar_texto:
+        normalizar_textos_abertos(saida, log)
+    return saida
+
+
+def _tabela_mudou(antiga, nova, limiar_pp):
+    if antiga is None:
+        return True
+    if isinstance(nova, dict):
+        if antiga.keys() != nova.keys():
+            return True
+        return any(_tabela_mudou(antiga[k], nova[k], limiar_pp) for k in nova)
+
+    col = "Frequência Relativa (%)"
+    if not (nova.index.isin(antiga.index).all() and antiga.index.isin(nova.index).all()):
+        return True
+    diferenca = (nova[col] - antiga[col].reindex(nova.index)).abs()
+    return bool((diferenca >= limiar_pp).any())
+
+
+def comparar_tabelas(antigas, novas, limiar_pp=1.0):
+    alteradas = []
+    for secao, t_antiga, t_nova in zip(SECOES_JSON, antigas or [{}] * 4, novas):
+        for pergunta, tabela in t_nova.items():
+            if _tabela_mudou(t_antiga.get(pergunta), tabela, limiar_pp):
+                alteradas.append((secao, pergunta))
+    return alteradas
+
+
+def registrar_alteracoes(estado, tabelas, log, limiar_pp=1.0):
+    alteradas = comparar_tabelas(estado["tabelas"], tabelas, limiar_pp)
+    estado["alteradas"] = alteradas
+    estado["secoes_alteradas"] = [s for s in SECOES_JSON if any(a[0] == s for a in alteradas)]
+    estado["tabelas"] = tabelas
+    log(
+        f"🔁 {len(alteradas)} tabelas mudaram ≥ {limiar_pp} p.p.; "
+        f"blocos de insight a regenerar: {', '.join(estado['secoes_alteradas']) or 'nenhum'}."
+    )
+
+
+# ------------------------------------------------------------
+# 17. DIFERENÇAS SIGNIFICATIVAS ENTRE SEGMENTOS
+# ------------------------------------------------------------
+
+TAGS_SEGMENTO = ["#gen", "#cls", "#est", "#esc"]
+
+
+def calcular_significancia(df, log, tags=TAGS_SEGMENTO, pesos=None, alpha=0.05, min_base=30,
+                           max_categorias=30):
+    if isinstance(df, ContagemParcial):
+        log("⚠️ Significância precisa dos respondentes linha a linha; cruzamentos não calculados.")
+        return None
+
+    base = df if isinstance(df, BaseCodificada) else BaseCodificada.de_dataframe(df)
+    segmentos = [c for c in (encontrar_coluna_por_tag(base, t) for t in tags) if c in base.codigos]
+
+    col_simples, grupos_multi, grupos_texto, _ = planejar_tabelas(base)
+    colunas = col_simples + [c for cols in grupos_texto.values() for c in cols]
+    colunas = [
+        c for c in colunas
+        if c in base.codigos and c not in segmentos and len(base.categorias[c]) <= max_categorias
+    ]
+
+    resultado = testar_significancia(base, segmentos, colunas, grupos_multi, pesos, alpha, min_base)
+    log(
+        f"🧪 Significância: {len(resultado)} células testadas em {len(segmentos)} segmentos, "
+        f"{int(resultado['significativo'].sum())} diferenças significativas (BH, α={alpha})."
+    )
+    return resultado
+
+
+# ------------------------------------------------------------
+# 18. ASSOCIAÇÕES ENTRE PERGUNTAS
+# ------------------------------------------------------------
+
+def calcular_associacoes(df, log, pesos=None, n_processos=1, max_categorias=30):
+    if isinstance(df, ContagemParcial):
+        log("⚠️ Associações precisam dos respondentes linha a linha; não calculadas.")
+        return None
+
+    col_simples, grupos_multi, grupos_texto, grupos_nota = planejar_tabelas(df)
+    resultado = associacoes_todas(
+        df, col_simples, grupos_multi, {**grupos_texto, **grupos_nota}, pesos,
+        max_categorias=max_categorias, n_processos=n_processos,
+    )
+    log(f"🔗 Associações: {len(resultado)} pares de perguntas avaliados (V de Cramér).")
+    return resultado
+
+
+# ------------------------------------------------------------
+# 19. AGRUPAMENTO DE RESPONDENTES (SEGMENTOS NATURAIS)
+# ------------------------------------------------------------
+
+def calcular_grupos_naturais(df, log, k=5, pesos=None, max_categorias=30, seed=42):
+    if isinstance(df, ContagemParcial):
+        log("⚠️ Agrupamento precisa dos respondentes linha a linha; não calculado.")
+        return None, None
+
+    col_simples, grupos_multi, grupos_texto, grupos_nota = planejar_tabelas(df)
+    codigos, nomes, _, rotulos = codificar_perguntas(
+        df, col_simples, grupos_multi, {**grupos_texto, **grupos_nota}, max_categorias
+    )
+    grupos = agrupar_respondentes(codigos, k=k, seed=seed)
+    perfis = perfilar_grupos(codigos, nomes, rotulos, grupos, pesos)
+    log(f"🧬 Agrupamento: {len(perfis)} grupos naturais sobre {codigos.shape[1]} variáveis.")
+    return grupos, perfis
+
+
+# ------------------------------------------------------------
+# 20. CHECKPOINTS POR CONTEÚDO (EXECUÇÃO EM DAG)
+# ------------------------------------------------------------
+
+def hash_arquivo(path, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for pedaco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(pedaco)
+    return h.hexdigest()
+
+
+def versao_codigo(*objetos):
+    # muda quando o código-fonte de qualquer função/classe da etapa muda
+    h = hashlib.sha256()
+    for obj in objetos:
+        h.update(inspect.getsource(obj).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class ExecutorDAG:
+    """Etapas com checkpoint endereçado por conteúdo: a chave de cada uma é
+    o hash da versão do código, dos parâmetros e das chaves das etapas de
+    que depende. Só roda o que não tem checkpoint (e só carrega o que uma
+    etapa a rodar precisa); uma execução que falhou recomeça da última
+    etapa salva."""
+
+    def __init__(self, pasta, log):
+        self.pasta = pasta
+        self.log = log
+        self.etapas = {}
+        self._chaves = {}
+        self._resultados = {}
+        os.makedirs(pasta, exist_ok=True)
+
+    def etapa(self, nome, funcao, dependencias=(), versao="", parametros=None):
+        self.etapas[nome] = (funcao, tuple(dependencias), versao, parametros)
+        return self
+
+    def chave(self, nome):
+        if nome not in self._chaves:
+            _, dependencias, versao, parametros = self.etapas[nome]
+            conteudo = json.dumps(
+                [nome, versao, parametros, [self.chave(d) for d in dependencias]],
+                sort_keys=True, default=str,
+            )
+            self._chaves[nome] = hashlib.sha256(conteudo.encode("utf-8")).hexdigest()[:20]
+        return self._chaves[nome]
+
+    def _arquivo(self, nome):
+        return os.path.join(self.pasta, f"{nome}-{self.chave(nome)}.pkl")
+
+    def obter(self, nome):
+        if nome in self._resultados:
+            return self._resultados[nome]
+
+        arquivo = self._arquivo(nome)
+        if os.path.exists(arquivo):
+            self.log(f"♻️ {nome}: checkpoint reaproveitado ({self.chave(nome)[:8]}).")
+            with open(arquivo, "rb") as f:
+                resultado = pickle.load(f)
+            os.utime(arquivo)  # conta como uso recente para podar()
+        else:
+            funcao, dependencias, _, _ = self.etapas[nome]
+            entradas = [self.obter(d) for d in dependencias]
+            inicio = time.perf_counter()
+            resultado = funcao(*entradas)
+            # grava em arquivo temporário e renomeia: nunca fica checkpoint pela metade
+            temporario = arquivo + ".tmp"
+            with open(temporario, "wb") as f:
+                pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, arquivo)
+            self.log(f"▶️ {nome}: executado em {time.perf_counter() - inicio:.2f}s e salvo.")
+
+        self._resultados[nome] = resultado
+        return resultado
+
+    def podar(self, manter=3):
+        # por etapa, mantém só os `manter` checkpoints usados mais recentemente
+        removidos = 0
+        for nome in self.etapas:
+            arquivos = sorted(
+                (os.path.join(self.pasta, a) for a in os.listdir(self.pasta)
+                 if a.startswith(f"{nome}-") and a.endswith(".pkl")),
+                key=os.path.getmtime, reverse=True,
+            )
+            for arquivo in arquivos[manter:]:
+                os.remove(arquivo)
+                removidos += 1
+        if removidos:
+            self.log(f"🧹 {removidos} checkpoints antigos removidos de {self.pasta}.")
+        return removidos
+
+
+class ErroCarregamento(Exception):
+    pass
+
+
+def executar_com_checkpoints(file_path, pasta, log, base_codificada=False, n_processos=1,
+                             configuracao=None, mapa_textos=None, ondas=None, respondentes=False, manter=3):
+    entrada = abrir_entrada(file_path)
+    plano = compilar_plano(configuracao)
+    caminho_mapa = None if mapa_textos in (None, False, True) else mapa_textos
+
+    # a etapa de limpeza reescreve o mapa de textos: a chave usa o mapa como
+    # estava antes da última execução que o gravou, senão nunca haveria acerto
+    origens_mapa = os.path.join(pasta, "origens_mapa_textos.json")
+    origens = {}
+    if os.path.exists(origens_mapa):
+        with open(origens_mapa, "r", encoding="utf-8") as f:
+            origens = json.load(f)
+    hash_atual = hash_arquivo(caminho_mapa) if caminho_mapa and os.path.exists(caminho_mapa) else None
+    hash_mapa = origens.get(hash_atual, hash_atual)
+
+    def carregar():
+        if ondas:
+            df = carregar_ondas(entrada, log, n_processos, None if ondas is True else ondas)
+        else:
+            df = carregar_e_padronizar_dados(entrada, log)
+        if df is None:
+            raise ErroCarregamento(entrada.nome)
+        return df
+
+    def limpar(df):
+        df = limpar_dados(df.copy(), log, config=plano.config)
+        if mapa_textos:
+            df, _ = agrupar_textos_livres(df, log, caminho_mapa)
+        if caminho_mapa and os.path.exists(caminho_mapa):
+            origens[hash_arquivo(caminho_mapa)] = hash_mapa
+            with open(origens_mapa, "w", encoding="utf-8") as f:
+                json.dump(origens, f)
+        return df
+
+    def codificar(df):
+        return BaseCodificada.de_dataframe(df) if base_codificada else df
+
+    def tabular(df):
+        log("📊 Gerando tabelas de frequência...")
+        return gerar_todas_as_tabelas(df, n_processos=n_processos)
+
+    dag = ExecutorDAG(pasta, log)
+    dag.etapa("carregar", carregar,
+              versao=versao_codigo(carregar_e_padronizar_dados, carregar_ondas, _ler_aba, padronizar_cabecalhos,
+                                   clean_header),
+              parametros={"arquivo": entrada.hash, "ondas": ondas})
+    dag.etapa("limpar", limpar, ["carregar"],
+              versao=versao_codigo(limpar_dados, executar_etapas, PlanoLimpeza, passada_por_coluna,
+                                   mapear_valores_distintos, remove_html, limpar_likert,
+                                   filtrar_respondentes_validos, limpar_colunas_indesejadas,
+                                   mesclar_respostas_outro, normalizar_textos_abertos,
+                                   agrupar_textos_livres, texto_ilumeo),
+              parametros={"config": plano.hash, "mapa_textos": bool(mapa_textos), "mapa": hash_mapa})
+    dag.etapa("codificar", codificar, ["limpar"], versao=versao_codigo(BaseCodificada),
+              parametros={"base_codificada": base_codificada})
+    dag.etapa("tabelas", tabular, ["codificar"],
+              versao=versao_codigo(gerar_todas_as_tabelas, planejar_tabelas, classificar_perguntas,
+                                   identificar_colunas_simples, tabelas_simples, tabelas_multiresposta,
+                                   tabelas_matriz_texto, tabelas_matriz_nota, value_counts_codificado,
+                                   contar_codigos))
+
+    try:
+        tabelas = dag.obter("tabelas")
+    except ErroCarregamento:
+        return None, None, None
+    # os ids saem da base bruta: só carrega o checkpoint dela quando pedidos
+    ids = ids_respondentes(dag.obter("carregar")) if respondentes else None
+    codificada = dag.obter("codificar")
+    dag.podar(manter)
+    return codificada, tabelas, ids
+
+
+# ------------------------------------------------------------
+# 21. TENDÊNCIA ENTRE ONDAS (TABULAÇÕES EM CACHE)
+# ------------------------------------------------------------
+
+PASTA_ONDAS = os.path.join("estado", "ondas")
+
+
+def impressao_questionario(tabelas):
+    # mesmo conjunto de perguntas (por #tag e seção) = mesma impressão,
+    # mesmo que a redação ou a lista de marcas mude entre as ondas
+    t_simples, t_multi, t_matriz, t_nota = tabelas
+    chaves = sorted(
+        {f"{secao}:{tag_pergunta(p)}"
+         for secao, t in zip(SECOES_JSON, (t_simples, t_multi, t_matriz, t_nota)) for p in t}
+    )
+    return hashlib.sha256("\n".join(chaves).encode("utf-8")).hexdigest()[:16]
+
+
+def _nome_seguro(texto, padrao="onda"):
+    return re.sub(r"[^\w.-]+", "_", str(texto)).strip("_") or padrao
+
+
+def _pasta_questionario(pasta, impressao, estudo=None):
+    # cada estudo tem o seu histórico; sem estudo, vale só o questionário
+    return os.path.join(pasta, _nome_seguro(estudo, "estudo"), impressao) if estudo else os.path.join(pasta, impressao)
+
+
+def _arquivo_onda(pasta, impressao, onda, extensao=".pkl", estudo=None):
+    return os.path.join(_pasta_questionario(pasta, impressao, estudo), f"{_nome_seguro(onda)}{extensao}")
+
+
+def ordem_onda(rotulo):
+    # ordem natural do rótulo: "2025-5" < "2025-10", "onda 2" < "onda 10"
+    return [(0, int(p), "") if p.isdigit() else (1, 0, p.lower()) for p in re.findall(r"\d+|\D+", str(rotulo))]
+
+
+def carregar_insight_onda(pasta, impressao, onda, estudo=None):
+    if not (impressao and onda):
+        return None
+    arquivo = _arquivo_onda(pasta, impressao, onda, ".md", estudo)
+    if not os.path.exists(arquivo):
+        return None
+    with open(arquivo, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def salvar_insight_onda(pasta, impressao, onda, insight, estudo=None):
+    arquivo = _arquivo_onda(pasta, impressao, onda, ".md", estudo)
+    os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+    with open(arquivo, "w", encoding="utf-8") as f:
+        f.write(insight)
+
+
+def salvar_tabulacao_onda(pasta, impressao, onda, tabelas, n_respondentes, estudo=None):
+    arquivo = _arquivo_onda(pasta, impressao, onda, estudo=estudo)
+    os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+    temporario = arquivo + ".tmp"
+    with open(temporario, "wb") as f:
+        pickle.dump(
+            {"onda": onda, "n_respondentes": n_respondentes, "tabelas": tabelas, "salvo_em": time.time()},
+            f, protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(temporario, arquivo)
+
+
+def carregar_onda_anterior(pasta, impressao, onda_atual, estudo=None):
+    # a onda de rótulo imediatamente anterior ao da atual (não a gravada por último:
+    # reprocessar uma onda antiga não pode virar a "anterior" da seguinte)
+    pasta_estudo = _pasta_questionario(pasta, impressao, estudo)
+    if not os.path.isdir(pasta_estudo):
+        return None
+    atual = ordem_onda(_nome_seguro(onda_atual))
+    anteriores = [
+        a for a in os.listdir(pasta_estudo)
+        if a.endswith(".pkl") and ordem_onda(a[:-len(".pkl")]) < atual
+    ]
+    if not anteriores:
+        return None
+    anterior = max(anteriores, key=lambda a: ordem_onda(a[:-len(".pkl")]))
+    with open(os.path.join(pasta_estudo, anterior), "rb") as f:
+        return pickle.load(f)
+
+
+def numero_respondentes(df, pesos=None):
+    if pesos is not None:
+        return float(np.sum(pesos))
+    return df.n_linhas if isinstance(df, ContagemParcial) else len(df)
+
+
+def calcular_tendencias(tabelas, n_respondentes, log, pasta=PASTA_ONDAS, onda=None, alpha=0.05, estudo=None):
+    onda = onda or time.strftime("%Y-%m")
+    # a coluna de onda das planilhas com várias abas não é pergunta do questionário
+    t_simples, t_multi, t_matriz, t_nota = tabelas
+    tabelas = ({k: v for k, v in t_simples.items() if k != COLUNA_ONDA}, t_multi, t_matriz, t_nota)
+    impressao = impressao_questionario(tabelas)
+    anterior = carregar_onda_anterior(pasta, impressao, onda, estudo)
+    salvar_tabulacao_onda(pasta, impressao, onda, tabelas, n_respondentes, estudo)
+
+    if anterior is None:
+        log(f"📉 Onda '{onda}' salva (questionário {impressao[:8]}); sem onda anterior para comparar.")
+        return {"questionario": impressao, "onda_anterior": None, "onda_atual": onda, "resultado": None}
+
+    resultado = comparar_ondas(
+        empilhar_tabelas(*anterior["tabelas"], anterior["n_respondentes"]),
+        empilhar_tabelas(*tabelas, n_respondentes),
+        alpha,
+    )
+    log(
+        f"📉 Tendência '{anterior['onda']}' → '{onda}': {int(resultado['significativo'].sum())} "
+        f"variações significativas em {len(resultado)} respostas comparadas."
+    )
+    return {"questionario": impressao, "onda_anterior": anterior["onda"], "onda_atual": onda, "resultado": resultado}
+
+
+# ------------------------------------------------------------
+# 22. ARMAZÉM DE PESQUISAS (SQLITE EMBUTIDO)
+# ------------------------------------------------------------
+
+CAMINHO_ARMAZEM = os.path.join("estado", "armazem.sqlite")
+
+ESQUEMA_ARMAZEM = """
+CREATE TABLE IF NOT EXISTS estudos (
+    estudo TEXT NOT NULL,
+    onda TEXT NOT NULL,
+    questionario TEXT,
+    arquivo TEXT,
+    n_respondentes REAL,
+    carregado_em TEXT,
+    impressao TEXT,
+    PRIMARY KEY (estudo, onda)
+);
+CREATE TABLE IF NOT EXISTS tabulacoes (
+    estudo TEXT NOT NULL,
+    onda TEXT NOT NULL,
+    segmento TEXT NOT NULL,
+    grupo TEXT NOT NULL,
+    secao TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    pergunta TEXT,
+    item TEXT,
+    resposta TEXT,
+    n REAL,
+    base REAL,
+    pct REAL
+);
+CREATE TABLE IF NOT EXISTS respostas (
+    estudo TEXT NOT NULL,
+    onda TEXT NOT NULL,
+    respondente TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    coluna TEXT,
+    valor TEXT,
+    valor_num REAL
+);
+CREATE INDEX IF NOT EXISTS ix_estudos_onda ON estudos (onda);
+CREATE INDEX IF NOT EXISTS ix_tabulacoes_estudo_onda ON tabulacoes (estudo, onda);
+CREATE INDEX IF NOT EXISTS ix_tabulacoes_tag ON tabulacoes (tag, segmento, grupo);
+CREATE INDEX IF NOT EXISTS ix_tabulacoes_segmento ON tabulacoes (segmento, grupo);
+CREATE INDEX IF NOT EXISTS ix_respostas_estudo_onda ON respostas (estudo, onda, tag);
+CREATE INDEX IF NOT EXISTS ix_respostas_tag ON respostas (tag, valor);
+"""
+
+
+def abrir_armazem(caminho=CAMINHO_ARMAZEM):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conexao = sqlite3.connect(caminho)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.executescript(ESQUEMA_ARMAZEM)
+    # armazéns criados antes da coluna de impressão
+    if "impressao" not in {linha[1] for linha in conexao.execute("PRAGMA table_info(estudos)")}:
+        conexao.execute("ALTER TABLE estudos ADD COLUMN impressao TEXT")
+    # armazéns gravados com o segmento ainda com "#" (a coluna tag nunca teve)
+    with conexao:
+        conexao.execute("UPDATE tabulacoes SET segmento = substr(segmento, 2) WHERE segmento LIKE '#%'")
+    return conexao
+
+
+def _linhas_tabulacao(estudo, onda, segmento, grupo, empilhadas):
+    pct = np.where(empilhadas["base"] > 0, empilhadas["n"] / empilhadas["base"] * 100, np.nan).round(1)
+    return zip(
+        repeat(estudo), repeat(onda), repeat(segmento), repeat(str(grupo)),
+        empilhadas["secao"], empilhadas["tag"], empilhadas["pergunta"], empilhadas["item"],
+        empilhadas["resposta"], empilhadas["n"].tolist(), empilhadas["base"].tolist(), pct.tolist(),
+    )
+
+
+def ids_respondentes(df):
+    # respondent_id (ou hash da linha bruta) por índice, antes da limpeza descartar a coluna
+    return pd.Series(chaves_respondentes(df), index=df.index).astype(str)
+
+
+def _linhas_respondentes(estudo, onda, base, ids):
+    respondentes = ids.reindex(base.indice).to_numpy()
+    for col in base.ordem:
+        valores = base.valores(col)
+        presentes = ~pd.isna(valores)
+        tag = tag_pergunta(col)
+        numerica = col in base.numericas and pd.api.types.is_numeric_dtype(valores)
+        for r, v in zip(respondentes[presentes].tolist(), valores[presentes].tolist()):
+            yield estudo, onda, r, tag, col, str(v), float(v) if numerica else None
+
+
+def armazenar_pesquisa(df, tabelas, log, caminho=CAMINHO_ARMAZEM, estudo="", onda="", arquivo=None,
+                       pesos=None, tags_segmento=TAGS_SEGMENTO, respondentes=None, min_base=30,
+                       impressao_dados=None):
+    # recarregar a mesma (estudo, onda) substitui a carga anterior;
+    # respondentes: ids_respondentes(...) para gravar também as respostas linha a linha
+    inicio = time.perf_counter()
+    n_respondentes = numero_respondentes(df, pesos)
+    t_simples, t_multi, t_matriz, t_nota = tabelas
+    tabelas = ({k: v for k, v in t_simples.items() if k != COLUNA_ONDA}, t_multi, t_matriz, t_nota)
+    questionario = impressao_questionario(tabelas)
+    impressao = hashlib.sha256(json.dumps(
+        [impressao_dados, questionario, n_respondentes, pesos is not None, list(tags_segmento),
+         respondentes is not None, min_base], default=str,
+    ).encode("utf-8")).hexdigest()[:16]
+
+    conexao = abrir_armazem(caminho)
+    try:
+        anterior = conexao.execute(
+            "SELECT impressao FROM estudos WHERE estudo = ? AND onda = ?", (estudo, onda)
+        ).fetchone()
+        if impressao_dados is not None and anterior is not None and anterior[0] == impressao:
+            log(f"🗄️ Armazém: '{estudo}' / '{onda}' já carregado com os mesmos dados; nada a gravar.")
+            return
+
+        with conexao:
+            for tabela in ("estudos", "tabulacoes", "respostas"):
+                conexao.execute(f"DELETE FROM {tabela} WHERE estudo = ? AND onda = ?", (estudo, onda))
+            conexao.execute(
+                "INSERT INTO estudos (estudo, onda, questionario, arquivo, n_respondentes, carregado_em, impressao) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (estudo, onda, questionario, arquivo, n_respondentes,
+                 time.strftime("%Y-%m-%d %H:%M:%S"), impressao),
+            )
+
+            insercao = "INSERT INTO tabulacoes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            conexao.executemany(
+                insercao, _linhas_tabulacao(estudo, onda, "", "", empilhar_tabelas(*tabelas, n_respondentes))
+            )
+
+            # segmentos: as mesmas tabelas por grupo, filtradas pelo índice bitmap
+            n_segmentos = 0
+            base = None
+            if isinstance(df, ContagemParcial):
+                log("⚠️ Armazém: segmentos precisam dos respondentes linha a linha; gravado só o total.")
+            else:
+                base = df if isinstance(df, BaseCodificada) else BaseCodificada.de_dataframe(df)
+                indice = IndiceBitmap(base)
+                for tag in tags_segmento:
+                    col = encontrar_coluna_por_tag(base, tag)
+                    if col not in base.codigos:
+                        continue
+                    for grupo in base.rotulos_coluna(col):
+                        filtrada = BaseFiltrada(indice, indice.resposta(col, grupo))
+                        # a base mínima vale em respondentes, mesmo nas rodadas ponderadas
+                        if len(filtrada) < min_base:
+                            continue
+                        pesos_grupo = None if pesos is None else np.asarray(pesos)[filtrada.posicoes]
+                        empilhadas = empilhar_tabelas(
+                            *gerar_todas_as_tabelas(filtrada, pesos=pesos_grupo),
+                            numero_respondentes(filtrada, pesos_grupo),
+                        )
+                        conexao.executemany(
+                            insercao, _linhas_tabulacao(estudo, onda, tag.lstrip("#"), grupo, empilhadas)
+                        )
+                        n_segmentos += 1
+
+            n_respostas = 0
+            if respondentes is not None and base is not None:
+                cursor = conexao.executemany(
+                    "INSERT INTO respostas VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    _linhas_respondentes(estudo, onda, base, respondentes),
+                )
+                n_respostas = cursor.rowcount
+    finally:
+        conexao.close()
+
+    log(
+        f"🗄️ Armazém: '{estudo}' / '{onda}' gravado em {caminho} ({n_segmentos} segmentos, "
+        f"{n_respostas} respostas) em {time.perf_counter() - inicio:.2f}s."
+    )
+
+
+def consultar_armazem(sql, parametros=(), caminho=CAMINHO_ARMAZEM):
+    conexao = abrir_armazem(caminho)
+    try:
+        return pd.read_sql_query(sql, conexao, params=parametros)
+    finally:
+        conexao.close()
+
+
+def distribuicoes_por_tag(tag, caminho=CAMINHO_ARMAZEM, estudo=None, ano=None, segmento="", grupo=""):
+    # ex.: distribuicoes_por_tag("gen", estudo="Fashion", ano=2025)
+    # tag e segmento com ou sem "#": ambos ficam gravados sem
+    sql = (
+        "SELECT t.estudo, t.onda, t.pergunta, t.item, t.resposta, t.n, t.base, t.pct "
+        "FROM tabulacoes t "
+        "WHERE t.tag = ? AND t.segmento = ? AND t.grupo = ?"
+    )
+    parametros = [tag.lstrip("#"), segmento.lstrip("#"), grupo]
+    if estudo:
+        sql += " AND t.estudo LIKE ?"
+        parametros.append(f"%{estudo}%")
+    if ano:
+        sql += " AND t.onda LIKE ?"
+        parametros.append(f"{ano}%")
+    return consultar_armazem(sql + " ORDER BY t.estudo, t.onda", parametros, caminho)
+
+
+# ------------------------------------------------------------
+# 23. PIPELINE PRINCIPAL
+# ------------------------------------------------------------
+
+def executar_etl(file_path, base_codificada=False, n_processos=1, tamanho_bloco=None,
+                 estado_incremental=None, limiar_pp=1.0, ponderar=False, alvos_ponderacao=None,
+                 segmentos=None, kpis=False, funil=False, associacoes=None, grupos_naturais=None,
+                 termos_texto=None, mapa_textos=None, medir_memoria=False, configuracao=None,
+                 explicar_limpeza=False, checkpoints=None, ondas=None, tendencias=None, onda=None,
+                 armazem=None, estudo=None, armazem_respondentes=False):
 
     logs = []
 
@@ -367,22 +2774,186 @@ def executar_etl(file_path):
         logs.append(msg)
 
     log("🚀 Iniciando ETL ILUMEO...")
-    df = carregar_e_padronizar_dados(file_path, log)
-    if df is None:
-        log("❌ ETL abortado por erro no carregamento.")
-        return None, None, None, None, None, logs
+    pesos = None
+    # caminho, bytes ou upload em memória: lido e identificado (hash) uma vez
+    entrada = abrir_entrada(file_path)
+
+    if tamanho_bloco and estado_incremental:
+        # o incremental já só limpa e conta os respondentes novos, mas precisa
+        # do arquivo inteiro para saber quais são
+        log("⚠️ Modo incremental indisponível em blocos; lendo o arquivo inteiro.")
+        tamanho_bloco = None
+
+    if ponderar and (tamanho_bloco or estado_incremental):
+        log("⚠️ Ponderação indisponível nos modos em blocos/incremental. Tabelas sem peso.")
+
+    if ondas and (tamanho_bloco or estado_incremental):
+        log("⚠️ Leitura de várias abas indisponível nos modos em blocos/incremental. Lendo só a primeira.")
+        ondas = None
+
+    usar_checkpoints = bool(checkpoints) and not (tamanho_bloco or estado_incremental or ponderar)
+    if checkpoints and not usar_checkpoints:
+        log("⚠️ Checkpoints só valem para o modo padrão; executando sem eles.")
+
+    ids = None
+    if usar_checkpoints:
+        df, tabelas, ids = executar_com_checkpoints(
+            entrada, checkpoints, log, base_codificada, n_processos, configuracao, mapa_textos, ondas,
+            respondentes=bool(armazem and armazem_respondentes),
+        )
+        if df is None:
+            log("❌ ETL abortado por erro no carregamento.")
+            return None, None, None, None, None, logs
+    elif tamanho_bloco:
+        log(f"🧩 Processando em blocos de {tamanho_bloco} linhas...")
+        df = tabular_em_blocos(iterar_blocos(entrada, tamanho_bloco, log), log, n_processos, configuracao)
+        if df is None:
+            log("❌ ETL abortado por erro no carregamento.")
+            return None, None, None, None, None, logs
+        n_processos = 1
+    else:
+        if ondas:
+            df = carregar_ondas(entrada, log, n_processos, None if ondas is True else ondas)
+        else:
+            df = carregar_e_padronizar_dados(entrada, log)
+        if df is None:
+            log("❌ ETL abortado por erro no carregamento.")
+            return None, None, None, None, None, logs
+
+        if armazem and armazem_respondentes:
+            ids = ids_respondentes(df)
+
+        if estado_incremental:
+            estado = carregar_estado_incremental(estado_incremental)
+            df = atualizar_contagens(df, estado, log, configuracao)
+            if df is None:
+                log("❌ ETL abortado: nenhum respondente válido.")
+                return None, None, None, None, None, logs
+            n_processos = 1
+        elif ponderar:
+            pesos = ponderar_respondentes(df, log, alvos_ponderacao, configuracao)
+            df = limpar_dados(df, log, filtrar=False, medir_memoria=medir_memoria, config=configuracao,
+                              explicar=explicar_limpeza)
+            pesos = pesos.loc[df.index].to_numpy()
+        else:
+            df = limpar_dados(df, log, medir_memoria=medir_memoria, config=configuracao,
+                              explicar=explicar_limpeza)
 
-    df = filtrar_respondentes_validos(df, log)
-    df = limpar_colunas_indesejadas(df, log)
-    df = ajustar_cidade_genero(df, log)
-    df = limpar_html_df(df, log)
-    df = limpar_escalas(df, log)
+    entrada.fechar()
 
-    log("📊 Gerando tabelas de frequência...")
-    t_simples, t_multi, t_matriz, t_nota = gerar_todas_as_tabelas(df)
+    if mapa_textos and not usar_checkpoints:
+        df, _ = agrupar_textos_livres(df, log, None if mapa_textos is True else mapa_textos)
+
+    if base_codificada and not (tamanho_bloco or estado_incremental or usar_checkpoints):
+        base = BaseCodificada.de_dataframe(df)
+        mem = relatorio_memoria(df, base)
+        log(
+            f"🗜️ Base codificada: {mem['base_codificada_mb']} MB contra {mem['dataframe_mb']} MB "
+            f"do DataFrame ({mem['reducao_x']}x menor, {mem['rotulos_unicos']} rótulos únicos)."
+        )
+        df = base
+
+    if usar_checkpoints:
+        t_simples, t_multi, t_matriz, t_nota = tabelas
+    else:
+        log("📊 Gerando tabelas de frequência...")
+        t_simples, t_multi, t_matriz, t_nota = gerar_todas_as_tabelas(df, n_processos=n_processos, pesos=pesos)
     log("✅ Tabelas de frequência criadas.")
 
-    resultado_json = gerar_json_todas_as_tabelas(t_simples, t_multi, t_matriz, t_nota)
+    if estado_incremental:
+        registrar_alteracoes(estado, (t_simples, t_multi, t_matriz, t_nota), log, limiar_pp)
+        salvar_estado_incremental(estado_incremental, estado)
+
+    extras = {}
+
+    if tendencias:
+        pasta = PASTA_ONDAS if tendencias is True else tendencias
+        tendencia = calcular_tendencias(
+            (t_simples, t_multi, t_matriz, t_nota), numero_respondentes(df, pesos), log, pasta, onda,
+            estudo=estudo,
+        )
+        extras["tendencias"] = {
+            "estudo": estudo,
+            "questionario": tendencia["questionario"],
+            "onda_anterior": tendencia["onda_anterior"],
+            "onda_atual": tendencia["onda_atual"],
+            "variacoes_significativas": (
+                [] if tendencia["resultado"] is None else tendencias_para_json(tendencia["resultado"])
+            ),
+        }
+
+    if ondas:
+        t_ondas = tabelas_por_onda(df, pesos)
+        extras["por_onda"] = {str(onda): tabelas_para_dict(*tabelas) for onda, tabelas in t_ondas.items()}
+        log(f"🌊 Tabelas por onda: {', '.join(map(str, t_ondas))} (além do total).")
+
+    if segmentos:
+        tags = TAGS_SEGMENTO if segmentos is True else segmentos
+        significancia = calcular_significancia(df, log, tags, pesos)
+        if significancia is not None:
+            # só as tabelas (segmento x pergunta) com alguma diferença significativa;
+            # as células marcadas com ▲/▼ são as diferenças, sem repeti-las em lista
+            extras["tabelas_cruzadas"] = cruzadas_para_json(tabelas_cruzadas(significancia, apenas_significativas=True))
+
+    t_nota_json = t_nota
+    if kpis:
+        if isinstance(df, ContagemParcial):
+            log("⚠️ KPIs de nota precisam dos respondentes linha a linha; mantidas as distribuições.")
+        else:
+            grupos_nota = planejar_tabelas(df)[3]
+            t_kpis = kpis_por_pergunta(df, grupos_nota, pesos)
+            extras["kpis_notas"] = kpis_para_json(t_kpis)
+            # o resumo substitui as distribuições brutas no JSON
+            t_nota_json = {}
+            log(f"📈 KPIs calculados para {sum(len(t) for t in t_kpis.values())} itens de nota.")
+
+    if funil:
+        if isinstance(df, ContagemParcial):
+            log("⚠️ Funil de marcas precisa dos respondentes linha a linha; não calculado.")
+        else:
+            grupos_multi = planejar_tabelas(df)[1]
+            etapas = funil if isinstance(funil, list) else None
+            t_funil = funil_marcas(df, grupos_multi, etapas, pesos)
+            t_sobreposicao = {p: sobreposicao_marcas(df, cols, pesos) for p, cols in grupos_multi.items()}
+            extras["marcas"] = funil_para_json(t_funil, t_sobreposicao)
+            if t_funil.empty:
+                log("🔻 Funil de marcas: nenhuma etapa de conhecimento/consideração/compra identificada.")
+            else:
+                log(f"🔻 Funil de marcas: {len(t_funil)} marcas.")
+            log(f"🔻 Sobreposição de marcas em {len(t_sobreposicao)} perguntas.")
+
+    if associacoes:
+        top = 30 if associacoes is True else associacoes
+        t_assoc = calcular_associacoes(df, log, pesos, n_processos)
+        if t_assoc is not None:
+            extras["associacoes"] = associacoes_para_json(t_assoc, top)
+
+    if grupos_naturais:
+        k = 5 if grupos_naturais is True else grupos_naturais
+        _, perfis = calcular_grupos_naturais(df, log, k, pesos)
+        if perfis is not None:
+            extras["grupos_naturais"] = perfis
+
+    if termos_texto:
+        top = 10 if termos_texto is True else termos_texto
+        grupos_texto = planejar_tabelas(df)[2]
+        extras["termos_texto"] = termos_para_json(termos_por_item(df, grupos_texto, pesos, top))
+
+    if armazem:
+        # mesmo arquivo, mesmas regras de limpeza e mesmo mapa de textos = mesma carga
+        impressao_mapa = (
+            hash_arquivo(mapa_textos) if isinstance(mapa_textos, str) and os.path.exists(mapa_textos)
+            else bool(mapa_textos)
+        )
+        armazenar_pesquisa(
+            df, (t_simples, t_multi, t_matriz, t_nota), log,
+            CAMINHO_ARMAZEM if armazem is True else armazem,
+            estudo or os.path.splitext(entrada.nome)[0], onda or time.strftime("%Y-%m"),
+            entrada.nome, pesos, respondentes=ids,
+            impressao_dados=[entrada.hash, compilar_plano(configuracao).hash, ondas, impressao_mapa],
+        )
+
+    resultado_json = gerar_json_todas_as_tabelas(t_simples, t_multi, t_matriz, t_nota_json, extras)
 
     with open("resultado_pesquisa.json", "w", encoding="utf-8") as f:
         f.write(resultado_json)
@@ -0,0 +1,63 @@
+# V de Cramér (com a correção de viés de Bergsma) e informação mútua
+# contra tabelas calculadas à mão, e o motor de todos os pares (bincount
+# em lotes) contra as mesmas tabelas.
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analise_ilumeo import _medidas_associacao, associacoes_todas
+
+# 2x2, n = 80: qui² = 80 (30·30 - 10·10)² / 40⁴ = 20, φ² = 0,25
+# Bergsma: φ²~ = 0,25 - 1/79, r~ = c~ = 2 - 1/79
+V_2X2 = math.sqrt((0.25 - 1 / 79) / (1 - 1 / 79))
+# p = 0,375 / 0,125 com marginais 0,5: 2·0,375·log2(1,5) + 2·0,125·log2(0,5)
+IM_2X2 = 0.75 * math.log2(1.5) - 0.25
+
+
+def test_tabela_2x2():
+    v, im = _medidas_associacao(np.array([[30.0, 10.0], [10.0, 30.0]]))
+    assert v == pytest.approx(V_2X2)
+    assert v == pytest.approx(0.49029, abs=1e-5)
+    assert im == pytest.approx(IM_2X2)
+    assert im == pytest.approx(0.18872, abs=1e-5)
+
+
+def test_independencia_e_associacao_perfeita():
+    # linhas proporcionais: φ² = 0, a correção não deixa ficar negativo
+    assert _medidas_associacao(np.array([[10.0, 20.0, 30.0], [20.0, 40.0, 60.0]])) == (0.0, 0.0)
+
+    # diagonal 3x3: φ² = 2 = min(r, c) - 1, V = 1 e IM = log2(3)
+    v, im = _medidas_associacao(np.diag([10.0, 10.0, 10.0]))
+    assert v == pytest.approx(1.0)
+    assert im == pytest.approx(math.log2(3))
+
+
+def test_linhas_e_colunas_vazias_nao_contam():
+    com_vazias = np.array([[30.0, 10.0, 0.0], [10.0, 30.0, 0.0], [0.0, 0.0, 0.0]])
+    assert _medidas_associacao(com_vazias) == pytest.approx((V_2X2, IM_2X2))
+    # uma só categoria com resposta: sem associação
+    assert _medidas_associacao(np.array([[40.0, 0.0], [0.0, 0.0]])) == (0.0, 0.0)
+
+
+@pytest.mark.parametrize("n_processos, celulas_por_lote", [(1, 4_000_000), (1, 100), (2, 4_000_000)])
+def test_todos_os_pares(n_processos, celulas_por_lote):
+    a = ["sim"] * 30 + ["sim"] * 10 + ["não"] * 10 + ["não"] * 30
+    b = ["x"] * 30 + ["y"] * 10 + ["x"] * 10 + ["y"] * 30
+    # c: independente de a (metade de cada grupo de a em cada categoria)
+    c = (["p"] * 20 + ["q"] * 20) * 2
+    df = pd.DataFrame({"A #a": a, "B #b": b, "C #c": c})
+
+    resultado = associacoes_todas(
+        df, list(df.columns), min_base=10, n_processos=n_processos, celulas_por_lote=celulas_por_lote
+    )
+    pares = {(r.variavel_a, r.variavel_b): r for r in resultado.itertuples()}
+    assert set(pares) == {("#a", "#b"), ("#a", "#c"), ("#b", "#c")}
+    assert pares[("#a", "#b")].cramer_v == round(V_2X2, 4)
+    assert pares[("#a", "#b")].informacao_mutua_bits == round(IM_2X2, 4)
+    assert pares[("#a", "#b")].base == 80
+    assert pares[("#a", "#c")].cramer_v == 0.0
+    # ordenado do mais forte para o mais fraco
+    assert resultado.iloc[0][["variavel_a", "variavel_b"]].tolist() == ["#a", "#b"]
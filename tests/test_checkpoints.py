@@ -0,0 +1,102 @@
+# Checkpoints por conteúdo: a segunda execução reaproveita tudo, e mudar
+# uma regra invalida só as etapas que dependem dela.
+
+import copy
+import os
+
+import pandas as pd
+import pytest
+
+from etl_ilumeo1 import CONFIG_PADRAO, ExecutorDAG, executar_com_checkpoints
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+
+def comparar(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        if isinstance(a[k], dict):
+            comparar(a[k], b[k])
+        else:
+            pd.testing.assert_frame_equal(a[k], b[k], check_exact=True)
+
+
+def montar_dag(pasta, log, execucoes, fator):
+    # a -> b -> c, e a -> d; "fator" é parâmetro só de b
+    def registrar(nome, funcao):
+        def etapa(*entradas):
+            execucoes.append(nome)
+            return funcao(*entradas)
+        return etapa
+
+    dag = ExecutorDAG(str(pasta), log)
+    dag.etapa("a", registrar("a", lambda: 2))
+    dag.etapa("b", registrar("b", lambda a: a * fator), ["a"], parametros={"fator": fator})
+    dag.etapa("c", registrar("c", lambda b: b + 1), ["b"])
+    dag.etapa("d", registrar("d", lambda a: -a), ["a"])
+    return dag
+
+
+def test_dag_reaproveita_e_invalida_so_o_que_depende(tmp_path):
+    execucoes = []
+    primeira = montar_dag(tmp_path, lambda msg: None, execucoes, fator=10)
+    assert (primeira.obter("c"), primeira.obter("d")) == (21, -2)
+    assert sorted(execucoes) == ["a", "b", "c", "d"]
+
+    execucoes.clear()
+    segunda = montar_dag(tmp_path, lambda msg: None, execucoes, fator=10)
+    assert (segunda.obter("c"), segunda.obter("d")) == (21, -2)
+    assert execucoes == []
+
+    # fator muda: b e c rodam de novo (a vem do checkpoint), d nem é tocada
+    execucoes.clear()
+    terceira = montar_dag(tmp_path, lambda msg: None, execucoes, fator=100)
+    assert (terceira.obter("c"), terceira.obter("d")) == (201, -2)
+    assert execucoes == ["b", "c"]
+    assert [terceira.chave(n) == primeira.chave(n) for n in "abcd"] == [True, False, False, True]
+
+
+def executar(pasta, configuracao=None):
+    mensagens = []
+    codificada, tabelas, _ = executar_com_checkpoints(
+        ARQUIVO, str(pasta), mensagens.append, base_codificada=True, configuracao=configuracao
+    )
+    reaproveitadas = {m.split(":")[0].split()[-1] for m in mensagens if m.startswith("♻️")}
+    executadas = {m.split(":")[0].split()[-1] for m in mensagens if m.startswith("▶️")}
+    return tabelas, reaproveitadas, executadas
+
+
+@pytest.fixture(scope="module")
+def primeira_execucao(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp("checkpoints")
+    return pasta, executar(pasta)
+
+
+def test_primeira_execucao_roda_tudo(primeira_execucao):
+    _, (_, reaproveitadas, executadas) = primeira_execucao
+    assert reaproveitadas == set()
+    assert executadas == {"carregar", "limpar", "codificar", "tabelas"}
+
+
+def test_segunda_execucao_reaproveita(primeira_execucao):
+    pasta, (tabelas, _, _) = primeira_execucao
+    repetidas, reaproveitadas, executadas = executar(pasta)
+    # só o checkpoint final é lido: as etapas anteriores nem são carregadas
+    assert executadas == set()
+    assert "tabelas" in reaproveitadas and "carregar" not in reaproveitadas
+    for secao, secao_repetida in zip(tabelas, repetidas):
+        comparar(secao, secao_repetida)
+
+
+def test_regra_nova_invalida_so_a_limpeza_em_diante(primeira_execucao):
+    pasta, (tabelas, _, _) = primeira_execucao
+    config = copy.deepcopy(CONFIG_PADRAO)
+    removida = next(iter(tabelas[0]))
+    config["colunas_removidas"].append(removida)
+
+    novas, reaproveitadas, executadas = executar(pasta, config)
+    assert reaproveitadas == {"carregar"}
+    assert executadas == {"limpar", "codificar", "tabelas"}
+    assert removida not in novas[0]
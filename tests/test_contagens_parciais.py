@@ -0,0 +1,46 @@
+# Contagens parciais por bloco, juntadas, têm de dar as mesmas tabelas
+# que a tabulação do arquivo inteiro, qualquer que seja o tamanho do bloco.
+
+import os
+
+import pandas as pd
+import pytest
+
+from etl_ilumeo1 import (
+    carregar_e_padronizar_dados, limpar_dados, gerar_todas_as_tabelas,
+    iterar_blocos, tabular_em_blocos,
+)
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+
+def sem_log(msg):
+    pass
+
+
+def comparar(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        if isinstance(a[k], dict):
+            comparar(a[k], b[k])
+        else:
+            pd.testing.assert_frame_equal(a[k], b[k], check_exact=True)
+
+
+@pytest.fixture(scope="module")
+def arquivo_inteiro():
+    bruto = carregar_e_padronizar_dados(ARQUIVO, sem_log)
+    df = limpar_dados(bruto.copy(), sem_log)
+    return len(bruto), len(df), gerar_todas_as_tabelas(df)
+
+
+@pytest.mark.parametrize("tamanho_bloco", [1, 7, None])
+def test_blocos_igual_arquivo_inteiro(arquivo_inteiro, tamanho_bloco):
+    n_bruto, n_limpo, tabelas = arquivo_inteiro
+    parcial = tabular_em_blocos(iterar_blocos(ARQUIVO, tamanho_bloco or n_bruto, sem_log), sem_log)
+
+    assert parcial.n_linhas == n_limpo
+    for secao_blocos, secao_inteira in zip(gerar_todas_as_tabelas(parcial), tabelas):
+        comparar(secao_blocos, secao_inteira)
@@ -0,0 +1,75 @@
+# Tabelas filtradas pelo índice bitmap (BaseFiltrada) têm de dar o mesmo
+# que tabular o DataFrame já filtrado, qualquer que seja o tipo da pergunta
+# do filtro: simples, múltipla resposta, matriz de texto ou de nota.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl_ilumeo1 import (
+    BaseCodificada, IndiceBitmap, carregar_e_padronizar_dados, limpar_dados,
+    encontrar_coluna_por_tag, gerar_tabelas_filtradas, gerar_todas_as_tabelas, planejar_tabelas,
+)
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+
+def sem_log(msg):
+    pass
+
+
+def comparar(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        if isinstance(a[k], dict):
+            comparar(a[k], b[k])
+        else:
+            pd.testing.assert_frame_equal(a[k], b[k], check_exact=True)
+
+
+@pytest.fixture(scope="module")
+def base():
+    df = limpar_dados(carregar_e_padronizar_dados(ARQUIVO, sem_log), sem_log)
+    return df, IndiceBitmap(BaseCodificada.de_dataframe(df))
+
+
+def colunas_filtro(df):
+    _, grupos_multi, grupos_texto, grupos_nota = planejar_tabelas(df)
+    return {
+        "simples": encontrar_coluna_por_tag(df, "#gen"),
+        "multipla": next(iter(grupos_multi.values()))[0],
+        "matriz_texto": next(iter(grupos_texto.values()))[0],
+        "matriz_nota": next(iter(grupos_nota.values()))[0],
+    }
+
+
+@pytest.mark.parametrize("tipo", ["simples", "multipla", "matriz_texto", "matriz_nota"])
+def test_filtro_igual_dataframe_filtrado(base, tipo):
+    df, indice = base
+    col = colunas_filtro(df)[tipo]
+    # as duas respostas mais marcadas, em OU
+    valores = df[col].value_counts().index[:2].tolist()
+
+    filtrada = gerar_tabelas_filtradas(indice, indice.filtrar({col: valores}))
+    esperada = gerar_todas_as_tabelas(df[df[col].isin(valores).to_numpy()])
+    assert 0 < indice.contar(indice.filtrar({col: valores})) < len(df)
+    for secao_filtrada, secao_esperada in zip(filtrada, esperada):
+        comparar(secao_filtrada, secao_esperada)
+
+
+def test_filtros_combinados(base):
+    # E entre perguntas de tipos diferentes
+    df, indice = base
+    cols = colunas_filtro(df)
+    selecoes = {cols[t]: df[cols[t]].value_counts().index[:1].tolist() for t in ("simples", "matriz_nota")}
+
+    mascara = np.ones(len(df), dtype=bool)
+    for col, valores in selecoes.items():
+        mascara &= df[col].isin(valores).to_numpy()
+    filtrada = gerar_tabelas_filtradas(indice, indice.filtrar(selecoes))
+    for secao_filtrada, secao_esperada in zip(filtrada, gerar_todas_as_tabelas(df[mascara])):
+        comparar(secao_filtrada, secao_esperada)
@@ -0,0 +1,95 @@
+# Funil de marcas e sobreposição: etapas reconhecidas na ordem do funil,
+# percentuais que só caem de uma etapa para a seguinte quando cada etapa
+# pressupõe a anterior, e sobreposição igual a um crosstab par a par.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analise_ilumeo import etapas_padrao, funil_marcas, sobreposicao_marcas
+from etl_ilumeo1 import BaseCodificada, carregar_e_padronizar_dados, limpar_dados, planejar_tabelas
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+MARCAS = ["Renner", "C&A", "Riachuelo", "Zara"]
+CONHECE = "Quais destas marcas você conhece? #conh"
+CONSIDERA = "Quais destas marcas você considera? #cons"
+COMPROU = "De quais destas marcas você comprou? #comp"
+
+
+def sem_log(msg):
+    pass
+
+
+@pytest.fixture(scope="module")
+def funil_aninhado():
+    # quem considera conhece e quem comprou considera: cada etapa é um
+    # subconjunto sorteado da anterior
+    rng = np.random.default_rng(0)
+    n = 500
+    conhece = rng.random((n, len(MARCAS))) < [0.9, 0.8, 0.6, 0.4]
+    considera = conhece & (rng.random(conhece.shape) < 0.6)
+    comprou = considera & (rng.random(conhece.shape) < 0.5)
+
+    colunas, grupos = {}, {}
+    # na ordem inversa à do funil: a ordem vem das etapas, não do questionário
+    for pergunta, marcou in [(COMPROU, comprou), (CONSIDERA, considera), (CONHECE, conhece)]:
+        grupos[pergunta] = []
+        for j, marca in enumerate(MARCAS + ["Nenhuma dessas"]):
+            col = f"{pergunta} - {marca}"
+            valores = marcou[:, j] if j < len(MARCAS) else ~marcou.any(axis=1)
+            colunas[col] = np.where(valores, marca, None)
+            grupos[pergunta].append(col)
+    return pd.DataFrame(colunas), grupos, (conhece, considera, comprou)
+
+
+def test_etapas_na_ordem_do_funil(funil_aninhado):
+    df, grupos, _ = funil_aninhado
+    assert etapas_padrao(df, grupos) == [CONHECE, CONSIDERA, COMPROU]
+
+
+@pytest.mark.parametrize("codificada", [False, True])
+def test_funil_monotono(funil_aninhado, codificada):
+    df, grupos, (conhece, considera, comprou) = funil_aninhado
+    base = BaseCodificada.de_dataframe(df) if codificada else df
+    tabela = funil_marcas(base, grupos)
+
+    assert list(tabela.index) == MARCAS
+    pct = tabela[["% #conh", "% #cons", "% #comp"]].to_numpy()
+    assert (np.diff(pct, axis=1) <= 0).all()
+    np.testing.assert_allclose(pct[:, 0], (conhece.mean(axis=0) * 100).round(1))
+
+    # aninhado: conversão = quem está na etapa seguinte / quem está na atual
+    esperada = np.round(comprou.sum(axis=0) / considera.sum(axis=0) * 100, 1)
+    np.testing.assert_allclose(tabela["Conversão #cons → #comp %"], esperada)
+    assert (tabela.filter(like="Conversão") <= 100).all().all()
+
+
+def test_funil_ponderado(funil_aninhado):
+    df, grupos, (conhece, _, _) = funil_aninhado
+    pesos = np.where(conhece[:, 3], 2.0, 1.0)
+    tabela = funil_marcas(df, grupos, pesos=pesos)
+    esperado = (pesos[:, None] * conhece).sum(axis=0) / pesos.sum() * 100
+    np.testing.assert_allclose(tabela["% #conh"], esperado.round(1))
+
+
+def test_sobreposicao_igual_crosstab():
+    df = limpar_dados(carregar_e_padronizar_dados(ARQUIVO, sem_log), sem_log)
+    grupos_multi = planejar_tabelas(df)[1]
+    pergunta, cols = max(grupos_multi.items(), key=lambda g: len(g[1]))
+
+    for base in (df, BaseCodificada.de_dataframe(df)):
+        tabela = sobreposicao_marcas(base, cols)
+        for linha in tabela.index:
+            marcou_linha = df[f"{pergunta} - {linha}"].eq(linha)
+            for coluna in tabela.columns:
+                cruzado = pd.crosstab(marcou_linha, df[f"{pergunta} - {coluna}"].eq(coluna))
+                if not marcou_linha.any():
+                    assert np.isnan(tabela.loc[linha, coluna])
+                    continue
+                ambos = cruzado.loc[True].get(True, 0)
+                assert tabela.loc[linha, coluna] == round(ambos / marcou_linha.sum() * 100, 1)
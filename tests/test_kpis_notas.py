@@ -0,0 +1,64 @@
+# KPIs das matrizes de nota (média, Top 2 Box, NPS) contra contas feitas
+# à mão, com e sem pesos, e a escala (0 a 10 ou 1 a 5) reconhecida por
+# pergunta.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analise_ilumeo import escala_nota, kpis_notas, kpis_por_pergunta
+
+# 10 respondentes: 4 promotores (9-10), 3 neutros (7-8), 3 detratores (0-6)
+NOTAS = np.array([10, 9, 9, 10, 8, 7, 7, 6, 3, 0], dtype=float)
+
+
+def test_nps_top2box_e_media():
+    linha = kpis_notas(NOTAS[:, None]).iloc[0]
+    assert linha["Base"] == 10
+    assert linha["Média"] == pytest.approx(6.9)
+    assert linha["Mediana"] == 7.5
+    assert linha["Top 2 Box (9-10) %"] == 40.0
+    assert linha["Bottom 2 Box (0-1) %"] == 10.0
+    assert linha["NPS"] == 10.0
+
+
+def test_sem_nota_fica_fora_da_base():
+    matriz = np.column_stack([NOTAS, np.r_[NOTAS[:5], [np.nan] * 5]])
+    tabela = kpis_notas(matriz)
+    assert tabela["Base"].tolist() == [10, 5]
+    # 10, 9, 9, 10, 8: 80% promotores, nenhum detrator
+    assert tabela["NPS"].tolist() == [10.0, 80.0]
+
+
+def test_pesos():
+    # peso 3 nos detratores: 4 promotores vs 9 detratores em 16
+    pesos = np.r_[[1.0] * 7, [3.0] * 3]
+    linha = kpis_notas(NOTAS[:, None], pesos).iloc[0]
+    assert linha["Base"] == 16
+    assert linha["Média"] == pytest.approx(round((NOTAS[:7].sum() + 3 * NOTAS[7:].sum()) / 16, 2))
+    assert linha["Top 2 Box (9-10) %"] == 25.0
+    assert linha["NPS"] == pytest.approx(round((4 - 9) / 16 * 100, 1))
+
+    # pesos iguais só mudam a base
+    pd.testing.assert_frame_equal(
+        kpis_notas(NOTAS[:, None], np.full(10, 2.0)).drop(columns="Base"),
+        kpis_notas(NOTAS[:, None]).drop(columns="Base"),
+    )
+
+
+def test_escala_reconhecida_por_pergunta():
+    likert = np.array([5, 4, 4, 3, 2, 1, 5, 4, 2, 1], dtype=float)
+    assert escala_nota(NOTAS[:, None]) == "0-10"
+    assert escala_nota(likert[:, None]) == "1-5"
+
+    df = pd.DataFrame({"Nota - A": NOTAS, "Nota - B": NOTAS[::-1], "Concorda - A": likert})
+    t = kpis_por_pergunta(df, {"Nota": ["Nota - A", "Nota - B"], "Concorda": ["Concorda - A"]})
+    assert list(t) == ["Nota", "Concorda"]
+    assert list(t["Nota"].index) == ["A", "B"]
+    assert t["Nota"]["Top 2 Box (9-10) %"].tolist() == [40.0, 40.0]
+
+    # 1 a 5: Top 2 Box = 4 e 5, Bottom 2 Box = 1 e 2, sem NPS
+    linha = t["Concorda"].iloc[0]
+    assert linha["Top 2 Box (4-5) %"] == 50.0
+    assert linha["Bottom 2 Box (1-2) %"] == 40.0
+    assert np.isnan(linha["NPS"])
@@ -0,0 +1,51 @@
+# Leitura dos formatos aceitos: CSV exportado pelo Excel em português
+# (";" e latin-1) tem de dar o mesmo que o CSV padrão, e cabeçalhos que
+# só parecem tupla continuam texto.
+
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from etl_ilumeo1 import (
+    carregar_e_padronizar_dados, formato_csv, iterar_blocos, padronizar_cabecalhos,
+)
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+
+def sem_log(msg):
+    pass
+
+
+@pytest.fixture(scope="module")
+def bruto():
+    return pd.read_excel(ARQUIVO, header=[0, 1])
+
+
+@pytest.fixture(scope="module")
+def referencia(bruto):
+    return carregar_e_padronizar_dados(io.BytesIO(bruto.to_csv(index=False).encode("utf-8")), sem_log)
+
+
+@pytest.mark.parametrize("sep, encoding", [(",", "utf-8-sig"), (";", "utf-8-sig"), (";", "latin-1")])
+def test_csv_separador_e_codificacao(tmp_path, bruto, referencia, sep, encoding):
+    caminho = tmp_path / "base.csv"
+    bruto.to_csv(caminho, index=False, sep=sep, encoding=encoding, errors="replace")
+    assert formato_csv(str(caminho)) == {"sep": sep, "encoding": encoding}
+
+    df = carregar_e_padronizar_dados(str(caminho), sem_log)
+    assert list(df.columns) == list(referencia.columns)
+    assert df.shape == referencia.shape
+
+    blocos = pd.concat(list(iterar_blocos(str(caminho), 50, sem_log)))
+    assert list(blocos.columns) == list(referencia.columns)
+    assert len(blocos) == len(referencia)
+
+
+def test_cabecalho_que_nao_e_tupla():
+    assert padronizar_cabecalhos(["(1)", "1", "(a, b)", "Nota (0 a 10)"]) == ["(1)", "1", "(a, b)", "Nota (0 a 10)"]
+    assert padronizar_cabecalhos(["('Idade #idd', 'Response')"]) == padronizar_cabecalhos([("Idade #idd", "Response")])
@@ -0,0 +1,85 @@
+# Ponderação por raking: as margens ponderadas batem com as metas, e os
+# pesos (calculados antes da limpeza) continuam alinhados aos respondentes
+# depois que o filtro descarta linhas no próprio DataFrame.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl_ilumeo1 import (
+    alvos_da_proporcionalizacao, calcular_pesos_raking, carregar_e_padronizar_dados, compilar_plano,
+    encontrar_coluna_por_tag, filtrar_respondentes_validos, gerar_todas_as_tabelas, ponderar_respondentes,
+)
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+
+def sem_log(msg):
+    pass
+
+
+def margens(df, pesos, col):
+    return pd.Series(pesos, index=df.index).groupby(df[col]).sum() / np.sum(pesos)
+
+
+@pytest.fixture(scope="module")
+def bruto():
+    bruto = carregar_e_padronizar_dados(ARQUIVO, sem_log)
+    # a amostra não traz a coluna da cota: um terço dos respondentes fica
+    # fora dela, concentrado em quem respondeu o primeiro gênero
+    genero = encontrar_coluna_por_tag(bruto, "#gen")
+    fora = (bruto[genero] == bruto[genero].iloc[0]).to_numpy() & (np.arange(len(bruto)) % 3 > 0)
+    bruto[compilar_plano().coluna_filtro] = np.where(fora, "NÃO", "SIM")
+    return bruto
+
+
+def test_raking_bate_as_metas(bruto):
+    # metas atingíveis por construção: as margens de uns pesos conhecidos
+    genero = encontrar_coluna_por_tag(bruto, "#gen")
+    estado = encontrar_coluna_por_tag(bruto, "#est")
+    conhecidos = np.random.default_rng(0).uniform(0.5, 2.0, len(bruto))
+    alvos = {col: margens(bruto, conhecidos, col).to_dict() for col in (genero, estado)}
+    pesos, _, convergiu = calcular_pesos_raking(bruto, alvos)
+
+    assert convergiu
+    assert np.sum(pesos) == pytest.approx(len(bruto))
+    for col, metas in alvos.items():
+        obtidas = margens(bruto, pesos, col)
+        for categoria, meta in metas.items():
+            assert obtidas[categoria] == pytest.approx(meta, abs=1e-6)
+
+
+def test_metas_padrao_sao_as_da_cota(bruto):
+    plano = compilar_plano()
+    dentro = bruto[~bruto[plano.coluna_filtro].isin(plano.valores_removidos)]
+    alvos = alvos_da_proporcionalizacao(bruto, plano)
+    assert len(alvos) == len(plano.tags_ponderacao)
+    for col, metas in alvos.items():
+        assert metas == pytest.approx(dentro[col].value_counts(normalize=True).to_dict())
+
+    # com 116 cidades e 49 idades o raking para no limite de iterações,
+    # já perto das metas
+    pesos = ponderar_respondentes(bruto, sem_log)
+    genero = encontrar_coluna_por_tag(bruto, "#gen")
+    obtidas = margens(bruto, pesos.to_numpy(), genero)
+    for categoria, meta in alvos[genero].items():
+        assert obtidas[categoria] == pytest.approx(meta, abs=1e-3)
+
+
+def test_pesos_alinhados_depois_do_filtro(bruto):
+    df = bruto.copy()
+    pesos = ponderar_respondentes(df, sem_log)
+    filtrado = filtrar_respondentes_validos(df, sem_log)
+    assert len(filtrado) < len(bruto)
+
+    pesos_filtrados = pesos.loc[filtrado.index].to_numpy()
+    genero = encontrar_coluna_por_tag(filtrado, "#gen")
+    tabela = gerar_todas_as_tabelas(filtrado, pesos=pesos_filtrados)[0][genero]
+    esperada = margens(filtrado, pesos_filtrados, genero) * 100
+    np.testing.assert_allclose(
+        tabela["Frequência Relativa (%)"], esperada.reindex(tabela.index), atol=0.05 + 1e-9
+    )
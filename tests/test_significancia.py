@@ -0,0 +1,85 @@
+# Teste z de proporções (grupo vs. restante) com correção de
+# Benjamini-Hochberg por tabela cruzada: p-valores e sinalizações contra
+# uma base pequena calculada à mão.
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# o módulo, e não a função: o pytest coletaria testar_significancia como teste
+import analise_ilumeo as analise
+from analise_ilumeo import ajustar_benjamini_hochberg
+from etl_ilumeo1 import BaseCodificada
+
+
+def base_conhecida():
+    # A: 60 "Sim" em 100; B: 40 em 100. Na segunda pergunta A responde
+    # 50/30/20 e B 40/30/30 em x/y/z
+    seg = ["A"] * 100 + ["B"] * 100
+    q = ["Sim"] * 60 + ["Não"] * 40 + ["Sim"] * 40 + ["Não"] * 60
+    r = ["x"] * 50 + ["y"] * 30 + ["z"] * 20 + ["x"] * 40 + ["y"] * 30 + ["z"] * 30
+    return BaseCodificada.de_dataframe(pd.DataFrame({"seg": seg, "q": q, "r": r}))
+
+
+def p_bilateral(p1, p2, n1=100, n2=100):
+    p = (p1 * n1 + p2 * n2) / (n1 + n2)
+    z = (p1 - p2) / math.sqrt(p * (1 - p) * (1 / n1 + 1 / n2))
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def celula(resultado, grupo, pergunta, resposta):
+    linha = resultado[
+        (resultado["grupo"] == grupo) & (resultado["pergunta"] == pergunta) & (resultado["resposta"] == resposta)
+    ]
+    assert len(linha) == 1
+    return linha.iloc[0]
+
+
+def test_benjamini_hochberg_conhecido():
+    ajustado = ajustar_benjamini_hochberg([0.01, 0.04, 0.03, 0.005])
+    np.testing.assert_allclose(ajustado, [0.02, 0.04, 0.04, 0.02])
+    assert list(ajustado < 0.03) == [True, False, False, True]
+    assert ajustar_benjamini_hochberg([]).size == 0
+
+
+def test_teste_z_e_ajuste_por_tabela():
+    resultado = analise.testar_significancia(base_conhecida(), ["seg"], ["q", "r"])
+
+    # 60% vs 40% com 100 em cada lado: z = 2,83, p = erfc(2)
+    sim = celula(resultado, "A", "q", "Sim")
+    assert sim["z"] == pytest.approx(2 * math.sqrt(2))
+    assert sim["p_valor"] == pytest.approx(math.erfc(2))
+    assert sim["pct_grupo"] == 60.0 and sim["pct_resto"] == 40.0 and sim["diferenca_pp"] == 20.0
+    assert sim["base_grupo"] == 100
+    assert sim["significativo"] and sim["direcao"] == "acima"
+    assert celula(resultado, "B", "q", "Sim")["direcao"] == "abaixo"
+    # família de 4 células com o mesmo p: o ajuste não muda nada
+    assert resultado.loc[resultado["pergunta"] == "q", "p_ajustado"].tolist() == pytest.approx([math.erfc(2)] * 4)
+
+    # família r: 6 células com p de x, y (sem diferença) e z, duas vezes cada
+    p_x, p_z = p_bilateral(0.5, 0.4), p_bilateral(0.2, 0.3)
+    assert celula(resultado, "A", "r", "x")["p_valor"] == pytest.approx(p_x)
+    assert celula(resultado, "A", "r", "y")["p_valor"] == pytest.approx(1.0)
+    assert celula(resultado, "A", "r", "z")["p_valor"] == pytest.approx(p_z)
+    # p_z < p_x: ordenados z, z, x, x, y, y -> o ajuste de todos os x e z é
+    # min(6/2 * p_z, 6/4 * p_x)
+    esperado = min(3 * p_z, 1.5 * p_x)
+    for grupo in ("A", "B"):
+        for resposta in ("x", "z"):
+            assert celula(resultado, grupo, "r", resposta)["p_ajustado"] == pytest.approx(esperado)
+    assert not resultado.loc[resultado["pergunta"] == "r", "significativo"].any()
+
+
+def test_pesos_constantes_nao_mudam_o_teste():
+    base = base_conhecida()
+    sem_peso = analise.testar_significancia(base, ["seg"], ["q", "r"])
+    com_peso = analise.testar_significancia(base, ["seg"], ["q", "r"], pesos=np.full(len(base), 2.5))
+    pd.testing.assert_frame_equal(sem_peso, com_peso)
+
+
+def test_base_minima():
+    # grupos abaixo da base mínima ficam fora do teste
+    resultado = analise.testar_significancia(base_conhecida(), ["seg"], ["q"], min_base=150)
+    assert resultado.empty
@@ -0,0 +1,65 @@
+# Tabelas por onda com ponderação: o caminho da base codificada (índice
+# bitmap) tem de dar o mesmo que o do DataFrame, com os mesmos pesos.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl_ilumeo1 import (
+    COLUNA_ONDA, BaseCodificada, carregar_e_padronizar_dados, limpar_dados,
+    encontrar_coluna_por_tag, ponderar_respondentes, tabelas_por_onda,
+)
+
+ARQUIVO = os.path.join(
+    os.path.dirname(__file__), "..", "temp", "teste_Cópia de Fast Fashion - maio 2025 - real (1).xlsx"
+)
+
+
+def sem_log(msg):
+    pass
+
+
+def comparar(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        if isinstance(a[k], dict):
+            comparar(a[k], b[k])
+        else:
+            pd.testing.assert_frame_equal(a[k], b[k], check_exact=True)
+
+
+@pytest.fixture(scope="module")
+def base_ponderada():
+    bruto = carregar_e_padronizar_dados(ARQUIVO, sem_log)
+    bruto.insert(0, COLUNA_ONDA, np.where(np.arange(len(bruto)) < 200, "2025-04", "2025-05"))
+    # metas: gênero em partes iguais (a amostra não traz a coluna de proporcionalização)
+    genero = encontrar_coluna_por_tag(bruto, "#gen")
+    categorias = bruto[genero].dropna().unique()
+    pesos = ponderar_respondentes(bruto, sem_log, {genero: {c: 1 / len(categorias) for c in categorias}})
+    df = limpar_dados(bruto, sem_log, filtrar=False)
+    return df, pesos.loc[df.index].to_numpy()
+
+
+def test_pesos_nao_triviais(base_ponderada):
+    _, pesos = base_ponderada
+    assert not np.allclose(pesos, 1.0)
+
+
+def test_base_codificada_igual_dataframe_com_pesos(base_ponderada):
+    df, pesos = base_ponderada
+    por_dataframe = tabelas_por_onda(df, pesos)
+    por_bitmap = tabelas_por_onda(BaseCodificada.de_dataframe(df), pesos)
+
+    assert list(por_dataframe) == list(por_bitmap) == ["2025-04", "2025-05"]
+    for onda in por_dataframe:
+        for secao_df, secao_bitmap in zip(por_dataframe[onda], por_bitmap[onda]):
+            comparar(secao_df, secao_bitmap)
+
+
+def test_pesos_mudam_as_tabelas_da_onda(base_ponderada):
+    df, pesos = base_ponderada
+    ponderada = tabelas_por_onda(BaseCodificada.de_dataframe(df), pesos)["2025-04"][0]
+    sem_peso = tabelas_por_onda(BaseCodificada.de_dataframe(df))["2025-04"][0]
+    assert any(not ponderada[c].equals(sem_peso[c]) for c in ponderada)
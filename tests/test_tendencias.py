@@ -0,0 +1,90 @@
+# Tendência entre ondas: perguntas alinhadas pela #tag (a redação pode
+# mudar), questionário diferente não tem onda anterior, e as variações
+# batem com as contas feitas à mão.
+
+import math
+
+import pandas as pd
+import pytest
+
+from analise_ilumeo import comparar_ondas, empilhar_tabelas
+from etl_ilumeo1 import calcular_tendencias, impressao_questionario
+
+
+def sem_log(msg):
+    pass
+
+
+def frequencias(contagens):
+    tabela = pd.DataFrame({"Frequência Absoluta": list(contagens.values())}, index=list(contagens))
+    tabela["Frequência Relativa (%)"] = (tabela["Frequência Absoluta"] / tabela["Frequência Absoluta"].sum() * 100).round(1)
+    return tabela
+
+
+def tabelas(compra, genero, enunciado="Você comprou roupas no último mês?", extra=False):
+    t_simples = {
+        f"{enunciado} #cmp - Response": frequencias(compra),
+        "Qual é o seu gênero? #gen - Response": frequencias(genero),
+    }
+    if extra:
+        t_simples["Qual é a sua idade? #idd - Response"] = frequencias({"18-24": 50, "25+": 50})
+    return t_simples, {}, {}, {}
+
+
+ABRIL = tabelas({"Sim": 60, "Não": 40}, {"Mulher": 50, "Homem": 50})
+# mesma pergunta com outra redação; "Talvez" só existe na onda nova
+MAIO = tabelas({"Sim": 40, "Não": 50, "Talvez": 10}, {"Mulher": 52, "Homem": 48},
+               enunciado="No último mês, você COMPROU roupas?")
+
+
+def test_impressao_pela_tag():
+    assert impressao_questionario(ABRIL) == impressao_questionario(MAIO)
+    assert impressao_questionario(ABRIL) != impressao_questionario(tabelas({"Sim": 1}, {"Mulher": 1}, extra=True))
+
+
+def test_variacoes_contra_conta_feita_a_mao():
+    # #idd só existe na onda nova: fica fora da comparação
+    maio_com_idade = tabelas({"Sim": 40, "Não": 50, "Talvez": 10}, {"Mulher": 52, "Homem": 48}, extra=True)
+    resultado = comparar_ondas(empilhar_tabelas(*ABRIL, 100), empilhar_tabelas(*maio_com_idade, 100))
+    assert set(resultado["tag"]) == {"cmp", "gen"}
+    linhas = resultado.set_index(["tag", "resposta"])
+
+    # 60% -> 40% com base 100 nas duas ondas: z = -2,83, p = erfc(2)
+    sim = linhas.loc[("cmp", "Sim")]
+    assert (sim["pct_anterior"], sim["pct_atual"], sim["delta_pp"]) == (60.0, 40.0, -20.0)
+    assert sim["z"] == pytest.approx(-2 * math.sqrt(2))
+    assert sim["p_valor"] == pytest.approx(math.erfc(2))
+    assert sim["significativo"] and sim["direcao"] == "caiu"
+
+    # resposta nova conta como 0 na onda anterior
+    talvez = linhas.loc[("cmp", "Talvez")]
+    assert (talvez["pct_anterior"], talvez["pct_atual"], talvez["base_anterior"]) == (0.0, 10.0, 100)
+
+    homem = linhas.loc[("gen", "Homem")]
+    assert homem["delta_pp"] == -2.0 and not homem["significativo"]
+    assert linhas.loc[("gen", "Mulher"), "direcao"] == "subiu"
+
+
+def test_onda_anterior_so_do_mesmo_questionario(tmp_path):
+    pasta = str(tmp_path)
+    primeira = calcular_tendencias(ABRIL, 100, sem_log, pasta, "2025-04", estudo="Fashion")
+    assert primeira["onda_anterior"] is None and primeira["resultado"] is None
+
+    segunda = calcular_tendencias(MAIO, 100, sem_log, pasta, "2025-05", estudo="Fashion")
+    assert segunda["onda_anterior"] == "2025-04"
+    assert segunda["questionario"] == primeira["questionario"]
+    assert segunda["resultado"]["significativo"].any()
+
+    # pergunta nova: outra impressão, nada com o que comparar
+    diferente = tabelas({"Sim": 45, "Não": 55}, {"Mulher": 50, "Homem": 50}, extra=True)
+    terceira = calcular_tendencias(diferente, 100, sem_log, pasta, "2025-06", estudo="Fashion")
+    assert terceira["questionario"] != primeira["questionario"]
+    assert terceira["onda_anterior"] is None and terceira["resultado"] is None
+
+    # outro estudo com o mesmo questionário não herda as ondas do primeiro
+    outro = calcular_tendencias(MAIO, 100, sem_log, pasta, "2025-05", estudo="Outro")
+    assert outro["onda_anterior"] is None
+
+    # reprocessar uma onda antiga não compara com as posteriores
+    antiga = calcular_tendencias(ABRIL, 100, sem_log, pasta, "2025-03", estudo="Fashion")
+    assert antiga["onda_anterior"] is None
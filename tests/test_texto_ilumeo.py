@@ -0,0 +1,84 @@
+# Agrupamento de respostas parecidas e unificação de variantes de escrita:
+# a opção do questionário é o nome canônico do grupo e nunca é reescrita,
+# mesmo quando a resposta digitada é mais frequente que ela.
+
+import pandas as pd
+
+from texto_ilumeo import mapear_quase_duplicados, opcoes_fechadas, unificar_variantes
+
+COLUNA = "Em qual cidade você mora? #cid - Response"
+
+CIDADES = pd.Series({
+    "São Paulo (SP)": 44,
+    "Sao Paulo": 37,
+    "rio de Janeiro": 30,
+    "Rio de Janeiro (RJ)": 24,
+    "Belo Horizonte (MG)": 21,
+    "Salvador (BA)": 19,
+    "curitiba pr": 15,
+    "Curitiba (PR)": 13,
+    "Campinas (SP)": 11,
+    "Natal (RN)": 4,
+})
+
+
+def mapa(frequencias, mapa_revisado=None):
+    tabela = mapear_quase_duplicados(frequencias, COLUNA, mapa_revisado)
+    return dict(zip(tabela["original"], tabela["canonico"]))
+
+
+def test_opcoes_pelo_formato_da_lista():
+    # as opções abaixo de 5% ("Natal (RN)") também são opções
+    assert opcoes_fechadas(CIDADES) == {v for v in CIDADES.index if v.endswith(")")}
+
+
+def test_digitada_vai_para_a_opcao():
+    m = mapa(CIDADES)
+    assert m["Sao Paulo"] == "São Paulo (SP)"
+    assert m["rio de Janeiro"] == "Rio de Janeiro (RJ)"
+    assert m["curitiba pr"] == "Curitiba (PR)"
+
+
+def test_opcao_nunca_e_reescrita():
+    m = mapa(CIDADES)
+    for opcao in opcoes_fechadas(CIDADES):
+        assert m[opcao] == opcao
+
+    # nem quando um mapa revisado antigo mandava a opção para outro nome
+    revisado = pd.DataFrame({
+        "original": ["Rio de Janeiro (RJ)", "rio de Janeiro"],
+        "canonico": ["rio de Janeiro", "rio de Janeiro"],
+    })
+    m = mapa(CIDADES, revisado)
+    assert m["Rio de Janeiro (RJ)"] == "Rio de Janeiro (RJ)"
+    assert m["rio de Janeiro"] == "rio de Janeiro"
+
+
+def test_sem_formato_vale_a_frequencia():
+    respostas = pd.Series({"Sim": 60, "Não": 35, "sim.": 3, "nao": 2})
+    assert opcoes_fechadas(respostas) == {"Sim", "Não"}
+    m = mapa(respostas)
+    assert m["sim."] == "Sim" and m["Sim"] == "Sim"
+
+
+def test_variantes_so_de_caixa_acento_e_plural():
+    serie = pd.Series(
+        ["mais"] * 3 + ["mal"] * 2 + ["pais"] * 2 + ["pal"] + ["reais"] * 2 + ["real"]
+        + ["Propagandas "] + ["propaganda"] * 2 + ["PROMOÇÕES"] + ["promoção"] * 3
+    )
+    unificada, n = unificar_variantes(serie)
+    assert n == 2
+    assert set(unificada) == {"mais", "mal", "pais", "pal", "reais", "real", "propaganda", "promoção"}
+
+
+def test_variante_nao_reescreve_opcao():
+    # duas opções com a mesma chave continuam separadas
+    serie = pd.Series(["Lojas físicas #lf"] * 2 + ["Loja física #lf"] * 3 + ["Outro"] * 95)
+    unificada, n = unificar_variantes(serie)
+    assert n == 0
+    assert unificada.equals(serie)
+
+    serie = pd.Series(["Sim"] * 60 + ["Não"] * 36 + ["sim"] * 3 + ["NÃO"])
+    unificada, n = unificar_variantes(serie)
+    assert n == 2
+    assert unificada.value_counts().to_dict() == {"Sim": 63, "Não": 37}
@@ -0,0 +1,313 @@
+# ============================================================
+#  ILUMEO - NORMALIZAÇÃO E CONTAGEM DE TEXTO ABERTO
+#  Variantes de escrita unificadas e termos mais citados
+# ============================================================
+
+import re
+import unicodedata
+import zlib
+from difflib import SequenceMatcher
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# 1. NORMALIZAÇÃO (CAIXA, ACENTOS, ESPAÇOS E RADICAIS PT-BR)
+# ------------------------------------------------------------
+
+STOPWORDS = frozenset(
+    "a o e as os um uma uns umas de da do das dos em na no nas nos para pra por pela pelo "
+    "com sem que se ao aos ou mas mais muito ja nao sim eu me meu minha voce ele ela isso "
+    "essa esse esta este la tem ter sao foi era ser".split()
+)
+
+# plural e formas flexionadas mais comuns (versão enxuta do RSLP)
+_SUFIXOS_PLURAL = [
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"),
+    ("ns", "m"), ("res", "r"), ("les", "l"), ("zes", "z"),
+]
+
+
+# só as regras de plural que não caem em outra palavra: "-ais", "-eis" e
+# "-ois" ficam de fora ("reais" não é "real", "mais" não é "mal")
+_PLURAIS_SEGUROS = [("oes", "ao"), ("aes", "ao"), ("ns", "m"), ("res", "r"), ("zes", "z")]
+
+
+def dobrar_texto(texto):
+    # minúsculas, sem acentos, pontuação vira espaço e espaços colapsados
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w&]+", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def radical(palavra):
+    if len(palavra) <= 3 or not palavra.isalpha():
+        return palavra
+    for sufixo, troca in _SUFIXOS_PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 2:
+            return palavra[:-len(sufixo)] + troca
+    if palavra.endswith("s") and not palavra.endswith("ss"):
+        return palavra[:-1]
+    return palavra
+
+
+def singular(palavra, min_letras=5):
+    # só flexão de número: palavras curtas ("mais", "pais") ficam como estão
+    if len(palavra) < min_letras or not palavra.isalpha():
+        return palavra
+    for sufixo, troca in _PLURAIS_SEGUROS:
+        if palavra.endswith(sufixo):
+            return palavra[:-len(sufixo)] + troca
+    if palavra.endswith("s") and not palavra.endswith("ss"):
+        return palavra[:-1]
+    return palavra
+
+
+@lru_cache(maxsize=None)
+def chave_texto(texto):
+    # forma canônica usada para juntar variantes: mesma escrita a menos de
+    # caixa, acentos, pontuação e plural ("Propagandas " == "propaganda")
+    return " ".join(singular(p) for p in dobrar_texto(texto).split())
+
+
+def unificar_variantes(serie):
+    # normaliza uma vez por valor distinto; cada grupo de variantes passa a
+    # usar a opção fechada do grupo ou, sem ela, a escrita mais frequente
+    # (empate: a que apareceu primeiro). Opção fechada nunca é reescrita.
+    codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+    if len(valores) < 2:
+        return serie, 0
+
+    chaves = pd.Index([chave_texto(v) for v in valores])
+    contagem = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+    grupo, _ = pd.factorize(chaves)
+    if grupo.max() + 1 == len(valores):
+        return serie, 0
+
+    fechadas = opcoes_fechadas(pd.Series(contagem, index=valores))
+    fechada = np.array([v in fechadas for v in valores], dtype=bool)
+    ordem = np.lexsort((np.arange(len(valores)), -contagem, ~fechada, grupo))
+    primeiro = np.ones(len(ordem), dtype=bool)
+    primeiro[1:] = grupo[ordem][1:] != grupo[ordem][:-1]
+    canonico_do_grupo = np.empty(grupo.max() + 1, dtype=np.int64)
+    canonico_do_grupo[grupo[ordem][primeiro]] = ordem[primeiro]
+
+    destino = np.where(fechada, np.arange(len(valores)), canonico_do_grupo[grupo])
+    tabela = np.empty(len(valores) + 1, dtype=object)
+    tabela[:-1] = np.asarray(valores, dtype=object)[destino]
+    tabela[-1] = np.nan
+    unificada = pd.Series(tabela[codigos], index=serie.index, name=serie.name)
+    return unificada, int((destino != np.arange(len(valores))).sum())
+
+
+# ------------------------------------------------------------
+# 2. CONTAGEM DE TERMOS E N-GRAMAS (HASHING)
+# ------------------------------------------------------------
+
+def termos_do_texto(texto, ngramas=(1, 2)):
+    palavras = dobrar_texto(texto).split()
+    radicais = [radical(p) for p in palavras]
+    termos = []
+    for n in ngramas:
+        for i in range(len(palavras) - n + 1):
+            if palavras[i] in STOPWORDS or palavras[i + n - 1] in STOPWORDS:
+                continue
+            termos.append((" ".join(radicais[i:i + n]), " ".join(palavras[i:i + n])))
+    return termos
+
+
+def contar_termos(valores, frequencias, top=10, ngramas=(1, 2), n_baldes=2 ** 20):
+    # cada valor distinto é quebrado uma vez; os termos viram índices de
+    # hash e as contagens (ponderadas pela frequência do valor) saem de
+    # um único bincount. A escrita exibida é a variante mais citada.
+    indices, pesos = [], []
+    escritas = defaultdict(lambda: defaultdict(float))
+
+    for valor, freq in zip(valores, frequencias):
+        if pd.isna(valor) or freq <= 0:
+            continue
+        for chave, escrita in termos_do_texto(valor, ngramas):
+            balde = zlib.crc32(chave.encode("utf-8")) % n_baldes
+            indices.append(balde)
+            pesos.append(freq)
+            escritas[balde][escrita] += freq
+
+    if not indices:
+        return pd.DataFrame(columns=["termo", "frequencia"])
+
+    contagem = np.bincount(np.array(indices), weights=np.array(pesos, dtype=float), minlength=n_baldes)
+    baldes = np.flatnonzero(contagem)
+    baldes = baldes[np.lexsort((baldes, -contagem[baldes]))][:top]
+
+    return pd.DataFrame({
+        "termo": [max(escritas[b].items(), key=lambda kv: kv[1])[0] for b in baldes],
+        "frequencia": contagem[baldes].round(1),
+    })
+
+
+# ------------------------------------------------------------
+# 3. AGRUPAMENTO DE QUASE-DUPLICATAS (MINHASH + LSH)
+# ------------------------------------------------------------
+
+_PRIMO = (1 << 31) - 1
+
+
+def shingles(texto, k=3):
+    t = f" {chave_texto(texto)} "
+    return {t[i:i + k] for i in range(max(len(t) - k + 1, 1))}
+
+
+def assinaturas_minhash(textos, n_perm=64, seed=42, shingles_por_lote=200_000):
+    # uma linha de assinatura por texto; o mínimo de cada permutação sai
+    # de um reduceat sobre todos os shingles de um lote de textos
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIMO, n_perm, dtype=np.uint64)[:, None]
+    b = rng.integers(0, _PRIMO, n_perm, dtype=np.uint64)[:, None]
+
+    conjuntos = [
+        np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIMO for s in shingles(t)), dtype=np.uint64)
+        for t in textos
+    ]
+    assinaturas = np.empty((len(textos), n_perm), dtype=np.uint64)
+
+    inicio = 0
+    while inicio < len(conjuntos):
+        fim, total = inicio, 0
+        while fim < len(conjuntos) and (fim == inicio or total + len(conjuntos[fim]) <= shingles_por_lote):
+            total += len(conjuntos[fim])
+            fim += 1
+        ids = np.concatenate(conjuntos[inicio:fim])
+        tamanhos = np.array([len(c) for c in conjuntos[inicio:fim]])
+        comecos = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+        hashes = (a * ids[None, :] + b) % _PRIMO
+        assinaturas[inicio:fim] = np.minimum.reduceat(hashes, comecos, axis=1).T
+        inicio = fim
+
+    return assinaturas
+
+
+_NEGACOES = frozenset("nao nem nunca nenhum nenhuma nada sem jamais".split())
+_PREFIXOS_NEGACAO = ("in", "im", "ir", "des", "nao")
+_TAG_OPCAO = re.compile(r"#\w+")
+
+
+def _compativeis(chave_a, chave_b):
+    # "Opção 1" x "Opção 2", "3 vezes" x "1 vez": números diferentes nunca
+    # se juntam; nem "completo" x "incompleto" ou "Nenhum" x "Nenhuma"
+    a, b = chave_a.split(), chave_b.split()
+    if [t for t in a if any(c.isdigit() for c in t)] != [t for t in b if any(c.isdigit() for c in t)]:
+        return False
+    if sorted(t for t in a if t in _NEGACOES) != sorted(t for t in b if t in _NEGACOES):
+        return False
+    so_a, so_b = set(a) - set(b), set(b) - set(a)
+    for x in so_a:
+        for y in so_b:
+            curto, longo = sorted((x, y), key=len)
+            if any(longo == p + curto for p in _PREFIXOS_NEGACAO):
+                return False
+    return True
+
+
+def _raiz(pais, i):
+    while pais[i] != i:
+        pais[i] = pais[pais[i]]
+        i = pais[i]
+    return i
+
+
+def grupos_quase_duplicados(textos, limiar=0.5, similaridade_minima=0.85, n_perm=64,
+                            linhas_por_banda=4, seed=42):
+    # LSH: textos que coincidem em alguma banda da assinatura viram
+    # candidatos; só se juntam se a similaridade estimada passar do limiar,
+    # as formas normalizadas forem quase iguais ("Rio Grande do Norte"
+    # não vira "Rio Grande do Sul") e nenhum número ou negação mudar
+    n = len(textos)
+    pais = list(range(n))
+    if n < 2:
+        return np.array(pais)
+
+    assinaturas = assinaturas_minhash(textos, n_perm, seed)
+    chaves = [chave_texto(t) for t in textos]
+    for inicio in range(0, n_perm, linhas_por_banda):
+        banda = np.ascontiguousarray(assinaturas[:, inicio:inicio + linhas_por_banda])
+        _, balde = np.unique(banda.view(np.dtype((np.void, banda.dtype.itemsize * banda.shape[1]))),
+                             return_inverse=True)
+        balde = balde.ravel()
+        ordem = np.argsort(balde, kind="stable")
+        mesmo = balde[ordem][1:] == balde[ordem][:-1]
+        lider = ordem[:-1][mesmo]
+        membro = ordem[1:][mesmo]
+        for i, j in zip(lider.tolist(), membro.tolist()):
+            ri, rj = _raiz(pais, i), _raiz(pais, j)
+            if (
+                ri != rj
+                and (assinaturas[i] == assinaturas[j]).mean() >= limiar
+                and SequenceMatcher(None, chaves[i], chaves[j]).ratio() >= similaridade_minima
+                and _compativeis(chaves[i], chaves[j])
+            ):
+                pais[max(ri, rj)] = min(ri, rj)
+
+    return np.array([_raiz(pais, i) for i in range(n)])
+
+
+def _e_texto_livre(valor):
+    return isinstance(valor, str) and any(c.isalpha() for c in valor)
+
+
+_SUFIXO_OPCAO = re.compile(r"\s\([^()]+\)\s*$")
+
+
+def opcoes_fechadas(frequencias, frequencia_opcao=0.05, min_opcao=5, fatia_formato=0.5):
+    # opções do questionário: têm #tag ou seguem o formato da lista da
+    # pergunta ("São Paulo (SP)", quando a maior parte das respostas traz o
+    # código entre parênteses). Sem formato reconhecível, vale a frequência:
+    # escolhida por uma fatia relevante da base. O resto é resposta digitada.
+    total = float(frequencias.sum())
+    textos = [(v, f) for v, f in frequencias.items() if isinstance(v, str)]
+    com_formato = sum(f for v, f in textos if _SUFIXO_OPCAO.search(v))
+    if total and com_formato >= fatia_formato * total:
+        return {v for v, _ in textos if _TAG_OPCAO.search(v) or _SUFIXO_OPCAO.search(v)}
+    return {
+        v for v, f in textos
+        if _TAG_OPCAO.search(v) or (f >= min_opcao and f >= frequencia_opcao * total)
+    }
+
+
+def mapear_quase_duplicados(frequencias, coluna, mapa_revisado=None, similaridade_minima=0.85,
+                            frequencia_opcao=0.05):
+    # frequencias: Series valor -> contagem. Devolve a tabela revisável
+    # coluna | original | canonico | frequencia. O que já está no mapa
+    # revisado é mantido; os valores novos entram no grupo (e no nome
+    # canônico) dos parecidos com eles. Opção fechada nunca é reescrita e,
+    # se estiver no grupo, é o nome canônico dele.
+    fechadas = opcoes_fechadas(frequencias, frequencia_opcao)
+    valores = [v for v in frequencias.index if _e_texto_livre(v)]
+    revisado = {} if mapa_revisado is None else dict(zip(mapa_revisado["original"], mapa_revisado["canonico"]))
+    if not valores:
+        return pd.DataFrame(columns=["coluna", "original", "canonico", "frequencia"])
+
+    grupo = grupos_quase_duplicados(valores, similaridade_minima=similaridade_minima)
+    freq = frequencias.reindex(valores).to_numpy()
+    ordem = np.argsort(grupo, kind="stable")
+    linhas = []
+    for membros in np.split(ordem, np.flatnonzero(np.diff(grupo[ordem])) + 1):
+        opcoes = [i for i in membros if valores[i] in fechadas]
+        ja_revisados = [i for i in membros if valores[i] in revisado and valores[i] not in fechadas]
+        if opcoes:
+            canonico = valores[max(opcoes, key=lambda i: (freq[i], -i))]
+        elif ja_revisados:
+            referencia = max(ja_revisados, key=lambda i: freq[i])
+            canonico = revisado[valores[referencia]]
+        else:
+            canonico = valores[max(membros, key=lambda i: (freq[i], -i))]
+        for i in membros:
+            if valores[i] in fechadas:
+                destino = valores[i]
+            else:
+                destino = revisado.get(valores[i], canonico)
+            linhas.append((coluna, valores[i], destino, int(freq[i])))
+
+    return pd.DataFrame(linhas, columns=["coluna", "original", "canonico", "frequencia"])